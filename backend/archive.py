@@ -0,0 +1,186 @@
+"""Moves finished bookings out of the hot `bookings` collection.
+
+Completed, rejected and cancelled bookings older than ARCHIVE_AFTER_DAYS
+are copied to `bookings_archive` in batches and then deleted from
+`bookings`. `booking_archive_stats` keeps per-provider and overall counts
+of what was archived, so analytics can add them to live counts without
+scanning the archive. Earnings come from the provider_earnings ledger and
+are not affected.
+
+    python archive.py [--days N] [--batch-size N] [--rebuild-stats]
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import ReplaceOne, UpdateOne
+
+from pagination import after_cursor, page_of
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+ARCHIVABLE_STATUSES = ["completed", "rejected", "cancelled"]
+
+# Stats document holding overall counts and the archive watermark.
+ALL = "_all"
+
+
+def _stats_updates(bookings: list) -> list:
+    per_doc = {}
+    for booking in bookings:
+        for key in (ALL, booking.get("provider_id")):
+            if key is None:
+                continue
+            inc = per_doc.setdefault(key, {"total": 0})
+            inc["total"] += 1
+            inc[f"counts.{booking['status']}"] = inc.get(f"counts.{booking['status']}", 0) + 1
+            if booking["status"] == "completed":
+                inc["revenue"] = inc.get("revenue", 0) + booking.get("commission", 0)
+    return [UpdateOne({"_id": key}, {"$inc": inc}, upsert=True) for key, inc in per_doc.items()]
+
+
+async def archive_bookings(
+    database, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE
+) -> dict:
+    """Archives finished bookings created before the cutoff; returns how many moved."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    query = {"status": {"$in": ARCHIVABLE_STATUSES}, "created_at": {"$lt": cutoff}}
+    # Raise the watermark before moving anything: reads that reach past it
+    # consult the archive too, so no booking is ever invisible mid-run.
+    await database.booking_archive_stats.update_one(
+        {"_id": ALL}, {"$max": {"archived_before": cutoff}}, upsert=True
+    )
+    archived = 0
+    while True:
+        batch = await database.bookings.find(query, {"_id": 0}).sort("created_at", 1).to_list(batch_size)
+        if not batch:
+            break
+        ids = [b["id"] for b in batch]
+        # Copy first, then delete: a crash in between leaves the booking in
+        # both places, and the next run re-copies it idempotently.
+        await database.bookings_archive.bulk_write(
+            [ReplaceOne({"id": b["id"]}, b, upsert=True) for b in batch], ordered=False
+        )
+        result = await database.bookings.delete_many({"id": {"$in": ids}, "status": {"$in": ARCHIVABLE_STATUSES}})
+        if result.deleted_count < len(batch):
+            # A booking changed status after we read it; it stays hot.
+            kept = await database.bookings.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(len(ids))
+            kept_ids = [b["id"] for b in kept]
+            await database.bookings_archive.delete_many({"id": {"$in": kept_ids}})
+            batch = [b for b in batch if b["id"] not in set(kept_ids)]
+        if batch:
+            await database.booking_archive_stats.bulk_write(_stats_updates(batch), ordered=False)
+        archived += len(batch)
+
+    if not await stats_consistent(database):
+        logger.warning("Archive stats drifted (interrupted run?); rebuilding")
+        await rebuild_stats(database)
+    return {"archived": archived, "cutoff": cutoff}
+
+
+async def stats_consistent(database) -> bool:
+    overall = await database.booking_archive_stats.find_one({"_id": ALL}, {"total": 1})
+    recorded = overall.get("total", 0) if overall else 0
+    return recorded == await database.bookings_archive.estimated_document_count()
+
+
+async def rebuild_stats(database) -> int:
+    """Recomputes booking_archive_stats from the archive itself."""
+    overall = await database.booking_archive_stats.find_one({"_id": ALL}, {"archived_before": 1})
+    await database.booking_archive_stats.delete_many({})
+    pipeline = [
+        {"$group": {
+            "_id": {"provider_id": "$provider_id", "status": "$status"},
+            "count": {"$sum": 1},
+            "commission": {"$sum": "$commission"}
+        }}
+    ]
+    docs = {ALL: {"_id": ALL, "total": 0, "counts": {}, "revenue": 0}}
+    async for row in database.bookings_archive.aggregate(pipeline):
+        status = row["_id"]["status"]
+        for key in (ALL, row["_id"].get("provider_id")):
+            if key is None:
+                continue
+            doc = docs.setdefault(key, {"_id": key, "total": 0, "counts": {}, "revenue": 0})
+            doc["total"] += row["count"]
+            doc["counts"][status] = doc["counts"].get(status, 0) + row["count"]
+            if status == "completed":
+                doc["revenue"] += row["commission"]
+    if overall and overall.get("archived_before"):
+        docs[ALL]["archived_before"] = overall["archived_before"]
+    await database.booking_archive_stats.insert_many(list(docs.values()))
+    return docs[ALL]["total"]
+
+
+async def archived_stats(database, provider_id: Optional[str] = None) -> dict:
+    doc = await database.booking_archive_stats.find_one({"_id": provider_id or ALL}, {"_id": 0})
+    doc = doc or {}
+    return {
+        "total": doc.get("total", 0),
+        "counts": doc.get("counts", {}),
+        "revenue": doc.get("revenue", 0),
+        "archived_before": doc.get("archived_before"),
+    }
+
+
+async def archived_before(database) -> Optional[str]:
+    doc = await database.booking_archive_stats.find_one({"_id": ALL}, {"archived_before": 1})
+    return doc.get("archived_before") if doc else None
+
+
+async def find_booking(database, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+    """Looks a booking up in the hot collection, then in the archive."""
+    projection = projection or {"_id": 0}
+    booking = await database.bookings.find_one(query, projection)
+    if booking is None:
+        booking = await database.bookings_archive.find_one(query, projection)
+    return booking
+
+
+async def find_page(database, query: dict, limit: int, cursor: Optional[str] = None) -> dict:
+    """One page of bookings in (created_at desc, id desc) order across hot and archive.
+
+    The archive is only read once the page reaches past the archive
+    watermark, so recent pages cost a single query on the hot collection.
+    """
+    page_query = {**query, **after_cursor(cursor)}
+    sort = [("created_at", -1), ("id", -1)]
+    hot = await database.bookings.find(page_query, {"_id": 0}).sort(sort).to_list(limit + 1)
+    watermark = await archived_before(database)
+    if watermark is None or (len(hot) > limit and hot[limit]["created_at"] >= watermark):
+        return page_of(hot, limit)
+
+    cold = await database.bookings_archive.find(page_query, {"_id": 0}).sort(sort).to_list(limit + 1)
+    # A booking caught mid-archival can briefly exist in both; keep one.
+    merged = {b["id"]: b for b in cold}
+    merged.update({b["id"]: b for b in hot})
+    docs = sorted(merged.values(), key=lambda b: (b["created_at"], b["id"]), reverse=True)
+    return page_of(docs, limit)
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Archive finished bookings")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--rebuild-stats", action="store_true")
+    args = parser.parse_args()
+
+    from database import db, ensure_indexes, close_clients
+    try:
+        await ensure_indexes()
+        if args.rebuild_stats:
+            print({"archived_total": await rebuild_stats(db)})
+        else:
+            print(await archive_bookings(db, args.days, args.batch_size))
+    finally:
+        close_clients()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
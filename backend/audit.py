@@ -0,0 +1,202 @@
+"""Write-behind audit log of logins, bookings, status changes and admin actions.
+
+Handlers call `audit_log.record(...)`, which only appends to an in-memory
+buffer; a background task writes the buffer to `audit_log` with
+insert_many, every AUDIT_FLUSH_INTERVAL_SECONDS or as soon as a batch is
+full, and once more on shutdown. When Mongo falls behind and the buffer
+is full, AUDIT_OVERFLOW_POLICY decides what gives:
+
+    drop_oldest   keep the newest events (default)
+    drop_newest   keep what is already buffered
+    log           write the overflowing event to the application log instead
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo.errors import BulkWriteError
+
+from pagination import after_cursor, page_of
+
+logger = logging.getLogger(__name__)
+
+AUDIT_COLLECTION = "audit_log"
+AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', 10000))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('AUDIT_FLUSH_INTERVAL_SECONDS', 1))
+AUDIT_OVERFLOW_POLICY = os.environ.get('AUDIT_OVERFLOW_POLICY', 'drop_oldest')
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "log")
+# Wait before retrying after a failed flush, doubling up to the maximum.
+RETRY_BACKOFF_SECONDS = 1
+RETRY_BACKOFF_MAX_SECONDS = 30
+
+DUPLICATE_KEY = 11000
+
+
+class AuditLog:
+    def __init__(
+        self,
+        max_buffer: int = AUDIT_BUFFER_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL_SECONDS,
+        overflow_policy: str = AUDIT_OVERFLOW_POLICY
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"AUDIT_OVERFLOW_POLICY must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self._buffer = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.database = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def record(
+        self,
+        action: str,
+        actor: Optional[dict] = None,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        **data
+    ):
+        """Queues one event; never waits on the database."""
+        event = {
+            "id": str(uuid.uuid4()),
+            "action": action,
+            "actor_id": actor.get("id") if actor else None,
+            "actor_role": actor.get("role") if actor else None,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "data": data,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            if self.overflow_policy == "drop_newest":
+                return
+            if self.overflow_policy == "log":
+                logger.warning("Audit buffer full, event not stored: %s", json.dumps(event, default=str))
+                return
+            self._buffer.popleft()
+        self._buffer.append(event)
+        if self._wake is not None and len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def start(self, database):
+        self.database = database
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Could not write %d audit events on shutdown", len(self._buffer))
+
+    async def flush(self) -> int:
+        """Writes everything buffered so far, a batch at a time."""
+        if self.database is None:
+            return 0
+        written = 0
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                try:
+                    await self.database[AUDIT_COLLECTION].insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    # Duplicates are events a failed flush already wrote.
+                    failed = {err["index"] for err in e.details["writeErrors"] if err.get("code") != DUPLICATE_KEY}
+                    self._requeue([event for i, event in enumerate(batch) if i in failed])
+                    written += len(batch) - len(failed)
+                    if failed:
+                        raise
+                except Exception:
+                    self._requeue(batch)
+                    raise
+                else:
+                    written += len(batch)
+        self.written += written
+        return written
+
+    def _requeue(self, events: list):
+        # Back to the front, in order, so they go out first next time.
+        self._buffer.extendleft(reversed(events))
+
+    async def _flush_loop(self):
+        backoff = RETRY_BACKOFF_SECONDS
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+                backoff = RETRY_BACKOFF_SECONDS
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.warning("Audit flush failed (%d events buffered): %s", len(self._buffer), e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RETRY_BACKOFF_MAX_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "overflow_policy": self.overflow_policy,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+async def find_events(
+    database,
+    actor_id: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    action: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+) -> dict:
+    """One page of events, newest first."""
+    query = {}
+    if actor_id:
+        query["actor_id"] = actor_id
+    if entity_type:
+        query["entity_type"] = entity_type
+    if entity_id:
+        query["entity_id"] = entity_id
+    if action:
+        query["action"] = action
+    created_at = {}
+    if since:
+        created_at["$gte"] = since
+    if until:
+        created_at["$lt"] = until
+    if created_at:
+        query["created_at"] = created_at
+    query.update(after_cursor(cursor))
+    docs = await database[AUDIT_COLLECTION].find(query, {"_id": 0}).sort(
+        [("created_at", -1), ("id", -1)]
+    ).to_list(limit + 1)
+    return page_of(docs, limit)
+
+
+audit_log = AuditLog()
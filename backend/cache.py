@@ -0,0 +1,181 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from http_cache import rendered
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 5000))
+
+# Seconds each public read may be served from cache. Writes that change the
+# underlying data invalidate the affected keys, so the TTL only bounds how
+# stale another worker's memory cache can get.
+CACHE_TTLS = {
+    "catalog": int(os.environ.get('CACHE_TTL_CATALOG', 300)),
+    "providers:list": int(os.environ.get('CACHE_TTL_PROVIDER_LIST', 30)),
+    "providers:detail": int(os.environ.get('CACHE_TTL_PROVIDER_DETAIL', 60)),
+    # Reports are keyed on the snapshot they were computed from, so a new
+    # snapshot is read fresh; the TTL only lets superseded entries expire.
+    "reports": int(os.environ.get('CACHE_TTL_REPORTS', 3600)),
+}
+
+MISS = object()
+
+
+def cache_key(route: str, **params) -> str:
+    """Builds a key from a route namespace and its query params.
+
+    Unset params are dropped and the rest sorted, so equivalent requests
+    share one entry regardless of param order.
+    """
+    parts = [f"{k}={params[k]}" for k in sorted(params) if params[k] not in (None, "")]
+    return f"{route}?{'&'.join(parts)}" if parts else route
+
+
+class MemoryBackend:
+    """Per-process LRU with expiry."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISS
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return MISS
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: int):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class MongoBackend:
+    """Shared cache in a TTL-indexed collection, visible to every worker."""
+
+    def __init__(self, database, collection: str = "response_cache"):
+        self.collection = database[collection]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key: str):
+        doc = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"value": 1}
+        )
+        return doc["value"] if doc else MISS
+
+    async def set(self, key: str, value, ttl: int):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        await self.collection.replace_one(
+            {"_id": key}, {"_id": key, "value": value, "expires_at": expires_at}, upsert=True
+        )
+
+    async def delete_prefix(self, prefix: str):
+        await self.collection.delete_many({"_id": {"$regex": f"^{re.escape(prefix)}"}})
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._inflight = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_load(self, key: str, ttl: int, loader: Callable[[], Awaitable[Any]]):
+        value = await self.backend.get(key)
+        if value is not MISS:
+            self.hits += 1
+            return value
+
+        # Concurrent misses on one key share a single load.
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await loader()
+            # An invalidation while we were loading means the value may
+            # predate the write, so hand it to waiters but do not store it.
+            if generation == self._generation:
+                await self.backend.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def get_or_render(self, key: str, ttl: int, loader: Callable[[], Awaitable[Any]]):
+        """Like get_or_load, but caches the serialized body and its ETag.
+
+        Hits then cost no serialization at all; the bytes go straight out.
+        """
+        async def load_rendered():
+            return rendered(await loader())
+
+        return await self.get_or_load(key, ttl, load_rendered)
+
+    async def invalidate(self, *prefixes: str):
+        self._generation += 1
+        for prefix in prefixes:
+            await self.backend.delete_prefix(prefix)
+
+    async def clear(self):
+        self._generation += 1
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+
+def build_cache(database=None) -> ResponseCache:
+    if CACHE_BACKEND == "mongo":
+        return ResponseCache(MongoBackend(database))
+    return ResponseCache(MemoryBackend())
+
+
+# Invalidation namespaces.
+def provider_detail_prefix(provider_id: Optional[str] = None) -> str:
+    return f"providers:detail:{provider_id}" if provider_id else "providers:detail:"
+
+
+PROVIDER_LIST_PREFIX = "providers:list"
+CATALOG_PREFIX = "catalog:"
+REPORTS_PREFIX = "reports:"
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Provider documents carry category_name and sub_service_name copied from
+# the catalog; renames and deletes are pushed out in batches of this size.
+FAN_OUT_BATCH_SIZE = int(os.environ.get('CATALOG_FAN_OUT_BATCH_SIZE', 1000))
+
+# Seconds before a worker reloads the catalog on its own. Admin edits made
+# through another worker become visible here within this window.
+CATALOG_TTL_SECONDS = int(os.environ.get('CATALOG_TTL_SECONDS', 60))
+
+CITIES_DATA = {
+    "cities": [
+        {"id": "delhi", "name": "Delhi", "state": "Delhi"},
+        {"id": "mumbai", "name": "Mumbai", "state": "Maharashtra"},
+        {"id": "bangalore", "name": "Bangalore", "state": "Karnataka"},
+        {"id": "chennai", "name": "Chennai", "state": "Tamil Nadu"},
+        {"id": "kolkata", "name": "Kolkata", "state": "West Bengal"},
+        {"id": "hyderabad", "name": "Hyderabad", "state": "Telangana"},
+        {"id": "pune", "name": "Pune", "state": "Maharashtra"},
+        {"id": "ahmedabad", "name": "Ahmedabad", "state": "Gujarat"},
+        {"id": "jaipur", "name": "Jaipur", "state": "Rajasthan"},
+        {"id": "lucknow", "name": "Lucknow", "state": "Uttar Pradesh"}
+    ],
+    "villages": [
+        {"id": "himatnagar", "name": "Himatnagar", "state": "Gujarat"},
+        {"id": "mehsana", "name": "Mehsana", "state": "Gujarat"},
+        {"id": "palanpur", "name": "Palanpur", "state": "Gujarat"},
+        {"id": "nadiad", "name": "Nadiad", "state": "Gujarat"},
+        {"id": "anand", "name": "Anand", "state": "Gujarat"},
+        {"id": "junagadh", "name": "Junagadh", "state": "Gujarat"},
+        {"id": "porbandar", "name": "Porbandar", "state": "Gujarat"},
+        {"id": "gandhidham", "name": "Gandhidham", "state": "Gujarat"},
+        {"id": "bhuj", "name": "Bhuj", "state": "Gujarat"},
+        {"id": "morbi", "name": "Morbi", "state": "Gujarat"}
+    ]
+}
+
+
+class Catalog:
+    """In-process copy of service categories and sub-services.
+
+    The catalog is tiny and changes rarely, so each worker keeps it in memory
+    and reloads it after CATALOG_TTL_SECONDS or when an admin edit invalidates it.
+    """
+
+    def __init__(self, ttl_seconds: int = CATALOG_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.categories = {}
+        self.sub_services = {}
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at > self.ttl_seconds
+
+    async def load(self, database):
+        categories = await database.service_categories.find({}, {"_id": 0}).to_list(None)
+        sub_services = await database.sub_services.find({}, {"_id": 0}).to_list(None)
+        self.categories = {c["id"]: c for c in categories}
+        self.sub_services = {s["id"]: s for s in sub_services}
+        self.loaded_at = time.monotonic()
+
+    async def ensure_fresh(self, database):
+        if not self.is_stale:
+            return
+        async with self._lock:
+            if self.is_stale:
+                await self.load(database)
+
+    def invalidate(self):
+        self.loaded_at = 0.0
+
+    async def get_category(self, database, category_id: str) -> Optional[dict]:
+        await self.ensure_fresh(database)
+        category = self.categories.get(category_id)
+        if category is None:
+            # Created through another worker since our last load.
+            category = await database.service_categories.find_one({"id": category_id}, {"_id": 0})
+            if category:
+                self.categories[category_id] = category
+        return category
+
+    async def get_sub_service(self, database, sub_service_id: str) -> Optional[dict]:
+        await self.ensure_fresh(database)
+        sub_service = self.sub_services.get(sub_service_id)
+        if sub_service is None:
+            sub_service = await database.sub_services.find_one({"id": sub_service_id}, {"_id": 0})
+            if sub_service:
+                self.sub_services[sub_service_id] = sub_service
+        return sub_service
+
+    async def category_name(self, database, category_id: str) -> Optional[str]:
+        category = await self.get_category(database, category_id)
+        return category["name"] if category else None
+
+    async def sub_service_name(self, database, sub_service_id: str) -> Optional[str]:
+        sub_service = await self.get_sub_service(database, sub_service_id)
+        return sub_service["name"] if sub_service else None
+
+
+catalog = Catalog()
+
+
+# ============ PROVIDER NAME DENORMALIZATION ============
+
+async def fan_out_name(database, id_field: str, id_value: str, name_field: str, name: Optional[str]) -> int:
+    """Rewrites a denormalized catalog name on every provider referencing it."""
+    updated = 0
+    stale = {id_field: id_value, name_field: {"$ne": name}}
+    while True:
+        ids = [p["id"] for p in await database.providers.find(stale, {"_id": 0, "id": 1}).to_list(FAN_OUT_BATCH_SIZE)]
+        if not ids:
+            break
+        result = await database.providers.update_many(
+            {"id": {"$in": ids}, **stale}, {"$set": {name_field: name}}
+        )
+        updated += result.modified_count
+        if len(ids) < FAN_OUT_BATCH_SIZE:
+            break
+    return updated
+
+
+async def fan_out_category_name(database, category_id: str, name: Optional[str]):
+    updated = await fan_out_name(database, "category_id", category_id, "category_name", name)
+    logger.info("Updated category_name on %d providers for category %s", updated, category_id)
+
+
+async def fan_out_offering_name(database, sub_service_id: str, name: Optional[str]) -> int:
+    """Rewrites the sub-service name inside every matching provider offering."""
+    result = await database.providers.update_many(
+        {"offerings": {"$elemMatch": {"sub_service_id": sub_service_id, "sub_service_name": {"$ne": name}}}},
+        {"$set": {"offerings.$[o].sub_service_name": name}},
+        array_filters=[{"o.sub_service_id": sub_service_id}]
+    )
+    return result.modified_count
+
+
+async def fan_out_sub_service_name(database, sub_service_id: str, name: Optional[str]):
+    updated = await fan_out_name(database, "sub_service_id", sub_service_id, "sub_service_name", name)
+    offerings = await fan_out_offering_name(database, sub_service_id, name)
+    logger.info(
+        "Updated sub_service_name on %d providers and %d offering lists for sub-service %s",
+        updated, offerings, sub_service_id
+    )
+
+
+async def check_provider_names(database, repair: bool = False) -> dict:
+    """Finds provider name groups that disagree with the catalog.
+
+    Groups providers by (id, stored name) so the scan returns one row per
+    distinct pair rather than one per provider.
+    """
+    await catalog.load(database)
+    checks = [
+        ("category_id", "category_name", catalog.categories, fan_out_category_name),
+        ("sub_service_id", "sub_service_name", catalog.sub_services, fan_out_sub_service_name),
+        ("offerings.sub_service_id", "offerings.sub_service_name", catalog.sub_services, fan_out_offering_name),
+    ]
+    mismatches = []
+    for id_field, name_field, entries, fan_out in checks:
+        pipeline = [{"$group": {"_id": {"ref": f"${id_field}", "name": f"${name_field}"}, "count": {"$sum": 1}}}]
+        if id_field.startswith("offerings."):
+            pipeline.insert(0, {"$unwind": "$offerings"})
+        groups = await database.providers.aggregate(pipeline).to_list(None)
+        for group in groups:
+            ref = group["_id"].get("ref")
+            stored = group["_id"].get("name")
+            entry = entries.get(ref)
+            expected = entry["name"] if entry else None
+            if stored != expected:
+                mismatches.append({
+                    "field": name_field,
+                    "ref": ref,
+                    "stored": stored,
+                    "expected": expected,
+                    "providers": group["count"]
+                })
+                if repair:
+                    await fan_out(database, ref, expected)
+    return {"consistent": not mismatches, "repaired": repair and bool(mismatches), "mismatches": mismatches}
@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference, monitoring
+
+from earnings import LEDGER_INDEXES
+from partitions import DEFAULT, parse_config, partition_router
+from slow_ops import slow_op_recorder
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# ============ SETTINGS ============
+
+MONGO_URL = os.environ['MONGO_URL']
+DB_NAME = os.environ['DB_NAME']
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 15000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zlib')
+
+# Analytics and reporting scans get their own small pool so a slow
+# aggregation can never starve booking writes of connections.
+MONGO_ANALYTICS_POOL_SIZE = int(os.environ.get('MONGO_ANALYTICS_POOL_SIZE', 5))
+MONGO_ANALYTICS_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_ANALYTICS_SOCKET_TIMEOUT_MS', 60000))
+
+# City partitions for providers and bookings; see partitions.py.
+MONGO_PARTITIONS = parse_config(os.environ.get('MONGO_PARTITIONS', ''))
+
+# ============ POOL MONITORING ============
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts pool checkouts and measures how long callers wait for a connection."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.connections_open = 0
+        self.checked_out = 0
+        self.checkouts_total = 0
+        self.checkouts_failed = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+
+    def connection_check_out_started(self, event):
+        # Check-out runs synchronously on one executor thread, so a
+        # thread-local timestamp pairs the start with its outcome.
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def connection_checked_out(self, event):
+        waited_ms = self._elapsed_ms()
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+            self.checkouts_total += 1
+            self.wait_ms_total += waited_ms
+            self.wait_ms_max = max(self.wait_ms_max, waited_ms)
+
+    def connection_check_out_failed(self, event):
+        self._elapsed_ms()
+        with self._lock:
+            self.waiting -= 1
+            self.checkouts_failed += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def _elapsed_ms(self) -> float:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        if started is None:
+            return 0.0
+        return (time.perf_counter() - started) * 1000
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            avg_wait = self.wait_ms_total / self.checkouts_total if self.checkouts_total else 0.0
+            return {
+                "connections_open": self.connections_open,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "checkouts_total": self.checkouts_total,
+                "checkouts_failed": self.checkouts_failed,
+                "avg_wait_ms": round(avg_wait, 3),
+                "max_wait_ms": round(self.wait_ms_max, 3),
+                "pool_clears": self.pool_clears,
+            }
+
+# ============ CLIENTS ============
+
+main_pool_stats = PoolStatsListener("main")
+analytics_pool_stats = PoolStatsListener("analytics")
+
+def _compressors():
+    return [c.strip() for c in MONGO_COMPRESSORS.split(',') if c.strip()]
+
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    compressors=_compressors(),
+    retryWrites=True,
+    # Analytics scans are expected to be slow, so only this client is watched.
+    event_listeners=[main_pool_stats, slow_op_recorder],
+)
+
+analytics_client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_ANALYTICS_POOL_SIZE,
+    minPoolSize=0,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_ANALYTICS_SOCKET_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    compressors=_compressors(),
+    readPreference='secondaryPreferred',
+    event_listeners=[analytics_pool_stats],
+)
+
+partition_clients = []
+
+def _partition_clients(url: str) -> tuple:
+    # Partitions on the main cluster share its pools; a partition on its
+    # own cluster gets pools of its own, so its load stays there.
+    if url == MONGO_URL:
+        return client, analytics_client
+    own = AsyncIOMotorClient(
+        url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=0,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        compressors=_compressors(),
+        retryWrites=True,
+        event_listeners=[slow_op_recorder],
+    )
+    partition_clients.append(own)
+    return own, own
+
+def _register_partition(name: str, url: str, db_name: str):
+    main, analytics = _partition_clients(url)
+    partition_router.add(
+        name,
+        primary=main[db_name],
+        secondary=main.get_database(db_name, read_preference=ReadPreference.SECONDARY_PREFERRED),
+        analytics=analytics.get_database(db_name, read_preference=ReadPreference.SECONDARY_PREFERRED),
+    )
+
+_register_partition(DEFAULT, MONGO_URL, DB_NAME)
+for _name, _spec in MONGO_PARTITIONS.items():
+    _register_partition(_name, _spec.get("url") or MONGO_URL, _spec["db"])
+
+# With no partitions configured these are the plain Motor databases.
+
+# Primary reads and all writes.
+db = partition_router.wrap(client[DB_NAME], "primary")
+
+# Read-only endpoints that tolerate slightly stale data opt into this handle.
+read_db = partition_router.wrap(
+    client.get_database(DB_NAME, read_preference=ReadPreference.SECONDARY_PREFERRED), "secondary"
+)
+
+# Long-running admin scans and aggregations.
+analytics_db = partition_router.wrap(analytics_client[DB_NAME], "analytics")
+
+async def ping_latency_ms(database=None) -> float:
+    database = database if database is not None else db
+    started = time.perf_counter()
+    await database.command("ping")
+    return round((time.perf_counter() - started) * 1000, 3)
+
+async def pool_health() -> dict:
+    health = {
+        "status": "ok",
+        "settings": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "socket_timeout_ms": MONGO_SOCKET_TIMEOUT_MS,
+            "compressors": _compressors(),
+            "analytics_pool_size": MONGO_ANALYTICS_POOL_SIZE,
+        },
+        "pools": {
+            "main": main_pool_stats.snapshot(),
+            "analytics": analytics_pool_stats.snapshot(),
+        },
+    }
+    try:
+        health["latency_ms"] = {
+            "primary": await ping_latency_ms(db),
+            "analytics": await ping_latency_ms(analytics_db),
+        }
+    except Exception as e:
+        health["status"] = "degraded"
+        health["error"] = str(e)
+    return health
+
+async def prime_pool(connections: int = MONGO_MIN_POOL_SIZE):
+    # Concurrent pings force the driver to open that many sockets up front
+    # instead of paying the TCP/auth handshake on the first real requests.
+    await asyncio.gather(*(db.command("ping") for _ in range(max(connections, 1))))
+    await analytics_db.command("ping")
+
+# ============ INDEXES ============
+
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "providers": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+        # Multikey: one entry per offering, so the /providers $elemMatch on
+        # sub-service and price range is a single index scan per city.
+        IndexModel(
+            [("city", ASCENDING), ("offerings.sub_service_id", ASCENDING), ("offerings.price", ASCENDING)],
+            partialFilterExpression={"is_approved": True}
+        ),
+        # The same listing without a price range, read in rank order instead
+        # of sorted in memory.
+        IndexModel(
+            [("city", ASCENDING), ("offerings.sub_service_id", ASCENDING), ("rank_score", DESCENDING), ("id", ASCENDING)],
+            partialFilterExpression={"is_approved": True}
+        ),
+        IndexModel([("offerings.sub_service_id", ASCENDING), ("offerings.price", ASCENDING)]),
+        IndexModel([("offerings.category_id", ASCENDING), ("is_approved", ASCENDING)]),
+        IndexModel([("is_approved", ASCENDING), ("rank_score", DESCENDING), ("id", ASCENDING)]),
+        IndexModel([("category_id", ASCENDING), ("is_approved", ASCENDING)]),
+        IndexModel([("sub_service_id", ASCENDING)]),
+    ],
+    "bookings": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("provider_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("provider_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("city", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("category_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("sub_service_id", ASCENDING), ("category_id", ASCENDING)]),
+        IndexModel([("offered_to", ASCENDING), ("status", ASCENDING)], sparse=True),
+        IndexModel([("status", ASCENDING), ("dispatch_lease_until", ASCENDING)], sparse=True),
+    ],
+    # Finished bookings moved out of the hot collection; see archive.py.
+    "bookings_archive": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("provider_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "reviews": [
+        IndexModel([("booking_id", ASCENDING)], unique=True),
+        IndexModel([("provider_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "provider_earnings": LEDGER_INDEXES,
+    # Newest-first pages filtered by actor, entity or action; see audit.py.
+    "audit_log": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("actor_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("entity_type", ASCENDING), ("entity_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("action", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "service_categories": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    # Background provider imports and their reports; see provider_import.py.
+    "provider_imports": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "sub_services": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("category_id", ASCENDING)]),
+    ],
+}
+
+async def ensure_indexes():
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except Exception as e:
+            # A conflicting or unbuildable index (e.g. duplicate legacy data
+            # under a unique key) must not keep the API from starting.
+            logger.warning("Could not ensure indexes on %s: %s", collection, e)
+
+def close_clients():
+    client.close()
+    analytics_client.close()
+    for partition_client in partition_clients:
+        partition_client.close()
@@ -0,0 +1,310 @@
+import asyncio
+import heapq
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from audit import audit_log
+from offerings import provider_offerings
+
+logger = logging.getLogger(__name__)
+
+# Seconds a provider has to accept an offer before it moves down the list.
+OFFER_TIMEOUT_SECONDS = int(os.environ.get('DISPATCH_OFFER_TIMEOUT_SECONDS', 30))
+# Candidates taken from the index per round; more are fetched if all decline.
+CANDIDATES_PER_ROUND = int(os.environ.get('DISPATCH_CANDIDATES_PER_ROUND', 10))
+# How often a waiting dispatcher re-reads the booking, for answers that
+# arrive through another worker.
+POLL_INTERVAL_SECONDS = float(os.environ.get('DISPATCH_POLL_INTERVAL_SECONDS', 1))
+# Full index reload from Mongo, which picks up toggles made on other workers.
+RESYNC_INTERVAL_SECONDS = int(os.environ.get('DISPATCH_RESYNC_INTERVAL_SECONDS', 30))
+# A dispatcher holds a lease on its booking so only one worker drives it;
+# an expired lease means the owner died and the booking can be resumed.
+LEASE_GRACE_SECONDS = 10
+# When every matching provider is busy (holding another offer or working
+# a job), the booking waits for one to free up, up to this long after it
+# was created, before it is marked unassigned.
+BUSY_WAIT_SECONDS = int(os.environ.get('DISPATCH_BUSY_WAIT_SECONDS', 120))
+BUSY_RETRY_SECONDS = float(os.environ.get('DISPATCH_BUSY_RETRY_SECONDS', 2))
+# Set on the provider while it holds an offer; kept out of API responses.
+RESERVATION_FIELDS = ("offer_booking_id", "offer_until")
+
+
+class OnlineIndex:
+    """Online, approved providers keyed by (city, sub_service_id).
+
+    Each entry maps provider id to rank score; a provider sits in one slot
+    per sub-service it offers. Jobs are accepted and finished through
+    whichever worker gets the request, so the job counts are only a local
+    hint between resyncs, which rebuild them from Mongo; the dispatcher
+    checks Mongo before offering.
+    """
+
+    def __init__(self):
+        self._slots: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._location: Dict[str, Set[Tuple[str, str]]] = {}
+        self._active_jobs: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._location)
+
+    def upsert(self, provider: dict):
+        provider_id = provider["id"]
+        if not (provider.get("is_online") and provider.get("is_approved")):
+            self.remove(provider_id)
+            return
+        keys = {(provider["city"], o["sub_service_id"]) for o in provider_offerings(provider)}
+        if self._location.get(provider_id, keys) != keys:
+            self.remove(provider_id)
+        for key in keys:
+            self._slots.setdefault(key, {})[provider_id] = provider.get("rank_score", 0.0)
+        self._location[provider_id] = keys
+
+    def remove(self, provider_id: str):
+        for key in self._location.pop(provider_id, ()):
+            slot = self._slots.get(key, {})
+            slot.pop(provider_id, None)
+            if not slot:
+                self._slots.pop(key, None)
+
+    def replace_all(self, providers: List[dict], active_jobs: Dict[str, int]):
+        self._slots = {}
+        self._location = {}
+        self._active_jobs = dict(active_jobs)
+        for provider in providers:
+            self.upsert(provider)
+
+    def candidates(self, city: str, sub_service_id: str, exclude: Set[str], limit: int) -> List[str]:
+        slot = self._slots.get((city, sub_service_id), {})
+        available = ((score, provider_id) for provider_id, score in slot.items() if provider_id not in exclude)
+        return [provider_id for _, provider_id in heapq.nlargest(limit, available)]
+
+    def has_job(self, provider_id: str) -> bool:
+        return bool(self._active_jobs.get(provider_id))
+
+    def start_job(self, provider_id: str):
+        self._active_jobs[provider_id] = self._active_jobs.get(provider_id, 0) + 1
+
+    def finish_job(self, provider_id: str):
+        remaining = self._active_jobs.get(provider_id, 0) - 1
+        if remaining > 0:
+            self._active_jobs[provider_id] = remaining
+        else:
+            self._active_jobs.pop(provider_id, None)
+
+
+class Dispatcher:
+    def __init__(self, database, index: OnlineIndex):
+        self.db = database
+        self.index = index
+        # Identifies this worker's dispatcher in booking leases.
+        self.owner = str(uuid.uuid4())
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._answers: Dict[str, asyncio.Event] = {}
+        self._resync_task: Optional[asyncio.Task] = None
+
+    # ---------- lifecycle ----------
+
+    async def start(self):
+        await self.resync()
+        self._resync_task = asyncio.create_task(self._resync_loop())
+        await self.resume_orphaned()
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        if self._resync_task:
+            tasks.append(self._resync_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def resync(self):
+        providers = await self.db.providers.find(
+            {"is_approved": True, "is_online": True},
+            {
+                "_id": 0, "id": 1, "city": 1, "sub_service_id": 1, "offerings.sub_service_id": 1,
+                "rank_score": 1, "is_online": 1, "is_approved": 1
+            }
+        ).to_list(None)
+        active_jobs = await self.db.bookings.aggregate([
+            {"$match": {"status": "accepted", "instant": True}},
+            {"$group": {"_id": "$provider_id", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        self.index.replace_all(providers, {job["_id"]: job["count"] for job in active_jobs})
+
+    async def _resync_loop(self):
+        while True:
+            await asyncio.sleep(RESYNC_INTERVAL_SECONDS)
+            try:
+                await self.resync()
+            except Exception:
+                logger.exception("Dispatch index resync failed")
+
+    async def resume_orphaned(self):
+        now = datetime.now(timezone.utc).isoformat()
+        orphaned = await self.db.bookings.find(
+            {"status": "dispatching", "dispatch_lease_until": {"$lt": now}}, {"_id": 0, "id": 1}
+        ).to_list(None)
+        for booking in orphaned:
+            self.submit(booking["id"])
+
+    # ---------- dispatching ----------
+
+    def submit(self, booking_id: str):
+        if booking_id not in self._tasks:
+            task = asyncio.create_task(self._run(booking_id))
+            self._tasks[booking_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(booking_id, None))
+
+    def notify(self, booking_id: str):
+        event = self._answers.get(booking_id)
+        if event:
+            event.set()
+
+    async def _claim(self, booking_id: str, until: datetime) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.db.bookings.find_one_and_update(
+            {
+                "id": booking_id,
+                "status": "dispatching",
+                "$or": [
+                    {"dispatch_lease_until": {"$exists": False}},
+                    {"dispatch_lease_until": {"$lt": now.isoformat()}},
+                    {"dispatch_owner": self.owner}
+                ]
+            },
+            {"$set": {"dispatch_lease_until": until.isoformat(), "dispatch_owner": self.owner}},
+            projection={"_id": 0}
+        )
+
+    async def _run(self, booking_id: str):
+        event = self._answers.setdefault(booking_id, asyncio.Event())
+        try:
+            booking = await self._claim(booking_id, self._lease())
+            if booking is None:
+                return
+            tried = set(booking.get("dispatch_tried", []))
+            # Skipped this round; tried again once the round runs dry.
+            busy: Set[str] = set()
+            deadline = datetime.fromisoformat(booking["created_at"]) + timedelta(seconds=BUSY_WAIT_SECONDS)
+            while True:
+                candidates = self.index.candidates(
+                    booking["city"], booking["sub_service_id"], tried | busy, CANDIDATES_PER_ROUND
+                )
+                if not candidates:
+                    if not busy or datetime.now(timezone.utc) >= deadline:
+                        await self._unassign(booking)
+                        return
+                    await asyncio.sleep(BUSY_RETRY_SECONDS)
+                    # Renews the lease; None once the booking was cancelled.
+                    if await self._claim(booking_id, self._lease()) is None:
+                        return
+                    busy = set()
+                    continue
+                for provider_id in candidates:
+                    if self.index.has_job(provider_id) or not await self._reserve(booking, provider_id):
+                        busy.add(provider_id)
+                        continue
+                    tried.add(provider_id)
+                    try:
+                        outcome = await self._offer(booking_id, provider_id, event)
+                    finally:
+                        await self._release(booking, provider_id)
+                    if outcome in ("accepted", "gone"):
+                        return
+        except asyncio.CancelledError:
+            # Leave the lease to expire so another worker resumes this booking.
+            raise
+        except Exception:
+            logger.exception("Dispatch failed for booking %s", booking_id)
+        finally:
+            self._answers.pop(booking_id, None)
+
+    def _lease(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=LEASE_GRACE_SECONDS)
+
+    async def _unassign(self, booking: dict):
+        result = await self.db.bookings.update_one(
+            {"id": booking["id"], "city": booking["city"], "status": "dispatching"},
+            {"$set": {"status": "unassigned", "offered_to": None, "offer_expires_at": None}}
+        )
+        if result.modified_count:
+            audit_log.record(
+                "booking_status_changed", None, "booking", booking["id"],
+                from_status="dispatching", to_status="unassigned"
+            )
+        logger.info("No provider accepted instant booking %s", booking["id"])
+
+    async def _reserve(self, booking: dict, provider_id: str) -> bool:
+        """Holds the provider for this booking's offer, across all workers."""
+        now = datetime.now(timezone.utc)
+        working = await self.db.bookings.find_one(
+            {"provider_id": provider_id, "status": "accepted", "instant": True}, {"_id": 1}
+        )
+        if working:
+            return False
+        # Outlives the offer, so a dead worker's hold lapses on its own.
+        until = now + timedelta(seconds=OFFER_TIMEOUT_SECONDS + LEASE_GRACE_SECONDS)
+        result = await self.db.providers.update_one(
+            {
+                "id": provider_id,
+                "city": booking["city"],
+                "$or": [{"offer_booking_id": None}, {"offer_until": {"$lt": now.isoformat()}}]
+            },
+            {"$set": {"offer_booking_id": booking["id"], "offer_until": until.isoformat()}}
+        )
+        return result.matched_count > 0
+
+    async def _release(self, booking: dict, provider_id: str):
+        await self.db.providers.update_one(
+            {"id": provider_id, "city": booking["city"], "offer_booking_id": booking["id"]},
+            {"$set": {"offer_booking_id": None, "offer_until": None}}
+        )
+
+    async def _offer(self, booking_id: str, provider_id: str, event: asyncio.Event) -> str:
+        expires = datetime.now(timezone.utc) + timedelta(seconds=OFFER_TIMEOUT_SECONDS)
+        result = await self.db.bookings.update_one(
+            {"id": booking_id, "status": "dispatching", "dispatch_owner": self.owner},
+            {
+                "$set": {
+                    "offered_to": provider_id,
+                    "offer_expires_at": expires.isoformat(),
+                    "dispatch_lease_until": (expires + timedelta(seconds=LEASE_GRACE_SECONDS)).isoformat()
+                },
+                "$addToSet": {"dispatch_tried": provider_id}
+            }
+        )
+        if not result.modified_count:
+            return "gone"
+
+        while True:
+            event.clear()
+            remaining = (expires - datetime.now(timezone.utc)).total_seconds()
+            if remaining > 0:
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, POLL_INTERVAL_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+            booking = await self.db.bookings.find_one(
+                {"id": booking_id}, {"_id": 0, "status": 1, "offered_to": 1}
+            )
+            if booking is None or booking["status"] not in ("dispatching", "accepted"):
+                return "gone"
+            if booking["status"] == "accepted":
+                return "accepted"
+            if booking.get("offered_to") != provider_id:
+                return "declined"
+            if datetime.now(timezone.utc) >= expires:
+                # Withdraw the offer; the conditional update loses to a
+                # last-moment accept, which then wins.
+                withdrawn = await self.db.bookings.update_one(
+                    {"id": booking_id, "status": "dispatching", "offered_to": provider_id},
+                    {"$set": {"offered_to": None, "offer_expires_at": None}}
+                )
+                if withdrawn.modified_count:
+                    return "timeout"
+
+
+online_index = OnlineIndex()
@@ -0,0 +1,349 @@
+import logging
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from pymongo import ASCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Ledger documents live in `provider_earnings`, one per
+# (provider_id, granularity, bucket). "total" holds the lifetime figures.
+LEDGER_COLLECTION = "provider_earnings"
+# A full rebuild is written to a collection with this prefix and renamed
+# over the ledger when done.
+REBUILD_COLLECTION_PREFIX = "provider_earnings_rebuild_"
+# One rebuild at a time across workers, under a lease in this collection.
+# While it is held, completions are journaled instead of written to the
+# ledger the rebuild is about to replace, and replayed when it is done.
+LEDGER_STATE_COLLECTION = "provider_earnings_state"
+JOURNAL_COLLECTION = "provider_earnings_journal"
+# Renewed after every batch, so only a dead rebuild lets it run out.
+REBUILD_LEASE_SECONDS = 300
+# The rebuild marks bookings completed this long before it started as
+# counted, so a completion it both scanned and journaled is not applied
+# twice. A request would have to stall this long between completing a
+# booking and recording it to slip through.
+JOURNAL_OVERLAP = timedelta(minutes=10)
+LEDGER_INDEXES = [
+    IndexModel([("provider_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], unique=True),
+    IndexModel([("provider_id", ASCENDING), ("granularity", ASCENDING), ("bucket_start", ASCENDING)]),
+]
+GRANULARITIES = ("day", "week", "month")
+MAX_BUCKETS = 366
+REBUILD_BATCH_SIZE = 500
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def next_bucket(start: date, granularity: str) -> date:
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(weeks=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def bucket_label(start: date, granularity: str) -> str:
+    if granularity == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return start.strftime("%Y-%m")
+    return start.isoformat()
+
+
+def _ledger_updates(booking: dict, completed_at: datetime) -> List[tuple]:
+    day = completed_at.astimezone(timezone.utc).date()
+    inc = {
+        "gross": booking["base_price"],
+        "commission": booking["commission"],
+        "net": booking["provider_earnings"],
+        "bookings": 1,
+    }
+    updates = [(
+        {"provider_id": booking["provider_id"], "granularity": "total", "bucket": "all"},
+        {"$inc": inc},
+    )]
+    for granularity in GRANULARITIES:
+        start = bucket_start(day, granularity)
+        updates.append((
+            {"provider_id": booking["provider_id"], "granularity": granularity, "bucket": bucket_label(start, granularity)},
+            {"$inc": inc, "$setOnInsert": {"bucket_start": start.isoformat()}},
+        ))
+    return updates
+
+
+class LedgerRebuildRunning(RuntimeError):
+    pass
+
+
+async def _apply(database, booking: dict, completed_at: datetime):
+    ops = [UpdateOne(query, update, upsert=True) for query, update in _ledger_updates(booking, completed_at)]
+    await database[LEDGER_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def record_completion(database, booking: dict, completed_at: datetime):
+    """Adds a completed booking to every ledger bucket it falls in."""
+    if not _rebuilding(await _rebuild_state(database)):
+        await _apply(database, booking, completed_at)
+        return
+    await database[JOURNAL_COLLECTION].update_one(
+        {"_id": booking["id"]},
+        {"$set": {
+            "booking": {f: booking[f] for f in ("provider_id", "base_price", "commission", "provider_earnings")},
+            "completed_at": completed_at.isoformat(),
+        }},
+        upsert=True
+    )
+    state = await _rebuild_state(database)
+    if not _rebuilding(state):
+        # The rebuild finished meanwhile and may already have replayed the journal.
+        await _replay_one(database, booking["id"], state.get("finished"))
+
+
+# ============ REBUILD LEASE AND JOURNAL ============
+
+async def _rebuild_state(database) -> dict:
+    return await database[LEDGER_STATE_COLLECTION].find_one({"_id": "rebuild"}) or {}
+
+
+def _rebuilding(state: dict) -> bool:
+    return state.get("until", "") > datetime.now(timezone.utc).isoformat()
+
+
+async def _claim_rebuild(database) -> str:
+    now = datetime.now(timezone.utc)
+    owner = uuid.uuid4().hex
+    try:
+        await database[LEDGER_STATE_COLLECTION].find_one_and_update(
+            {"_id": "rebuild", "until": {"$lt": now.isoformat()}},
+            {"$set": {
+                "owner": owner,
+                "started_at": now.isoformat(),
+                "until": (now + timedelta(seconds=REBUILD_LEASE_SECONDS)).isoformat(),
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise LedgerRebuildRunning("An earnings ledger rebuild is already running")
+    return owner
+
+
+async def _renew_rebuild(database, owner: str):
+    until = datetime.now(timezone.utc) + timedelta(seconds=REBUILD_LEASE_SECONDS)
+    result = await database[LEDGER_STATE_COLLECTION].update_one(
+        {"_id": "rebuild", "owner": owner}, {"$set": {"until": until.isoformat()}}
+    )
+    if not result.matched_count:
+        raise LedgerRebuildRunning("The earnings ledger rebuild lease was taken over")
+
+
+async def _finish_rebuild(database, owner: str, finished: Optional[str]):
+    await database[LEDGER_STATE_COLLECTION].update_one(
+        {"_id": "rebuild", "owner": owner},
+        {"$set": {"until": datetime.min.replace(tzinfo=timezone.utc).isoformat(), "finished": finished}}
+    )
+
+
+async def _replay_one(database, booking_id: str, counted_by: Optional[str]):
+    # Whoever deletes the entry applies it, so a completion is replayed once.
+    entry = await database[JOURNAL_COLLECTION].find_one_and_delete({"_id": booking_id})
+    counted = counted_by is not None and entry is not None and entry.get("counted") == counted_by
+    if entry and "booking" in entry and not counted:
+        await _apply(database, entry["booking"], datetime.fromisoformat(entry["completed_at"]))
+
+
+async def _replay_journal(database, counted_by: Optional[str]) -> int:
+    ids = [entry["_id"] async for entry in database[JOURNAL_COLLECTION].find({}, {"_id": 1})]
+    for booking_id in ids:
+        await _replay_one(database, booking_id, counted_by)
+    return len(ids)
+
+
+async def _completed_bookings(database, provider_id: Optional[str] = None):
+    query = {"status": "completed"}
+    if provider_id:
+        query["provider_id"] = provider_id
+    projection = {
+        "_id": 0, "id": 1, "provider_id": 1, "base_price": 1, "commission": 1, "provider_earnings": 1,
+        "created_at": 1, "completed_at": 1
+    }
+    # Archived bookings still count towards earnings.
+    for collection in (database.bookings, database.bookings_archive):
+        async for booking in collection.find(query, projection):
+            # Bookings completed before the ledger existed have no completed_at.
+            yield booking, datetime.fromisoformat(booking.get("completed_at") or booking["created_at"])
+
+
+async def rebuild_ledger(database, provider_id: Optional[str] = None) -> int:
+    """Recomputes the ledger from completed bookings; returns bookings replayed.
+
+    Dashboards never read a half-built ledger: one provider's buckets are
+    summed in memory and swapped in document by document, and a full
+    rebuild is written to a scratch collection renamed over the ledger.
+    Raises LedgerRebuildRunning if another rebuild holds the lease.
+    """
+    owner = await _claim_rebuild(database)
+    finished = None
+    try:
+        # Left behind by a rebuild that died. Their bookings are completed,
+        # so the scan below counts them again wherever it rebuilds.
+        await _replay_journal(database, None)
+        marker = _CountedMarker(database, owner)
+        if provider_id:
+            replayed = await _rebuild_provider(database, provider_id, marker)
+        else:
+            replayed = await _rebuild_all(database, owner, marker)
+        finished = owner
+    finally:
+        # A failed rebuild's marks mean nothing; replay every completion.
+        await _finish_rebuild(database, owner, finished)
+        journaled = await _replay_journal(database, finished)
+    logger.info("Rebuilt earnings ledger from %d bookings; %d completions journaled meanwhile", replayed, journaled)
+    return replayed
+
+
+class _CountedMarker:
+    """Marks recent bookings a rebuild counted, in the journal."""
+
+    def __init__(self, database, owner: str):
+        self.journal = database[JOURNAL_COLLECTION]
+        self.owner = owner
+        self.since = datetime.now(timezone.utc) - JOURNAL_OVERLAP
+        self.ops = []
+
+    async def add(self, booking: dict, completed_at: datetime):
+        if completed_at.tzinfo is None:
+            completed_at = completed_at.replace(tzinfo=timezone.utc)
+        if completed_at >= self.since:
+            self.ops.append(UpdateOne({"_id": booking["id"]}, {"$set": {"counted": self.owner}}, upsert=True))
+        if len(self.ops) >= REBUILD_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self.ops:
+            await self.journal.bulk_write(self.ops, ordered=False)
+            self.ops = []
+
+
+async def _rebuild_provider(database, provider_id: str, marker: _CountedMarker) -> int:
+    buckets = {}
+    replayed = 0
+    async for booking, completed_at in _completed_bookings(database, provider_id):
+        await marker.add(booking, completed_at)
+        for query, update in _ledger_updates(booking, completed_at):
+            key = (query["granularity"], query["bucket"])
+            doc = buckets.setdefault(key, {
+                **query, **update.get("$setOnInsert", {}), "gross": 0, "commission": 0, "net": 0, "bookings": 0
+            })
+            for field, value in update["$inc"].items():
+                doc[field] += value
+        replayed += 1
+    await marker.flush()
+
+    ledger = database[LEDGER_COLLECTION]
+    ops = [
+        ReplaceOne({"provider_id": provider_id, "granularity": g, "bucket": b}, doc, upsert=True)
+        for (g, b), doc in buckets.items()
+    ]
+    for start in range(0, len(ops), REBUILD_BATCH_SIZE):
+        await ledger.bulk_write(ops[start:start + REBUILD_BATCH_SIZE], ordered=False)
+    # Buckets that no longer have any completed booking.
+    stale = [
+        d["_id"] async for d in ledger.find({"provider_id": provider_id}, {"_id": 1, "granularity": 1, "bucket": 1})
+        if (d["granularity"], d["bucket"]) not in buckets
+    ]
+    if stale:
+        await ledger.delete_many({"_id": {"$in": stale}})
+    return replayed
+
+
+async def _rebuild_all(database, owner: str, marker: _CountedMarker) -> int:
+    scratch = database[f"{REBUILD_COLLECTION_PREFIX}{owner}"]
+    await scratch.create_indexes(LEDGER_INDEXES)
+    replayed = 0
+    ops = []
+    try:
+        async for booking, completed_at in _completed_bookings(database):
+            ops.extend(UpdateOne(query, update, upsert=True) for query, update in _ledger_updates(booking, completed_at))
+            await marker.add(booking, completed_at)
+            replayed += 1
+            if len(ops) >= REBUILD_BATCH_SIZE:
+                await scratch.bulk_write(ops, ordered=False)
+                await _renew_rebuild(database, owner)
+                ops = []
+        if ops:
+            await scratch.bulk_write(ops, ordered=False)
+        await marker.flush()
+        await _renew_rebuild(database, owner)
+        # Atomic for readers: they see the old ledger or the new one.
+        await scratch.rename(LEDGER_COLLECTION, dropTarget=True)
+    except BaseException:
+        await scratch.drop()
+        raise
+    return replayed
+
+
+async def lifetime_totals(database, provider_id: str) -> dict:
+    doc = await database.provider_earnings.find_one(
+        {"provider_id": provider_id, "granularity": "total", "bucket": "all"}, {"_id": 0}
+    )
+    return {
+        "gross": doc["gross"] if doc else 0,
+        "commission": doc["commission"] if doc else 0,
+        "net": doc["net"] if doc else 0,
+        "bookings": doc["bookings"] if doc else 0,
+    }
+
+
+async def earnings_series(database, provider_id: str, granularity: str, start: date, end: date) -> List[dict]:
+    """Returns one entry per bucket between start and end, zero-filled."""
+    first = bucket_start(start, granularity)
+    last = bucket_start(end, granularity)
+    docs = await database.provider_earnings.find(
+        {
+            "provider_id": provider_id,
+            "granularity": granularity,
+            "bucket_start": {"$gte": first.isoformat(), "$lte": last.isoformat()},
+        },
+        {"_id": 0, "bucket": 1, "gross": 1, "commission": 1, "net": 1, "bookings": 1}
+    ).to_list(MAX_BUCKETS)
+    by_bucket = {d["bucket"]: d for d in docs}
+
+    series = []
+    current = first
+    while current <= last:
+        label = bucket_label(current, granularity)
+        doc = by_bucket.get(label, {})
+        series.append({
+            "bucket": label,
+            "bucket_start": current.isoformat(),
+            "gross": doc.get("gross", 0),
+            "commission": doc.get("commission", 0),
+            "net": doc.get("net", 0),
+            "bookings": doc.get("bookings", 0),
+        })
+        current = next_bucket(current, granularity)
+    return series
+
+
+def bucket_count(start: date, end: date, granularity: str) -> int:
+    count = 0
+    current = bucket_start(start, granularity)
+    last = bucket_start(end, granularity)
+    while current <= last and count <= MAX_BUCKETS:
+        count += 1
+        current = next_bucket(current, granularity)
+    return count
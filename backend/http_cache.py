@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import os
+from typing import Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Cache-Control per route family. Catalog data changes rarely; listings
+# and provider pages carry ratings and online status, so they revalidate sooner.
+CACHE_POLICIES = {
+    "cities": "public, max-age=86400",
+    "catalog": "public, max-age=300, stale-while-revalidate=600",
+    "providers:list": "public, max-age=30, stale-while-revalidate=60",
+    "providers:detail": "public, max-age=60, stale-while-revalidate=120",
+    "reports": "private, max-age=300",
+}
+
+
+def _default(value):
+    # Anything orjson cannot encode natively (pydantic models, sets, ...).
+    return jsonable_encoder(value)
+
+
+def render_json(content) -> bytes:
+    # Mongo documents are already plain dicts of JSON types, so they go
+    # straight to orjson without a jsonable_encoder pass.
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def rendered(content) -> Optional[dict]:
+    """Pre-serializes a payload for caching; None stays None (not found)."""
+    if content is None:
+        return None
+    body = render_json(content)
+    return {"body": body, "etag": etag_for(body)}
+
+
+def fast_json(content, status_code: int = 200) -> Response:
+    """Returns trusted DB output without response-model validation or jsonable_encoder."""
+    return Response(content=render_json(content), status_code=status_code, media_type="application/json")
+
+
+def etag_for(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _accepted_encoding(request: Request) -> Optional[str]:
+    accept = request.headers.get("accept-encoding", "")
+    offered = {part.split(";")[0].strip().lower() for part in accept.split(",")}
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+def _matches(if_none_match: str, tag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2): compare opaque tags, ignoring W/
+    # and the per-encoding suffix we add to compressed representations.
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"').split("-")[0] == tag:
+            return True
+    return False
+
+
+def conditional_response(
+    request: Request, body: bytes, policy: str, tag: Optional[str] = None, variants: Optional[dict] = None
+) -> Response:
+    """Serves a JSON body with an ETag, 304 revalidation and compression."""
+    tag = tag or etag_for(body)
+    headers = {
+        "Cache-Control": CACHE_POLICIES[policy],
+        "Vary": "Accept-Encoding",
+    }
+
+    encoding = _accepted_encoding(request) if len(body) >= COMPRESSION_MIN_SIZE else None
+    # Each encoding is a distinct representation, so it gets its own strong tag.
+    headers["ETag"] = f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        # `variants` memoizes compressed bodies alongside a cached payload.
+        compressed = variants.get(encoding) if variants is not None else None
+        if compressed is None:
+            if encoding == "br":
+                compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            if variants is not None:
+                variants[encoding] = compressed
+        body = compressed
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def conditional_rendered(request: Request, payload: dict, policy: str) -> Response:
+    return conditional_response(
+        request, payload["body"], policy, tag=payload["etag"], variants=payload.setdefault("variants", {})
+    )
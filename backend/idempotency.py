@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from http_cache import fast_json
+
+logger = logging.getLogger(__name__)
+
+# How long a key is remembered; retries after this execute again.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+# A request holding a key renews its lock while the handler runs; one that
+# stops renewing for this long is presumed dead (worker crash), and a retry
+# may take the key over.
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 30))
+# How long a duplicate waits for the first request before giving up with 409.
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+IDEMPOTENCY_POLL_SECONDS = 0.1
+MAX_KEY_LENGTH = 255
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(payload: Any) -> str:
+    """Hash of the request body; a reused key must carry the same request."""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class IdempotencyStore:
+    """Remembers the outcome of keyed POSTs in a TTL-indexed collection.
+
+    A key is scoped to the caller and route. The first request inserts a
+    pending record and runs the handler; duplicates wait for it to finish
+    and get the stored response back without running the handler again.
+    """
+
+    def __init__(self, database, collection: str = "idempotency_keys"):
+        self.collection = database[collection]
+        self._inflight = {}
+        self.replayed = 0
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+
+    async def run(
+        self, key: Optional[str], scope: str, request_hash: str, handler: Callable[[], Awaitable[Any]]
+    ):
+        if key is None:
+            return await handler()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+        record_id = f"{scope}:{key}"
+        owner = await self._acquire(record_id, request_hash)
+        if owner is None:
+            return await self._wait_for(record_id, request_hash)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_id] = future
+        heartbeat = asyncio.create_task(self._heartbeat(record_id, owner))
+        try:
+            response = await handler()
+        except HTTPException as e:
+            # Client errors are part of the answer and replay like successes;
+            # anything else releases the key so a retry can run again.
+            if e.status_code < 500:
+                await self._complete(record_id, owner, e.status_code, {"detail": e.detail})
+            else:
+                await self._release(record_id, owner)
+            future.set_exception(e)
+            future.exception()
+            raise
+        except BaseException as e:
+            await self._release(record_id, owner)
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            await self._complete(record_id, owner, 200, response)
+            future.set_result(response)
+            return response
+        finally:
+            heartbeat.cancel()
+            del self._inflight[record_id]
+
+    def _lock_until(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+
+    async def _acquire(self, record_id: str, request_hash: str) -> Optional[str]:
+        """Returns an owner token, or None if another request holds the key."""
+        now = datetime.now(timezone.utc)
+        owner = uuid.uuid4().hex
+        record = {
+            "_id": record_id,
+            "fingerprint": request_hash,
+            "state": "pending",
+            "owner": owner,
+            "locked_until": self._lock_until(),
+            "created_at": now,
+        }
+        try:
+            await self.collection.insert_one(record)
+            return owner
+        except DuplicateKeyError:
+            pass
+        # Take over a key whose holder died before finishing.
+        stolen = await self.collection.find_one_and_update(
+            {"_id": record_id, "state": "pending", "fingerprint": request_hash, "locked_until": {"$lt": now}},
+            {"$set": {"owner": owner, "locked_until": record["locked_until"]}}
+        )
+        return owner if stolen is not None else None
+
+    async def _heartbeat(self, record_id: str, owner: str):
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LOCK_SECONDS / 3)
+            try:
+                result = await self.collection.update_one(
+                    {"_id": record_id, "owner": owner, "state": "pending"},
+                    {"$set": {"locked_until": self._lock_until()}}
+                )
+            except Exception:
+                logger.exception("Could not renew idempotency lock %s", record_id)
+                continue
+            if not result.matched_count:
+                logger.warning("Idempotency lock %s was taken over while its request ran", record_id)
+                return
+
+    async def _complete(self, record_id: str, owner: str, status_code: int, body: Any):
+        # Only the holder stores its answer; a request whose key was taken
+        # over must not overwrite the new holder's.
+        await self.collection.update_one(
+            {"_id": record_id, "owner": owner},
+            {"$set": {"state": "done", "status_code": status_code, "body": body}}
+        )
+
+    async def _release(self, record_id: str, owner: str):
+        await self.collection.delete_one({"_id": record_id, "owner": owner, "state": "pending"})
+
+    async def _wait_for(self, record_id: str, request_hash: str):
+        # Same worker: share the first request's outcome directly.
+        pending = self._inflight.get(record_id)
+        if pending is not None:
+            record = await self.collection.find_one({"_id": record_id}, {"fingerprint": 1})
+            if record and record["fingerprint"] != request_hash:
+                raise self._mismatch()
+            try:
+                response = await asyncio.shield(pending)
+            except HTTPException:
+                raise
+            except Exception:
+                raise HTTPException(status_code=409, detail="Original request failed; retry")
+            self.replayed += 1
+            return self._replay(200, response)
+
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            record = await self.collection.find_one({"_id": record_id})
+            if record is None:
+                raise HTTPException(status_code=409, detail="Original request failed; retry")
+            if record["fingerprint"] != request_hash:
+                raise self._mismatch()
+            if record["state"] == "done":
+                self.replayed += 1
+                return self._replay(record["status_code"], record["body"])
+            if asyncio.get_running_loop().time() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    def _replay(self, status_code: int, body: Any):
+        response = fast_json(body, status_code=status_code)
+        response.headers[REPLAY_HEADER] = "true"
+        return response
+
+    def _mismatch(self) -> HTTPException:
+        return HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Dict, Hashable, Optional, Set
+
+
+class DataLoader:
+    """Batches and memoizes lookups of one collection by one field.
+
+    Keys requested in the same event-loop tick (e.g. from asyncio.gather or
+    several dependencies resolving together) are fetched with a single $in
+    query. Every result, including "not found", is remembered for the life
+    of the loader, which is one request.
+    """
+
+    def __init__(self, collection, key_field: str = "id", projection: Optional[dict] = None, max_batch_size: int = 500):
+        self.collection = collection
+        self.key_field = key_field
+        self.projection = projection or {"_id": 0}
+        self.max_batch_size = max_batch_size
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._queue: Dict[Hashable, asyncio.Future] = {}
+        # The loop only keeps weak references to tasks.
+        self._dispatches: Set[asyncio.Task] = set()
+
+    def load(self, key: Hashable) -> "asyncio.Future[Optional[dict]]":
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            if not self._queue:
+                # Let the rest of this tick queue its keys before fetching.
+                loop.call_soon(self._schedule_dispatch)
+            self._queue[key] = future
+        return future
+
+    def _schedule_dispatch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self):
+        queue, self._queue = self._queue, {}
+        keys = list(queue)
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = keys[start:start + self.max_batch_size]
+            try:
+                docs = await self.collection.find({self.key_field: {"$in": batch}}, self.projection).to_list(None)
+            except Exception as e:
+                for key in batch:
+                    # A failed fetch is not memoized; a later load retries.
+                    self._cache.pop(key, None)
+                    if not queue[key].done():
+                        queue[key].set_exception(e)
+                continue
+            by_key = {doc.get(self.key_field): doc for doc in docs}
+            for key in batch:
+                if not queue[key].done():
+                    queue[key].set_result(by_key.get(key))
+
+
+class Loaders:
+    """The per-request set of loaders; get one through the `get_loaders` dependency."""
+
+    def __init__(self, database):
+        self.users = DataLoader(database.users)
+        self.providers = DataLoader(database.providers)
+        self.providers_by_user = DataLoader(database.providers, key_field="user_id")
+        self.bookings = DataLoader(database.bookings)
@@ -0,0 +1,268 @@
+"""Providers offering several sub-services, each with its own price and duration.
+
+A provider's `offerings` is a list of {sub_service_id, sub_service_name,
+category_id, price, duration_minutes}. The first offering is mirrored into
+the older top-level sub_service_id / sub_service_name / base_price fields,
+so clients that only know about one service keep working.
+
+Before offerings existed, providers who did more than one kind of job
+registered one account per service. This module finds those duplicates
+and folds them into a single provider:
+
+    python offerings.py backfill            # give legacy providers an offerings list
+    python offerings.py duplicates          # list candidate groups (same name, same city)
+    python offerings.py fold ID ID [ID...]  # fold these providers into one
+
+Two people can share a name in a city, so each group is folded only after
+someone has confirmed it is one person.
+"""
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import earnings
+import ranking
+from catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DURATION_MINUTES = 60
+MAX_OFFERINGS = 20
+
+
+async def build_offering(database, sub_service_id: str, price: float, duration_minutes: int = DEFAULT_DURATION_MINUTES) -> dict:
+    sub_service = await catalog.get_sub_service(database, sub_service_id)
+    if not sub_service:
+        raise ValueError(f"Unknown sub_service_id {sub_service_id}")
+    return {
+        "sub_service_id": sub_service_id,
+        "sub_service_name": sub_service["name"],
+        "category_id": sub_service["category_id"],
+        "price": price,
+        "duration_minutes": duration_minutes,
+    }
+
+
+async def build_offerings(database, requested: List[dict]) -> List[dict]:
+    """Validates {sub_service_id, price, duration_minutes} entries against the catalog."""
+    if not requested:
+        raise ValueError("At least one offering is required")
+    if len(requested) > MAX_OFFERINGS:
+        raise ValueError(f"At most {MAX_OFFERINGS} offerings per provider")
+    offerings = []
+    for item in requested:
+        if any(o["sub_service_id"] == item["sub_service_id"] for o in offerings):
+            raise ValueError(f"sub_service_id {item['sub_service_id']} is offered twice")
+        offerings.append(await build_offering(
+            database, item["sub_service_id"], item["price"], item.get("duration_minutes") or DEFAULT_DURATION_MINUTES
+        ))
+    return offerings
+
+
+async def signup_offerings(database, data) -> List[dict]:
+    """The signup's own sub-service first, then any extra offerings."""
+    return await build_offerings(database, [
+        {"sub_service_id": data.sub_service_id, "price": data.base_price, "duration_minutes": data.duration_minutes},
+        *(o.model_dump() for o in data.offerings)
+    ])
+
+
+def primary_fields(offerings: List[dict]) -> dict:
+    """The legacy single-service fields, taken from the first offering."""
+    first = offerings[0]
+    return {
+        "category_id": first["category_id"],
+        "sub_service_id": first["sub_service_id"],
+        "sub_service_name": first["sub_service_name"],
+        "base_price": first["price"],
+    }
+
+
+def provider_offerings(provider: dict) -> List[dict]:
+    if provider.get("offerings"):
+        return provider["offerings"]
+    # Not backfilled yet.
+    return [{
+        "sub_service_id": provider.get("sub_service_id"),
+        "sub_service_name": provider.get("sub_service_name"),
+        "category_id": provider.get("category_id"),
+        "price": provider.get("base_price"),
+        "duration_minutes": DEFAULT_DURATION_MINUTES,
+    }]
+
+
+def find_offering(provider: dict, sub_service_id: str) -> Optional[dict]:
+    return next((o for o in provider_offerings(provider) if o["sub_service_id"] == sub_service_id), None)
+
+
+async def refresh_names(database, offerings: List[dict]) -> List[dict]:
+    return [{**o, "sub_service_name": await catalog.sub_service_name(database, o["sub_service_id"])} for o in offerings]
+
+
+async def backfill_offerings(database) -> int:
+    """Gives providers from before offerings existed a one-entry list."""
+    result = await database.providers.update_many(
+        {"offerings": {"$exists": False}},
+        [{"$set": {"offerings": [{
+            "sub_service_id": "$sub_service_id",
+            "sub_service_name": "$sub_service_name",
+            "category_id": "$category_id",
+            "price": "$base_price",
+            "duration_minutes": DEFAULT_DURATION_MINUTES,
+        }]}}]
+    )
+    return result.modified_count
+
+
+# ============ FOLDING DUPLICATE ACCOUNTS ============
+
+async def duplicate_groups(database) -> List[dict]:
+    """Providers sharing a name (case and whitespace aside) in the same city."""
+    groups = await database.providers.aggregate([
+        {"$group": {
+            "_id": {"name": {"$toLower": {"$trim": {"input": "$full_name"}}}, "city": "$city"},
+            "count": {"$sum": 1},
+            "providers": {"$push": {
+                "id": "$id", "email": "$email", "sub_service_id": "$sub_service_id",
+                "total_reviews": "$total_reviews", "is_approved": "$is_approved", "created_at": "$created_at"
+            }}
+        }},
+    ]).to_list(None)
+    duplicates = [
+        {"name": g["_id"]["name"], "city": g["_id"]["city"], "providers": g["providers"]}
+        for g in groups if g["count"] > 1
+    ]
+    return sorted(duplicates, key=lambda g: (g["city"] or "", g["name"] or ""))
+
+
+def _normalized_name(provider: dict) -> str:
+    # As duplicate_groups groups them.
+    return (provider.get("full_name") or "").strip().lower()
+
+
+def _survivor(providers: List[dict]) -> dict:
+    # The account customers know best: most reviews, then the oldest.
+    by_age = sorted(providers, key=lambda p: p.get("created_at", ""))
+    return max(by_age, key=lambda p: p.get("total_reviews", 0))
+
+
+def _merged_rank_stats(providers: List[dict]) -> dict:
+    stats = {"completed": 0, "accepted": 0, "rejected": 0}
+    last_completed = [p["rank_stats"]["last_completed_at"] for p in providers if p.get("rank_stats", {}).get("last_completed_at")]
+    for p in providers:
+        for field in stats:
+            stats[field] += p.get("rank_stats", {}).get(field, 0)
+    if last_completed:
+        stats["last_completed_at"] = max(last_completed)
+    return stats
+
+
+async def fold_providers(database, provider_ids: List[str]) -> dict:
+    """Folds several provider accounts of one person into one.
+
+    The survivor takes over every offering, booking, review and earning of
+    the others; their ratings are combined weighted by review count. The
+    folded providers are deleted and their user accounts marked as merged,
+    so signing in with them points at the surviving email. Safe to rerun
+    if interrupted. Only providers `duplicate_groups` would group together
+    (same name and city) can be folded.
+    """
+    providers = await database.providers.find({"id": {"$in": list(provider_ids)}}, {"_id": 0}).to_list(None)
+    if len(providers) < 2:
+        raise ValueError("Need at least two existing providers to fold")
+    if len({(_normalized_name(p), p.get("city")) for p in providers}) > 1:
+        raise ValueError("Only providers with the same name and city can be folded")
+    survivor = _survivor(providers)
+    folded = [p for p in providers if p["id"] != survivor["id"]]
+    folded_ids = [p["id"] for p in folded]
+
+    offerings = list(provider_offerings(survivor))
+    for p in folded:
+        for offering in provider_offerings(p):
+            if offering["sub_service_id"] and not any(o["sub_service_id"] == offering["sub_service_id"] for o in offerings):
+                offerings.append(offering)
+    if len(offerings) > MAX_OFFERINGS:
+        raise ValueError(f"Folding gives {len(offerings)} offerings; at most {MAX_OFFERINGS} per provider")
+    total_reviews = sum(p.get("total_reviews", 0) for p in providers)
+    rating = (
+        sum(p.get("rating", 0) * p.get("total_reviews", 0) for p in providers) / total_reviews
+        if total_reviews else survivor.get("rating", 0.0)
+    )
+    merged = {
+        "offerings": offerings,
+        **primary_fields(offerings),
+        "rating": round(rating, 1),
+        "total_reviews": total_reviews,
+        "experience": max(p.get("experience", 0) for p in providers),
+        "is_online": any(p.get("is_online") for p in providers),
+        "rank_stats": _merged_rank_stats(providers),
+    }
+    merged["rank_score"] = ranking.compute_score({**survivor, **merged})
+    # The guard makes a rerun skip the merge it already applied.
+    await database.providers.update_one(
+        {"id": survivor["id"], "city": survivor.get("city"), "folded_ids": {"$nin": folded_ids}},
+        {"$set": merged, "$addToSet": {"folded_ids": {"$each": folded_ids}}}
+    )
+
+    repoint = {"$set": {"provider_id": survivor["id"], "provider_name": survivor["full_name"]}}
+    await database.bookings.update_many({"provider_id": {"$in": folded_ids}}, repoint)
+    await database.bookings_archive.update_many({"provider_id": {"$in": folded_ids}}, repoint)
+    await database.reviews.update_many({"provider_id": {"$in": folded_ids}}, {"$set": {"provider_id": survivor["id"]}})
+
+    for doc in await database.booking_archive_stats.find({"_id": {"$in": folded_ids}}).to_list(None):
+        inc = {"total": doc.get("total", 0), "revenue": doc.get("revenue", 0)}
+        inc.update({f"counts.{status}": n for status, n in doc.get("counts", {}).items()})
+        await database.booking_archive_stats.update_one({"_id": survivor["id"]}, {"$inc": inc}, upsert=True)
+        await database.booking_archive_stats.delete_one({"_id": doc["_id"]})
+    await database.provider_earnings.delete_many({"provider_id": {"$in": folded_ids}})
+    await earnings.rebuild_ledger(database, survivor["id"])
+
+    survivor_user = await database.users.find_one({"id": survivor["user_id"]}, {"_id": 0, "email": 1})
+    await database.users.update_many(
+        {"id": {"$in": [p["user_id"] for p in folded]}},
+        {"$set": {
+            "merged_into": survivor["user_id"],
+            "merged_into_email": survivor_user["email"] if survivor_user else survivor.get("email"),
+            "merged_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    await database.providers.delete_many({"id": {"$in": folded_ids}})
+    logger.info("Folded %s into provider %s", ", ".join(folded_ids), survivor["id"])
+    return {
+        "provider_id": survivor["id"],
+        "folded": folded_ids,
+        "offerings": [o["sub_service_id"] for o in offerings],
+        "total_reviews": total_reviews,
+    }
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Provider offerings maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("backfill")
+    sub.add_parser("duplicates")
+    fold = sub.add_parser("fold")
+    fold.add_argument("ids", nargs="+")
+    args = parser.parse_args()
+
+    from database import db, close_clients
+    try:
+        await catalog.load(db)
+        if args.command == "backfill":
+            result = {"backfilled": await backfill_offerings(db)}
+        elif args.command == "duplicates":
+            result = await duplicate_groups(db)
+        else:
+            await backfill_offerings(db)
+            result = await fold_providers(db, args.ids)
+        print(json.dumps(result, indent=2, default=str))
+    finally:
+        close_clients()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,38 @@
+import base64
+import json
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_value, doc_id: str) -> str:
+    raw = json.dumps([sort_value, doc_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, doc_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(cursor: Optional[str], sort_field: str = "created_at") -> dict:
+    """Filter selecting documents after `cursor` in (sort_field desc, id desc) order."""
+    if not cursor:
+        return {}
+    sort_value, doc_id = decode_cursor(cursor)
+    return {"$or": [
+        {sort_field: {"$lt": sort_value}},
+        {sort_field: sort_value, "id": {"$lt": doc_id}}
+    ]}
+
+
+def page_of(docs: list, limit: int, sort_field: str = "created_at") -> dict:
+    """Trims a limit + 1 fetch to one page and derives the next cursor."""
+    has_more = len(docs) > limit
+    items = docs[:limit]
+    next_cursor = encode_cursor(items[-1][sort_field], items[-1]["id"]) if has_more and items else None
+    return {"items": items, "next_cursor": next_cursor}
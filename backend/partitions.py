@@ -0,0 +1,871 @@
+"""City-partitioned routing for the providers and bookings collections.
+
+Cities are independent workloads, so each can live in its own partition:
+a database on the main cluster or on a cluster of its own. Partitions are
+configured with MONGO_PARTITIONS, e.g.
+
+    {"west": {"db": "vokzo_west"}, "metro": {"url": "mongodb://metro-host", "db": "vokzo"}}
+
+and the `partition_map` collection assigns cities to them; unmapped cities
+(and documents without a city) live in the "default" partition, the main
+database. With no partitions configured nothing is wrapped and every query
+goes straight to the main database.
+
+Queries whose filter (or whose documents, for inserts) name the city go to
+that city's partition only. Everything else fans out to all partitions and
+the results are merged; aggregations are split into a per-partition part
+and a merge part, the same way mongos does it. Only finished-shape stages
+can be merged in Python ($group with $sum/$min/$max/$first/$last/$push/
+$addToSet, $count, $sort, $limit, $skip, $facet and plain $project); other
+pipelines must be routed by city.
+
+Cities move between partitions online:
+
+    python partitions.py status
+    python partitions.py move Mumbai metro
+    python partitions.py abort Mumbai
+
+A move copies the city while it keeps serving, then blocks its writes for
+a few seconds (503 with Retry-After) while the changes made during the copy
+are synced, flips the map and deletes the old copy.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import DeleteOne, InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT = "default"
+PARTITIONED_COLLECTIONS = ("providers", "bookings")
+PARTITION_MAP_COLLECTION = "partition_map"
+
+# How long a worker trusts its copy of the city map. Moves wait longer
+# than this between steps so every worker has seen the previous one.
+MAP_TTL_SECONDS = float(os.environ.get('PARTITION_MAP_TTL_SECONDS', 5))
+MOVE_BATCH_SIZE = int(os.environ.get('PARTITION_MOVE_BATCH_SIZE', 500))
+MOVE_RETRY_AFTER_SECONDS = 5
+
+# Stages that work on each document independently and so can run inside
+# every partition before the results are combined.
+STREAMING_STAGES = {"$match", "$project", "$addFields", "$set", "$unset", "$unionWith", "$lookup", "$unwind"}
+MERGEABLE_ACCUMULATORS = {"$sum", "$min", "$max", "$first", "$last", "$push", "$addToSet"}
+
+
+class PartitionMoving(Exception):
+    """A write touched a city whose partition is being switched."""
+
+    def __init__(self, city: str):
+        super().__init__(f"{city} is moving between partitions")
+        self.city = city
+        self.retry_after = MOVE_RETRY_AFTER_SECONDS
+
+
+class PartitionQueryError(ValueError):
+    """A query or write that cannot be answered across partitions."""
+
+
+def parse_config(raw: str) -> Dict[str, dict]:
+    config = json.loads(raw) if raw.strip() else {}
+    for name, spec in config.items():
+        if name == DEFAULT or not spec.get("db"):
+            raise ValueError(f"MONGO_PARTITIONS: partition {name!r} needs a db and may not be called {DEFAULT!r}")
+    return config
+
+
+# ============ QUERY HELPERS ============
+
+def _cities(query: Optional[dict]) -> Optional[list]:
+    """Cities a filter is restricted to, or None when it could match any."""
+    if not query or "city" not in query:
+        return None
+    value = query["city"]
+    if isinstance(value, dict):
+        if set(value) == {"$in"}:
+            return list(value["$in"])
+        if set(value) == {"$eq"}:
+            return [value["$eq"]]
+        return None
+    return [value]
+
+
+def _upsert_cities(query: dict, update) -> Optional[list]:
+    cities = _cities(query)
+    if cities is None and isinstance(update, dict):
+        for op in ("$set", "$setOnInsert"):
+            if "city" in update.get(op, {}):
+                return [update[op]["city"]]
+        if "city" in update and not any(k.startswith("$") for k in update):
+            return [update["city"]]
+    return cities
+
+
+def _and(query: Optional[dict], extra: Optional[dict]) -> dict:
+    if not extra:
+        return query or {}
+    if not query:
+        return extra
+    return {"$and": [query, extra]}
+
+
+def _get(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _sort_docs(docs: list, sort: List[tuple]) -> list:
+    # Stable sorts from the last key to the first; None sorts lowest, as in Mongo.
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda d: (_get(d, field) is not None, _get(d, field)), reverse=direction < 0)
+    return docs
+
+
+def _normalize_sort(key_or_list, direction=None) -> List[tuple]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [tuple(item) for item in key_or_list]
+
+
+# ============ AGGREGATION SPLITTING ============
+
+def split_pipeline(pipeline: list) -> tuple:
+    """Splits a pipeline into the part each partition runs and the merge steps.
+
+    Merge steps are (kind, argument) tuples applied by `merge_results`.
+    """
+    shard, merge = [], []
+    stages = list(pipeline)
+    i = 0
+    while i < len(stages):
+        stage = stages[i]
+        (name, spec), = stage.items()
+        if name in STREAMING_STAGES and not merge:
+            shard.append(stage)
+        elif merge:
+            # After a blocking stage a group, a count or the next page can
+            # span partitions, so everything else, $limit included, runs
+            # on the merged result only.
+            merge.append(_python_stage(name, spec))
+        elif name == "$group":
+            for field, acc in spec.items():
+                if field != "_id" and next(iter(acc)) not in MERGEABLE_ACCUMULATORS:
+                    raise PartitionQueryError(f"{next(iter(acc))} cannot be merged across partitions")
+            shard.append(stage)
+            merge.append(("group", spec))
+        elif name == "$count":
+            shard.append(stage)
+            merge.append(("count", spec))
+        elif name == "$sort":
+            shard.append(stage)
+            merge.append(("sort", list(spec.items())))
+            if i + 1 < len(stages) and "$limit" in stages[i + 1]:
+                i += 1
+                shard.append(stages[i])
+                merge.append(("limit", stages[i]["$limit"]))
+        elif name == "$limit":
+            shard.append(stage)
+            merge.append(("limit", spec))
+        elif name == "$skip":
+            merge.append(("skip", spec))
+        elif name == "$facet":
+            facets = {key: split_pipeline(sub) for key, sub in spec.items()}
+            shard.append({"$facet": {key: s for key, (s, _) in facets.items()}})
+            merge.append(("facet", {key: m for key, (_, m) in facets.items()}))
+        else:
+            raise PartitionQueryError(f"{name} cannot be merged across partitions; filter by city")
+        i += 1
+    return shard, merge
+
+
+def _python_stage(name: str, spec) -> tuple:
+    if name == "$sort":
+        return ("sort", list(spec.items()))
+    if name in ("$limit", "$skip"):
+        return (name[1:], spec)
+    if name == "$project" and all(v in (0, 1, True, False) for v in spec.values()):
+        return ("project", spec)
+    raise PartitionQueryError(f"{name} after a blocking stage cannot be merged across partitions")
+
+
+def _merge_group(docs: list, spec: dict) -> list:
+    groups = {}
+    for doc in docs:
+        key = _freeze(doc.get("_id"))
+        merged = groups.get(key)
+        if merged is None:
+            groups[key] = dict(doc)
+            continue
+        for field, acc in spec.items():
+            if field == "_id":
+                continue
+            op = next(iter(acc))
+            mine, theirs = merged.get(field), doc.get(field)
+            if op == "$sum":
+                merged[field] = (mine or 0) + (theirs or 0)
+            elif op in ("$min", "$max"):
+                present = [v for v in (mine, theirs) if v is not None]
+                merged[field] = (min if op == "$min" else max)(present) if present else None
+            elif op == "$last":
+                merged[field] = theirs
+            elif op == "$push":
+                merged[field] = (mine or []) + (theirs or [])
+            elif op == "$addToSet":
+                mine = mine or []
+                merged[field] = mine + [v for v in theirs or [] if v not in mine]
+    return list(groups.values())
+
+
+def merge_results(docs: list, steps: list) -> list:
+    for kind, arg in steps:
+        if kind == "group":
+            docs = _merge_group(docs, arg)
+        elif kind == "count":
+            docs = [{arg: sum(d[arg] for d in docs)}] if docs else []
+        elif kind == "sort":
+            docs = _sort_docs(docs, arg)
+        elif kind == "limit":
+            docs = docs[:arg]
+        elif kind == "skip":
+            docs = docs[arg:]
+        elif kind == "project":
+            if any(arg.values()):
+                keep = {k for k, v in arg.items() if v} | ({"_id"} if arg.get("_id", 1) else set())
+                docs = [{k: v for k, v in d.items() if k in keep} for d in docs]
+            else:
+                docs = [{k: v for k, v in d.items() if k not in arg} for d in docs]
+        elif kind == "facet":
+            # Each partition returns one document holding every facet.
+            docs = [{
+                key: merge_results([item for d in docs for item in d.get(key, [])], sub)
+                for key, sub in arg.items()
+            }]
+    return docs
+
+
+# ============ ROUTER ============
+
+class PartitionRouter:
+    """Knows the partitions and which city lives where."""
+
+    def __init__(self):
+        # partition -> role ("primary", "secondary", "analytics") -> database
+        self.handles: Dict[str, Dict[str, object]] = {}
+        self._map: Dict[str, dict] = {}
+        self._loaded_at = float("-inf")
+
+    def add(self, name: str, primary, secondary, analytics):
+        self.handles[name] = {"primary": primary, "secondary": secondary, "analytics": analytics}
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.handles) > 1
+
+    def wrap(self, database, role: str):
+        return PartitionedDatabase(database, self, role) if self.enabled else database
+
+    @property
+    def map_collection(self):
+        return self.handles[DEFAULT]["primary"][PARTITION_MAP_COLLECTION]
+
+    async def city_map(self, refresh: bool = False) -> Dict[str, dict]:
+        if refresh or time.monotonic() - self._loaded_at > MAP_TTL_SECONDS:
+            docs = await self.map_collection.find({}).to_list(None)
+            self._map = {d["_id"]: d for d in docs}
+            self._loaded_at = time.monotonic()
+        return self._map
+
+    def _owner(self, entry: dict) -> str:
+        name = entry.get("partition", DEFAULT)
+        if name not in self.handles:
+            raise RuntimeError(f"partition_map points {entry['_id']} at unconfigured partition {name!r}")
+        return name
+
+    async def route(self, collection: str, query: Optional[dict], write: bool = False) -> Dict[str, dict]:
+        """Partition name -> the filter to run there."""
+        city_map = await self.city_map()
+        cities = _cities(query)
+        if cities is not None:
+            groups = {}
+            for city in cities:
+                entry = city_map.get(city, {"_id": city})
+                if write and entry.get("state") == "frozen":
+                    raise PartitionMoving(city)
+                groups.setdefault(self._owner(entry), []).append(city)
+            if len(groups) == 1:
+                return {name: query for name in groups}
+            return {name: {**query, "city": {"$in": cs}} for name, cs in groups.items()}
+
+        if write:
+            await self._guard_frozen(collection, query, city_map)
+        # While a city is being copied in, or its old copy is being
+        # deleted, a partition holds documents it does not own.
+        return {
+            name: _and(query, self._strays(name, city_map))
+            for name in self.handles
+        }
+
+    def _strays(self, name: str, city_map: dict) -> Optional[dict]:
+        strays = [
+            city for city, entry in city_map.items()
+            if entry.get("partition", DEFAULT) != name and name in (entry.get("moving_to"), entry.get("moved_from"))
+        ]
+        return {"city": {"$nin": strays}} if strays else None
+
+    async def _guard_frozen(self, collection: str, query: Optional[dict], city_map: dict):
+        frozen = {city: entry for city, entry in city_map.items() if entry.get("state") == "frozen"}
+        if not frozen:
+            return
+        for name in {self._owner(entry) for entry in frozen.values()}:
+            hit = await self.handles[name]["primary"][collection].find_one(
+                _and(query, {"city": {"$in": list(frozen)}}), {"_id": 0, "city": 1}
+            )
+            if hit:
+                raise PartitionMoving(hit["city"])
+
+    async def partition_for_doc(self, doc: dict) -> str:
+        entry = (await self.city_map()).get(doc.get("city"), {"_id": doc.get("city")})
+        if entry.get("state") == "frozen":
+            raise PartitionMoving(doc.get("city"))
+        return self._owner(entry)
+
+    async def status(self) -> dict:
+        city_map = await self.city_map(refresh=True)
+        partitions = {}
+        for name, roles in self.handles.items():
+            partitions[name] = {
+                "database": roles["primary"].name,
+                "counts": {
+                    c: await roles["primary"][c].estimated_document_count() for c in PARTITIONED_COLLECTIONS
+                },
+            }
+        cities = [{k if k != "_id" else "city": v for k, v in entry.items()} for entry in city_map.values()]
+        return {"partitions": partitions, "cities": sorted(cities, key=lambda c: c["city"])}
+
+
+# ============ DATABASE AND COLLECTION FACADES ============
+
+class PartitionedDatabase:
+    """A database handle whose providers and bookings are routed by city."""
+
+    def __init__(self, database, router: PartitionRouter, role: str):
+        self._database = database
+        self._router = router
+        self._role = role
+
+    def __getattr__(self, name):
+        if name in PARTITIONED_COLLECTIONS:
+            return PartitionedCollection(self._router, name, self._role)
+        return getattr(self._database, name)
+
+    def __getitem__(self, name):
+        if name in PARTITIONED_COLLECTIONS:
+            return PartitionedCollection(self._router, name, self._role)
+        return self._database[name]
+
+
+class PartitionedCollection:
+    """The subset of the Motor collection API the app uses, routed by city."""
+
+    def __init__(self, router: PartitionRouter, name: str, role: str):
+        self._router = router
+        self.name = name
+        self._role = role
+
+    def _collection(self, partition: str):
+        return self._router.handles[partition][self._role][self.name]
+
+    async def _each(self, routes: Dict[str, dict], method: str, *args, **kwargs) -> Dict[str, object]:
+        names = list(routes)
+        results = await asyncio.gather(*(
+            getattr(self._collection(name), method)(routes[name], *args, **kwargs) for name in names
+        ))
+        return dict(zip(names, results))
+
+    # ---------- reads ----------
+
+    def find(self, filter=None, projection=None, **kwargs) -> "PartitionedCursor":
+        return PartitionedCursor(self, filter or {}, projection, kwargs)
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        routes = await self._router.route(self.name, filter or {})
+        for doc in (await self._each(routes, "find_one", projection, **kwargs)).values():
+            if doc is not None:
+                return doc
+        return None
+
+    async def count_documents(self, filter, **kwargs) -> int:
+        routes = await self._router.route(self.name, filter)
+        total = sum((await self._each(routes, "count_documents", **kwargs)).values())
+        return min(total, kwargs["limit"]) if kwargs.get("limit") else total
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        counts = await asyncio.gather(*(
+            self._collection(name).estimated_document_count(**kwargs) for name in self._router.handles
+        ))
+        return sum(counts)
+
+    async def distinct(self, key: str, filter=None, **kwargs) -> list:
+        routes = await self._router.route(self.name, filter or {})
+        found = await asyncio.gather(*(
+            self._collection(name).distinct(key, query, **kwargs) for name, query in routes.items()
+        ))
+        values = []
+        for batch in found:
+            values.extend(v for v in batch if v not in values)
+        return values
+
+    def aggregate(self, pipeline: list, **kwargs) -> "PartitionedAggregate":
+        return PartitionedAggregate(self, pipeline, kwargs)
+
+    # ---------- writes ----------
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        partition = await self._router.partition_for_doc(document)
+        return await self._collection(partition).insert_one(document, **kwargs)
+
+    async def insert_many(self, documents: list, ordered: bool = True, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        groups: Dict[str, List[int]] = {}
+        for index, doc in enumerate(documents):
+            groups.setdefault(await self._router.partition_for_doc(doc), []).append(index)
+        errors = []
+        for name, indexes in groups.items():
+            try:
+                await self._collection(name).insert_many([documents[i] for i in indexes], ordered=ordered, **kwargs)
+            except BulkWriteError as e:
+                errors.extend({**err, "index": indexes[err["index"]]} for err in e.details["writeErrors"])
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": sorted(errors, key=lambda err: err["index"]), "writeConcernErrors": [],
+                                  "nInserted": len(documents) - len(errors), "nUpserted": 0, "nMatched": 0,
+                                  "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult([doc.get("_id") for doc in documents], True)
+
+    async def _update(self, method: str, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        if upsert:
+            cities = _upsert_cities(filter, update)
+            if cities is None or len(cities) != 1:
+                raise PartitionQueryError("Upserts into a partitioned collection must name one city")
+            partition = await self._router.partition_for_doc({"city": cities[0]})
+            return await getattr(self._collection(partition), method)(filter, update, upsert=True, **kwargs)
+        routes = await self._router.route(self.name, filter, write=True)
+        results = list((await self._each(routes, method, update, **kwargs)).values())
+        if len(results) == 1:
+            return results[0]
+        return UpdateResult({
+            "n": sum(r.matched_count for r in results),
+            "nModified": sum(r.modified_count for r in results),
+        }, True)
+
+    async def update_one(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update("update_one", filter, update, upsert, **kwargs)
+
+    async def update_many(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update("update_many", filter, update, upsert, **kwargs)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update("replace_one", filter, replacement, upsert, **kwargs)
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return await self._delete("delete_one", filter, **kwargs)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return await self._delete("delete_many", filter, **kwargs)
+
+    async def _delete(self, method: str, filter: dict, **kwargs) -> DeleteResult:
+        routes = await self._router.route(self.name, filter, write=True)
+        results = (await self._each(routes, method, **kwargs)).values()
+        return DeleteResult({"n": sum(r.deleted_count for r in results)}, True)
+
+    async def find_one_and_update(self, filter: dict, update, **kwargs):
+        if kwargs.get("upsert"):
+            raise PartitionQueryError("Upserts into a partitioned collection must go through update_one")
+        # Fanned out, this is only meaningful for filters matching one
+        # document overall (e.g. by id), which is how the app uses it.
+        routes = await self._router.route(self.name, filter, write=True)
+        for doc in (await self._each(routes, "find_one_and_update", update, **kwargs)).values():
+            if doc is not None:
+                return doc
+        return None
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        requests = list(requests)
+        city_map = await self._router.city_map()
+        groups: Dict[str, List[int]] = {name: [] for name in self._router.handles}
+        fanned_out = False
+        for index, op in enumerate(requests):
+            if isinstance(op, InsertOne):
+                groups[await self._router.partition_for_doc(op._doc)].append(index)
+                continue
+            cities = _cities(op._filter)
+            if cities is not None and len(cities) == 1:
+                groups[await self._router.partition_for_doc({"city": cities[0]})].append(index)
+            elif getattr(op, "_upsert", False):
+                raise PartitionQueryError("Upserts into a partitioned collection must name one city")
+            else:
+                fanned_out = True
+                for indexes in groups.values():
+                    indexes.append(index)
+        if fanned_out and any(entry.get("state") == "frozen" for entry in city_map.values()):
+            # Checking every fanned-out statement is not worth it for a
+            # window of a few seconds.
+            frozen = next(city for city, entry in city_map.items() if entry.get("state") == "frozen")
+            raise PartitionMoving(frozen)
+
+        totals = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        # Partitions are written one after another; `ordered` applies
+        # within each of them.
+        for name, indexes in groups.items():
+            if not indexes:
+                continue
+            try:
+                result = await self._collection(name).bulk_write([requests[i] for i in indexes], ordered=ordered, **kwargs)
+                raw = result.bulk_api_result
+            except BulkWriteError as e:
+                raw = e.details
+            for field in ("nInserted", "nUpserted", "nMatched", "nModified", "nRemoved"):
+                totals[field] += raw.get(field, 0)
+            totals["upserted"].extend({**u, "index": indexes[u["index"]]} for u in raw.get("upserted", []))
+            totals["writeErrors"].extend({**err, "index": indexes[err["index"]]} for err in raw.get("writeErrors", []))
+            totals["writeConcernErrors"].extend(raw.get("writeConcernErrors", []))
+        if totals["writeErrors"] or totals["writeConcernErrors"]:
+            totals["writeErrors"].sort(key=lambda err: err["index"])
+            raise BulkWriteError(totals)
+        return BulkWriteResult(totals, True)
+
+    # ---------- indexes ----------
+
+    async def create_indexes(self, indexes: list, **kwargs) -> list:
+        names = await asyncio.gather(*(
+            self._collection(name).create_indexes(indexes, **kwargs) for name in self._router.handles
+        ))
+        return names[0]
+
+    async def create_index(self, keys, **kwargs) -> str:
+        names = await asyncio.gather(*(
+            self._collection(name).create_index(keys, **kwargs) for name in self._router.handles
+        ))
+        return names[0]
+
+
+class PartitionedCursor:
+    def __init__(self, collection: PartitionedCollection, filter: dict, projection, kwargs: dict):
+        self._collection = collection
+        self._filter = filter
+        self._projection = projection
+        self._kwargs = kwargs
+        self._sort: Optional[List[tuple]] = None
+        self._limit = 0
+        self._skip = 0
+
+    def sort(self, key_or_list, direction=None) -> "PartitionedCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def limit(self, limit: int) -> "PartitionedCursor":
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int) -> "PartitionedCursor":
+        self._skip = skip
+        return self
+
+    def _merge_projection(self) -> tuple:
+        """The projection to send, plus fields added only so we can sort."""
+        projection = self._projection
+        if not self._sort or not isinstance(projection, dict) or not any(v for k, v in projection.items() if k != "_id"):
+            return projection, []
+        added = [field for field, _ in self._sort if field not in projection]
+        return {**projection, **{field: 1 for field in added}}, added
+
+    async def _cursors(self, merging: bool = False) -> list:
+        routes = await self._collection._router.route(self._collection.name, self._filter)
+        single = len(routes) == 1
+        projection, _ = (self._projection, []) if single or not merging else self._merge_projection()
+        cursors = []
+        for name, query in routes.items():
+            cursor = self._collection._collection(name).find(query, projection, **self._kwargs)
+            if self._sort:
+                cursor = cursor.sort(self._sort)
+            if single:
+                cursor = cursor.skip(self._skip).limit(self._limit)
+            elif self._limit:
+                cursor = cursor.limit(self._skip + self._limit)
+            cursors.append(cursor)
+        return cursors
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        cursors = await self._cursors(merging=True)
+        if len(cursors) == 1:
+            return await cursors[0].to_list(length)
+        cap = min(n for n in (self._limit, length) if n) if (self._limit or length) else None
+        batches = await asyncio.gather(*(c.to_list(self._skip + cap if cap else None) for c in cursors))
+        docs = [doc for batch in batches for doc in batch]
+        if self._sort:
+            docs = _sort_docs(docs, self._sort)
+        docs = docs[self._skip:]
+        if cap:
+            docs = docs[:cap]
+        _, added = self._merge_projection()
+        for doc in docs:
+            for field in added:
+                doc.pop(field, None)
+        return docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        if self._sort:
+            # Sorted fan-out has to see every partition's results first.
+            cursors = await self._cursors(merging=True)
+            if len(cursors) > 1:
+                for doc in await self.to_list(None):
+                    yield doc
+                return
+        else:
+            cursors = await self._cursors()
+        skipped = yielded = 0
+        for cursor in cursors:
+            async for doc in cursor:
+                if len(cursors) > 1 and skipped < self._skip:
+                    skipped += 1
+                    continue
+                yield doc
+                yielded += 1
+                if len(cursors) > 1 and self._limit and yielded >= self._limit:
+                    return
+
+
+class PartitionedAggregate:
+    """Runs a pipeline in every partition it needs and merges the results.
+
+    Pipelines that union in an unpartitioned collection (bookings_archive)
+    always include the default partition, the only one holding it.
+    """
+
+    def __init__(self, collection: PartitionedCollection, pipeline: list, kwargs: dict):
+        self._collection = collection
+        self._pipeline = list(pipeline)
+        self._kwargs = kwargs
+
+    async def _plan(self) -> Dict[str, list]:
+        router = self._collection._router
+        first = self._pipeline[0] if self._pipeline else {}
+        match = first.get("$match")
+        routes = await router.route(self._collection.name, match if match is not None else {})
+        if any("$unionWith" in stage for stage in self._pipeline) and DEFAULT not in routes:
+            routes[DEFAULT] = _and(match, router._strays(DEFAULT, await router.city_map()))
+        rest = self._pipeline[1:] if match is not None else self._pipeline
+        return {
+            name: ([{"$match": query}] if query else []) + rest
+            for name, query in routes.items()
+        }
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        plans = await self._plan()
+        if not plans:
+            return []
+        if len(plans) == 1:
+            (name, pipeline), = plans.items()
+            return await self._collection._collection(name).aggregate(pipeline, **self._kwargs).to_list(length)
+        shard_plans, merges = {}, None
+        for name, pipeline in plans.items():
+            shard_plans[name], merges = split_pipeline(pipeline)
+        batches = await asyncio.gather(*(
+            self._collection._collection(name).aggregate(pipeline, **self._kwargs).to_list(None)
+            for name, pipeline in shard_plans.items()
+        ))
+        docs = merge_results([doc for batch in batches for doc in batch], merges)
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        plans = await self._plan()
+        if len(plans) == 1:
+            (name, pipeline), = plans.items()
+            async for doc in self._collection._collection(name).aggregate(pipeline, **self._kwargs):
+                yield doc
+            return
+        for doc in await self.to_list(None):
+            yield doc
+
+
+# ============ MOVING CITIES ============
+
+async def _set_entry(router: PartitionRouter, city: str, fields: dict, unset: tuple = ()):
+    update = {"$set": {**fields, "updated_at": datetime.now(timezone.utc).isoformat()}}
+    if unset:
+        update["$unset"] = {field: "" for field in unset}
+    await router.map_collection.update_one({"_id": city}, update, upsert=True)
+    await router.city_map(refresh=True)
+
+
+async def _wait_for_workers():
+    # Every worker reloads the map within MAP_TTL_SECONDS.
+    await asyncio.sleep(MAP_TTL_SECONDS + 1)
+
+
+async def _sync(source, target, city: str, batch_size: int) -> int:
+    """Makes target's documents for the city equal to source's; returns writes made."""
+    written = 0
+    last_id = None
+    while True:
+        query = {"city": city, **({"id": {"$gt": last_id}} if last_id else {})}
+        batch = await source.find(query).sort("id", 1).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["id"]
+        existing = {
+            doc["id"]: doc
+            for doc in await target.find({"id": {"$in": [d["id"] for d in batch]}}).to_list(None)
+        }
+        ops = [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in batch if existing.get(doc["id"]) != doc]
+        if ops:
+            await target.bulk_write(ops, ordered=False)
+            written += len(ops)
+
+    # Documents deleted from the source since the last pass.
+    last_id = None
+    while True:
+        query = {"city": city, **({"id": {"$gt": last_id}} if last_id else {})}
+        batch = await target.find(query, {"id": 1}).sort("id", 1).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["id"]
+        ids = [d["id"] for d in batch]
+        kept = {d["id"] for d in await source.find({"id": {"$in": ids}}, {"id": 1}).to_list(None)}
+        ops = [DeleteOne({"id": i}) for i in ids if i not in kept]
+        if ops:
+            await target.bulk_write(ops, ordered=False)
+            written += len(ops)
+    return written
+
+
+async def check_move(router: PartitionRouter, city: str, target: str) -> dict:
+    """Validates a move up front; returns the city's current map entry."""
+    if target not in router.handles:
+        raise ValueError(f"Unknown partition {target!r}")
+    entry = (await router.city_map(refresh=True)).get(city, {"_id": city})
+    moving_to = entry.get("moving_to")
+    if moving_to and moving_to != target:
+        raise ValueError(f"{city} is already moving to {moving_to}")
+    if entry.get("moved_from"):
+        raise ValueError(f"{city} is still being cleaned up from {entry['moved_from']}")
+    return entry
+
+
+async def move_city(router: PartitionRouter, city: str, target: str, batch_size: int = MOVE_BATCH_SIZE) -> dict:
+    """Moves a city's providers and bookings to another partition while it keeps serving.
+
+    Safe to rerun after a crash: each step is idempotent and the map entry
+    records how far it got.
+    """
+    entry = await check_move(router, city, target)
+    source = entry.get("partition", DEFAULT)
+    if source == target:
+        return {"city": city, "partition": target, "copied": {}, "synced": {}}
+    started = time.monotonic()
+
+    # 1. Copy while the city keeps taking writes in its old partition.
+    await _set_entry(router, city, {"partition": source, "state": "copying", "moving_to": target})
+    await _wait_for_workers()
+    copied = {}
+    for name in PARTITIONED_COLLECTIONS:
+        copied[name] = await _sync(
+            router.handles[source]["primary"][name], router.handles[target]["primary"][name], city, batch_size
+        )
+
+    # 2. Block writes and catch up with what changed during the copy.
+    await _set_entry(router, city, {"state": "frozen"})
+    await _wait_for_workers()
+    synced = {}
+    for name in PARTITIONED_COLLECTIONS:
+        synced[name] = await _sync(
+            router.handles[source]["primary"][name], router.handles[target]["primary"][name], city, batch_size
+        )
+
+    # 3. Switch, and drop the old copy once no worker reads it any more.
+    await _set_entry(router, city, {"partition": target, "state": "active", "moved_from": source}, unset=("moving_to",))
+    await _wait_for_workers()
+    for name in PARTITIONED_COLLECTIONS:
+        await router.handles[source]["primary"][name].delete_many({"city": city})
+    await _set_entry(router, city, {}, unset=("moved_from",))
+    logger.info("Moved %s from %s to %s in %.1fs", city, source, target, time.monotonic() - started)
+    return {"city": city, "from": source, "partition": target, "copied": copied, "synced": synced}
+
+
+async def abort_move(router: PartitionRouter, city: str) -> dict:
+    """Cancels an unfinished move; the city stays where it was."""
+    entry = (await router.city_map(refresh=True)).get(city)
+    if not entry or not entry.get("moving_to"):
+        raise ValueError(f"{city} is not being moved")
+    target = entry["moving_to"]
+    await _set_entry(router, city, {"state": "active"})
+    await _wait_for_workers()
+    for name in PARTITIONED_COLLECTIONS:
+        await router.handles[target]["primary"][name].delete_many({"city": city})
+    await _set_entry(router, city, {}, unset=("moving_to",))
+    return {"city": city, "partition": entry.get("partition", DEFAULT)}
+
+
+partition_router = PartitionRouter()
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Inspect partitions and move cities between them")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    move = sub.add_parser("move")
+    move.add_argument("city")
+    move.add_argument("partition")
+    move.add_argument("--batch-size", type=int, default=MOVE_BATCH_SIZE)
+    abort = sub.add_parser("abort")
+    abort.add_argument("city")
+    args = parser.parse_args()
+
+    # Run as a script this module is __main__, whose partition_router is a
+    # separate, empty object; database.py registers the partitions on the
+    # one in the importable `partitions` module.
+    from database import close_clients
+    from partitions import partition_router
+    try:
+        if args.command == "status":
+            result = await partition_router.status()
+        elif args.command == "move":
+            result = await move_city(partition_router, args.city, args.partition, args.batch_size)
+        else:
+            result = await abort_move(partition_router, args.city)
+        print(json.dumps(result, indent=2, default=str))
+    finally:
+        close_clients()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,304 @@
+"""Bulk provider onboarding from CSV or NDJSON.
+
+Rows are validated with the signup model, passwords are hashed in a
+process pool across all cores, and users and providers are written with
+insert_many. The result is a per-row report; valid rows are imported even
+when others fail.
+
+Hashing a large file takes minutes, so the admin endpoint runs the import
+as a background job and records its progress and report in
+provider_imports, where any worker can answer the status request.
+
+    python provider_import.py providers.csv [--format ndjson] [--approve] [--dry-run]
+
+CSV files need a header row with the ProviderSignup field names. Extra
+offerings beyond sub_service_id need NDJSON, as a list under "offerings".
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from passlib.context import CryptContext
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+import ranking
+from catalog import catalog
+from offerings import signup_offerings
+
+logger = logging.getLogger(__name__)
+
+HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', os.cpu_count() or 1))
+# Passwords per pool task; large enough to amortize pickling, small enough
+# to keep every core busy until the end.
+HASH_CHUNK_SIZE = 32
+INSERT_BATCH_SIZE = 1000
+MAX_IMPORT_ROWS = int(os.environ.get('MAX_IMPORT_ROWS', 20000))
+
+FORMATS = ("csv", "ndjson")
+JOBS_COLLECTION = "provider_imports"
+
+_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_hash_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _hash_chunk(passwords: List[str]) -> List[str]:
+    # Runs in a pool worker.
+    return [_pwd_context.hash(p) for p in passwords]
+
+
+def hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        # Forking a worker that already runs Motor's threads can leave the
+        # children holding locks no thread will release.
+        _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _hash_pool
+
+
+def shutdown_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    loop = asyncio.get_running_loop()
+    chunks = [passwords[i:i + HASH_CHUNK_SIZE] for i in range(0, len(passwords), HASH_CHUNK_SIZE)]
+    results = await asyncio.gather(*(loop.run_in_executor(hash_pool(), _hash_chunk, c) for c in chunks))
+    return [h for chunk in results for h in chunk]
+
+
+def parse_rows(raw: bytes, fmt: str) -> List[dict]:
+    text = raw.decode("utf-8-sig")
+    if fmt == "csv":
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+    rows = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            # Keep the row so the report points at it.
+            rows.append({"_unparsed": line})
+    return rows
+
+
+def _error(row_number: int, row: dict, errors: List[str]) -> dict:
+    return {"row": row_number, "email": row.get("email"), "errors": errors}
+
+
+async def _validate(database, rows: List[dict], model) -> tuple:
+    valid, errors = [], []
+    seen_emails = set()
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict) or "_unparsed" in row:
+            errors.append(_error(number, {}, ["Row is not valid JSON"]))
+            continue
+        try:
+            data = model.model_validate(row)
+        except ValidationError as e:
+            errors.append(_error(number, row, [
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            ]))
+            continue
+        problems = []
+        if data.password != data.confirm_password:
+            problems.append("Passwords do not match")
+        sub_service = await catalog.get_sub_service(database, data.sub_service_id)
+        if not await catalog.get_category(database, data.category_id):
+            problems.append("Unknown category_id")
+        elif not sub_service or sub_service["category_id"] != data.category_id:
+            problems.append("sub_service_id does not belong to category_id")
+        else:
+            try:
+                await signup_offerings(database, data)
+            except ValueError as e:
+                problems.append(str(e))
+        if data.email in seen_emails:
+            problems.append("Duplicate email in file")
+        seen_emails.add(data.email)
+        if problems:
+            errors.append(_error(number, row, problems))
+        else:
+            valid.append((number, data))
+
+    # One $in per chunk instead of a find_one per row.
+    emails = [data.email for _, data in valid]
+    registered = set()
+    for i in range(0, len(emails), INSERT_BATCH_SIZE):
+        async for user in database.users.find({"email": {"$in": emails[i:i + INSERT_BATCH_SIZE]}}, {"_id": 0, "email": 1}):
+            registered.add(user["email"])
+    if registered:
+        errors.extend(_error(n, {"email": d.email}, ["Email already registered"]) for n, d in valid if d.email in registered)
+        valid = [(n, d) for n, d in valid if d.email not in registered]
+    return valid, errors
+
+
+async def _build_docs(database, data, password_hash: str, approve: bool) -> tuple:
+    now = datetime.now(timezone.utc).isoformat()
+    offerings = await signup_offerings(database, data)
+    user_id = str(uuid.uuid4())
+    user_doc = {
+        "id": user_id,
+        "full_name": data.full_name,
+        "email": data.email,
+        "password": password_hash,
+        "role": "provider",
+        "city": data.city,
+        "created_at": now
+    }
+    provider_doc = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "full_name": data.full_name,
+        "email": data.email,
+        "category_id": data.category_id,
+        "category_name": await catalog.category_name(database, data.category_id),
+        "sub_service_id": data.sub_service_id,
+        "sub_service_name": offerings[0]["sub_service_name"],
+        "experience": data.experience,
+        "base_price": data.base_price,
+        "offerings": offerings,
+        "rating": 0.0,
+        "total_reviews": 0,
+        "is_verified": approve,
+        "is_approved": approve,
+        "is_online": False,
+        "city": data.city,
+        "created_at": now
+    }
+    provider_doc["rank_score"] = ranking.compute_score(provider_doc)
+    return user_doc, provider_doc
+
+
+async def _insert(collection, docs: List[dict]) -> set:
+    """insert_many in batches; returns the indexes of docs that failed."""
+    failed = set()
+    for start in range(0, len(docs), INSERT_BATCH_SIZE):
+        try:
+            await collection.insert_many(docs[start:start + INSERT_BATCH_SIZE], ordered=False)
+        except BulkWriteError as e:
+            failed.update(start + err["index"] for err in e.details["writeErrors"])
+    return failed
+
+
+def check_row_count(rows: List[dict]):
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise ValueError(f"At most {MAX_IMPORT_ROWS} rows per import")
+
+
+async def import_providers(database, rows: List[dict], model, approve: bool = False, dry_run: bool = False) -> dict:
+    check_row_count(rows)
+    await catalog.ensure_fresh(database)
+    valid, errors = await _validate(database, rows, model)
+
+    imported = []
+    if valid and not dry_run:
+        hashes = await hash_passwords([data.password for _, data in valid])
+        pairs = [await _build_docs(database, data, h, approve) for (_, data), h in zip(valid, hashes)]
+
+        # A unique-email violation here means someone signed up while we
+        # were hashing; only those rows fail.
+        failed_users = await _insert(database.users, [user for user, _ in pairs])
+        for i in sorted(failed_users):
+            errors.append(_error(valid[i][0], {"email": valid[i][1].email}, ["Email already registered"]))
+        kept = [i for i in range(len(pairs)) if i not in failed_users]
+
+        failed_providers = await _insert(database.providers, [pairs[i][1] for i in kept])
+        if failed_providers:
+            orphaned = [pairs[kept[j]][0]["id"] for j in failed_providers]
+            await database.users.delete_many({"id": {"$in": orphaned}})
+            for j in sorted(failed_providers):
+                number, data = valid[kept[j]]
+                errors.append(_error(number, {"email": data.email}, ["Could not create provider profile"]))
+        imported = [
+            {"row": valid[i][0], "email": pairs[i][0]["email"], "provider_id": pairs[i][1]["id"]}
+            for j, i in enumerate(kept) if j not in failed_providers
+        ]
+
+    errors.sort(key=lambda e: e["row"])
+    return {
+        "total": len(rows),
+        "valid": len(valid),
+        "imported": len(imported),
+        "failed": len(errors),
+        "dry_run": dry_run,
+        "providers": imported,
+        "errors": errors
+    }
+
+
+# ============ BACKGROUND JOBS ============
+
+async def create_job(database, rows: List[dict], approve: bool, dry_run: bool, actor: dict) -> dict:
+    job = {
+        "id": str(uuid.uuid4()),
+        "status": "running",
+        "total": len(rows),
+        "approve": approve,
+        "dry_run": dry_run,
+        "created_by": actor["id"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await database[JOBS_COLLECTION].insert_one(dict(job))
+    return job
+
+
+async def run_job(database, job_id: str, rows: List[dict], model, approve: bool, dry_run: bool) -> Optional[dict]:
+    """Runs an import created with create_job and stores its report.
+
+    Returns the report, or None if the import failed.
+    """
+    try:
+        report = await import_providers(database, rows, model, approve=approve, dry_run=dry_run)
+    except Exception as e:
+        logger.exception("Provider import %s failed", job_id)
+        await database[JOBS_COLLECTION].update_one({"id": job_id}, {"$set": {
+            "status": "failed", "error": str(e), "finished_at": datetime.now(timezone.utc).isoformat()
+        }})
+        return None
+    await database[JOBS_COLLECTION].update_one({"id": job_id}, {"$set": {
+        "status": "done", "report": report, "finished_at": datetime.now(timezone.utc).isoformat()
+    }})
+    return report
+
+
+async def get_job(database, job_id: str) -> Optional[dict]:
+    return await database[JOBS_COLLECTION].find_one({"id": job_id}, {"_id": 0})
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Bulk import providers")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--approve", action="store_true", help="create providers already approved")
+    parser.add_argument("--dry-run", action="store_true", help="validate only")
+    args = parser.parse_args()
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+
+    from database import db, close_clients
+    from server import ProviderSignup
+    try:
+        with open(args.path, "rb") as f:
+            rows = parse_rows(f.read(), fmt)
+        report = await import_providers(db, rows, ProviderSignup, approve=args.approve, dry_run=args.dry_run)
+        print(json.dumps({k: v for k, v in report.items() if k != "providers"}, indent=2))
+    finally:
+        shutdown_pool()
+        close_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
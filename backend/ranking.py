@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Bayesian prior: a provider is treated as having RATING_PRIOR_WEIGHT
+# reviews at RATING_PRIOR_MEAN before their own reviews count, so one
+# 5-star review cannot outrank hundreds of 4.9s.
+RATING_PRIOR_MEAN = float(os.environ.get('RANKING_RATING_PRIOR_MEAN', 4.2))
+RATING_PRIOR_WEIGHT = float(os.environ.get('RANKING_RATING_PRIOR_WEIGHT', 20))
+
+# Acceptance rate gets the same treatment with a neutral prior.
+ACCEPTANCE_PRIOR_RATE = 0.8
+ACCEPTANCE_PRIOR_WEIGHT = 5
+
+# Completed bookings saturate logarithmically at this count.
+BOOKINGS_SATURATION = 500
+RECENCY_HALF_LIFE_DAYS = 30
+
+WEIGHTS = {
+    "rating": 0.45,
+    "bookings": 0.2,
+    "acceptance": 0.15,
+    "recency": 0.1,
+    "online": 0.1,
+}
+
+REBUILD_BATCH_SIZE = 500
+
+# Recency only changes when a score is rewritten, so every score is
+# rewritten this often even if the provider has no new events.
+RESCORE_INTERVAL_SECONDS = int(os.environ.get('RANKING_RESCORE_INTERVAL_SECONDS', 24 * 3600))
+# How often each worker checks whether the interval's rescore is due.
+RESCORE_CHECK_SECONDS = 3600
+RANKING_STATE_COLLECTION = "ranking_state"
+
+# rank_stats counters each booking status contributes to.
+STATUS_COUNTERS = {
+    "accepted": {"accepted": 1},
+    "completed": {"accepted": 1, "completed": 1},
+    "rejected": {"rejected": 1},
+}
+
+
+def bayesian_rating(rating: float, reviews: int) -> float:
+    return (RATING_PRIOR_MEAN * RATING_PRIOR_WEIGHT + rating * reviews) / (RATING_PRIOR_WEIGHT + reviews)
+
+
+def acceptance_rate(accepted: int, rejected: int) -> float:
+    return (ACCEPTANCE_PRIOR_RATE * ACCEPTANCE_PRIOR_WEIGHT + accepted) / (ACCEPTANCE_PRIOR_WEIGHT + accepted + rejected)
+
+
+def recency(last_active: Optional[str], now: datetime) -> float:
+    if not last_active:
+        return 0.0
+    age_days = max((now - datetime.fromisoformat(last_active)).total_seconds() / 86400, 0)
+    return 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+
+def status_delta(old_status: str, new_status: str) -> dict:
+    """Counter changes for moving one booking between statuses."""
+    old = STATUS_COUNTERS.get(old_status, {})
+    new = STATUS_COUNTERS.get(new_status, {})
+    delta = {k: new.get(k, 0) - old.get(k, 0) for k in set(old) | set(new)}
+    return {k: v for k, v in delta.items() if v}
+
+
+def compute_score(provider: dict, now: Optional[datetime] = None) -> float:
+    """Scores a provider document in [0, 1]; higher ranks first."""
+    now = now or datetime.now(timezone.utc)
+    stats = provider.get("rank_stats", {})
+    completed = stats.get("completed", 0)
+    components = {
+        "rating": bayesian_rating(provider.get("rating", 0.0), provider.get("total_reviews", 0)) / 5,
+        "bookings": min(math.log1p(completed) / math.log1p(BOOKINGS_SATURATION), 1.0),
+        "acceptance": acceptance_rate(stats.get("accepted", 0), stats.get("rejected", 0)),
+        "recency": recency(stats.get("last_completed_at"), now),
+        "online": 1.0 if provider.get("is_online") else 0.0,
+    }
+    return round(sum(WEIGHTS[k] * v for k, v in components.items()), 6)
+
+
+async def refresh_score(database, provider_id: str, stats_inc: Optional[dict] = None, stats_set: Optional[dict] = None):
+    """Applies a ranking event to one provider and rewrites its score.
+
+    `stats_inc` / `stats_set` update the counters under rank_stats; the score
+    is then recomputed from the provider's current document.
+    """
+    update = {}
+    if stats_inc:
+        update["$inc"] = {f"rank_stats.{k}": v for k, v in stats_inc.items()}
+    if stats_set:
+        update["$set"] = {f"rank_stats.{k}": v for k, v in stats_set.items()}
+    query = {"id": provider_id}
+    projection = {"_id": 0, "rating": 1, "total_reviews": 1, "is_online": 1, "rank_stats": 1}
+    if update:
+        provider = await database.providers.find_one_and_update(
+            query, update, projection=projection, return_document=ReturnDocument.AFTER
+        )
+    else:
+        provider = await database.providers.find_one(query, projection)
+    if provider:
+        await database.providers.update_one(query, {"$set": {"rank_score": compute_score(provider)}})
+
+
+async def rebuild_scores(database) -> int:
+    """Recomputes rank_stats from bookings and rescores every provider."""
+    stats = {}
+    match = {"$match": {"status": {"$in": ["accepted", "completed", "rejected"]}}}
+    pipeline = [
+        match,
+        # Archived bookings keep counting towards a provider's history.
+        {"$unionWith": {"coll": "bookings_archive", "pipeline": [match]}},
+        {"$group": {
+            "_id": {"provider_id": "$provider_id", "status": "$status"},
+            "count": {"$sum": 1},
+            "last_completed_at": {"$max": {"$ifNull": ["$completed_at", "$created_at"]}}
+        }}
+    ]
+    async for row in database.bookings.aggregate(pipeline):
+        entry = stats.setdefault(row["_id"]["provider_id"], {"completed": 0, "accepted": 0, "rejected": 0})
+        status = row["_id"]["status"]
+        if status == "completed":
+            entry["completed"] = row["count"]
+            entry["last_completed_at"] = row["last_completed_at"]
+            # A completed booking was accepted first.
+            entry["accepted"] += row["count"]
+        else:
+            entry[status] += row["count"]
+
+    now = datetime.now(timezone.utc)
+    rescored = 0
+    ops = []
+    cursor = database.providers.find({}, {"_id": 0, "id": 1, "rating": 1, "total_reviews": 1, "is_online": 1})
+    async for provider in cursor:
+        provider["rank_stats"] = stats.get(provider["id"], {"completed": 0, "accepted": 0, "rejected": 0})
+        ops.append(UpdateOne(
+            {"id": provider["id"]},
+            {"$set": {"rank_stats": provider["rank_stats"], "rank_score": compute_score(provider, now)}}
+        ))
+        rescored += 1
+        if len(ops) >= REBUILD_BATCH_SIZE:
+            await database.providers.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await database.providers.bulk_write(ops, ordered=False)
+    return rescored
+
+
+async def rescore_all(database, now: Optional[datetime] = None) -> int:
+    """Rewrites every score from the stored rank_stats, so recency decays."""
+    now = now or datetime.now(timezone.utc)
+    rescored = 0
+    ops = []
+    projection = {"_id": 0, "id": 1, "city": 1, "rating": 1, "total_reviews": 1, "is_online": 1, "rank_stats": 1}
+    async for provider in database.providers.find({}, projection):
+        ops.append(UpdateOne(
+            {"id": provider["id"], "city": provider.get("city")},
+            {"$set": {"rank_score": compute_score(provider, now)}}
+        ))
+        rescored += 1
+        if len(ops) >= REBUILD_BATCH_SIZE:
+            await database.providers.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await database.providers.bulk_write(ops, ordered=False)
+    return rescored
+
+
+async def claim_rescore(database, interval_seconds: int = RESCORE_INTERVAL_SECONDS) -> bool:
+    """True for the one worker that gets to run the rescore due now."""
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=interval_seconds)).isoformat()
+    try:
+        await database[RANKING_STATE_COLLECTION].find_one_and_update(
+            {"_id": "rescore", "rescored_at": {"$lt": cutoff}},
+            {"$set": {"rescored_at": now.isoformat()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The state doc exists and is recent: someone already rescored.
+        return False
+    return True
+
+
+class Rescorer:
+    """Periodic rescore shared by all workers; the first due check runs at startup."""
+
+    def __init__(self, interval_seconds: int = RESCORE_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.database = None
+        self.on_rescore: Optional[Callable[[], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, database, on_rescore: Optional[Callable[[], Awaitable[None]]] = None):
+        self.database = database
+        self.on_rescore = on_rescore
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> bool:
+        if not await claim_rescore(self.database, self.interval_seconds):
+            return False
+        rescored = await rescore_all(self.database)
+        logger.info("Rescored %d providers", rescored)
+        if self.on_rescore:
+            await self.on_rescore()
+        return True
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Periodic provider rescore failed")
+            await asyncio.sleep(min(self.interval_seconds, RESCORE_CHECK_SECONDS))
+
+
+rescorer = Rescorer()
@@ -0,0 +1,402 @@
+"""Offline marketplace reports over Parquet snapshots.
+
+`snapshot` copies bookings (hot and archived), providers, reviews and users
+from the analytics (secondary-preferred) client into columnar Parquet
+files under REPORTS_SNAPSHOT_DIR. Runs are incremental by created_at.
+Bookings re-read a trailing window so that status changes are picked up, and
+reviews and users a short one for rows the secondary had not caught up on;
+providers are small and mutable, so they are re-snapshotted whole. Reports
+are computed with pandas/NumPy over those files and never query Mongo.
+
+    python reports.py snapshot
+    python reports.py conversion-by-city --days 90
+"""
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import numpy as np
+    import pandas as pd
+    import pyarrow  # noqa: F401  # pandas' Parquet engine
+except ImportError:  # reporting disabled
+    np = None
+    pd = None
+
+REPORTS_AVAILABLE = pd is not None
+
+SNAPSHOT_DIR = Path(os.environ.get('REPORTS_SNAPSHOT_DIR', Path(__file__).parent / 'snapshots'))
+ROWS_PER_PART = int(os.environ.get('REPORTS_ROWS_PER_PART', 100000))
+# Incremental parts are merged into one file once there are more than this.
+COMPACT_AFTER_PARTS = 24
+
+SOURCES = {
+    "bookings": {
+        "collections": ["bookings", "bookings_archive"],
+        "fields": [
+            "id", "customer_id", "provider_id", "sub_service_id", "sub_service_name", "category_id", "city",
+            "status", "base_price", "commission", "provider_earnings", "booking_date", "created_at", "completed_at"
+        ],
+        # Bookings change status after creation; recent ones are re-read.
+        "restate_days": 30,
+    },
+    "providers": {
+        "collections": ["providers"],
+        "fields": [
+            "id", "user_id", "full_name", "city", "category_id", "sub_service_id", "sub_service_name",
+            "base_price", "rating", "total_reviews", "is_approved", "created_at"
+        ],
+        "full": True,
+    },
+    "reviews": {
+        "collections": ["reviews"],
+        "fields": ["id", "booking_id", "customer_id", "provider_id", "rating", "created_at"],
+        # Secondary reads can lag, so rows landing just behind the
+        # watermark are re-read; copies are deduped on id.
+        "restate_days": 2,
+    },
+    "users": {
+        # Never the password hash or contact details.
+        "collections": ["users"],
+        "fields": ["id", "role", "city", "created_at"],
+        "restate_days": 2,
+    },
+}
+
+
+class SnapshotRunning(RuntimeError):
+    pass
+
+
+BOOKING_STATUSES = ["pending", "accepted", "rejected", "completed", "cancelled", "dispatching", "unassigned"]
+
+
+# ============ SNAPSHOTS ============
+
+def _manifest_path() -> Path:
+    return SNAPSHOT_DIR / "manifest.json"
+
+
+def load_manifest() -> dict:
+    path = _manifest_path()
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _save_manifest(manifest: dict):
+    tmp = _manifest_path().with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    tmp.replace(_manifest_path())
+
+
+def _stamp(snapshot_at: str) -> str:
+    return datetime.fromisoformat(snapshot_at).strftime("%Y%m%dT%H%M%S%f")
+
+
+def _write_part(name: str, records: List[dict], fields: List[str], snapshot_at: str, seq: int) -> str:
+    frame = pd.DataFrame.from_records(records, columns=fields)
+    frame["_snapshot_at"] = snapshot_at
+    part = f"{name}/part-{_stamp(snapshot_at)}-{seq:04d}.parquet"
+    (SNAPSHOT_DIR / name).mkdir(parents=True, exist_ok=True)
+    frame.to_parquet(SNAPSHOT_DIR / part, index=False)
+    return part
+
+
+def _read_parts(parts: List[str]):
+    frames = [pd.read_parquet(SNAPSHOT_DIR / part) for part in parts]
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if "id" in frame:
+        # Restated rows appear in several parts; the newest copy wins.
+        frame = frame.sort_values("_snapshot_at", kind="stable").drop_duplicates("id", keep="last")
+    return frame.reset_index(drop=True)
+
+
+def _compact(name: str, parts: List[str], snapshot_at: str) -> List[str]:
+    frame = _read_parts(parts)
+    frame["_snapshot_at"] = snapshot_at
+    part = f"{name}/compacted-{_stamp(snapshot_at)}.parquet"
+    frame.to_parquet(SNAPSHOT_DIR / part, index=False)
+    for old in parts:
+        (SNAPSHOT_DIR / old).unlink(missing_ok=True)
+    return [part]
+
+
+@contextmanager
+def _snapshot_lock():
+    # Parts and manifest are not shared-write safe. An flock covers every
+    # worker and the CLI on this host and is dropped if the holder dies.
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(SNAPSHOT_DIR / ".snapshot.lock", "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SnapshotRunning("A snapshot is already running")
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def snapshot_running() -> bool:
+    try:
+        with _snapshot_lock():
+            return False
+    except SnapshotRunning:
+        return True
+
+
+async def snapshot(database, names: Optional[List[str]] = None) -> dict:
+    """Appends new rows for each source; returns rows written per source.
+
+    Raises SnapshotRunning if another process or task is snapshotting.
+    """
+    if not REPORTS_AVAILABLE:
+        raise RuntimeError("pandas and pyarrow are required for reports")
+    with _snapshot_lock():
+        return await _snapshot(database, names)
+
+
+async def _snapshot(database, names: Optional[List[str]]) -> dict:
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
+    snapshot_at = datetime.now(timezone.utc).isoformat()
+    written = {}
+    for name in names or list(SOURCES):
+        source = SOURCES[name]
+        entry = manifest.get(name, {"parts": [], "watermark": None})
+        query = {}
+        if not source.get("full") and entry["watermark"]:
+            since = datetime.fromisoformat(entry["watermark"]) - timedelta(days=source["restate_days"])
+            query = {"created_at": {"$gt": since.isoformat()}}
+
+        projection = {"_id": 0, **{field: 1 for field in source["fields"]}}
+        new_parts, batch, rows, watermark = [], [], 0, entry["watermark"]
+        for collection in source["collections"]:
+            async for doc in database[collection].find(query, projection):
+                batch.append(doc)
+                if doc.get("created_at") and (watermark is None or doc["created_at"] > watermark):
+                    watermark = doc["created_at"]
+                if len(batch) >= ROWS_PER_PART:
+                    new_parts.append(await asyncio.to_thread(
+                        _write_part, name, batch, source["fields"], snapshot_at, len(new_parts)
+                    ))
+                    rows += len(batch)
+                    batch = []
+        if batch or (source.get("full") and not new_parts):
+            new_parts.append(await asyncio.to_thread(
+                _write_part, name, batch, source["fields"], snapshot_at, len(new_parts)
+            ))
+            rows += len(batch)
+
+        if source.get("full"):
+            for old in entry["parts"]:
+                (SNAPSHOT_DIR / old).unlink(missing_ok=True)
+            parts = new_parts
+        else:
+            parts = entry["parts"] + new_parts
+            if len(parts) > COMPACT_AFTER_PARTS:
+                parts = await asyncio.to_thread(_compact, name, parts, snapshot_at)
+        manifest[name] = {"parts": parts, "watermark": watermark, "snapshot_at": snapshot_at}
+        written[name] = rows
+        # Saved per source so an interrupted run keeps what it finished.
+        _save_manifest(manifest)
+    return written
+
+
+def load_frame(name: str):
+    entry = load_manifest().get(name)
+    if not entry:
+        raise LookupError(f"No snapshot of {name} yet")
+    frame = _read_parts(entry["parts"])
+    for column in ("created_at", "completed_at"):
+        if column in frame:
+            frame[column] = pd.to_datetime(frame[column], utc=True, format="ISO8601")
+    return frame
+
+
+# ============ REPORTS ============
+
+def _records(frame) -> List[dict]:
+    # NaN is not JSON; missing values go out as null.
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def _since(frame, days: Optional[int], now):
+    if not days:
+        return frame
+    return frame[frame["created_at"] >= now - pd.Timedelta(days=days)]
+
+
+def conversion_by_city(bookings, days: Optional[int] = None, now=None) -> dict:
+    """Booking funnel per city: volume, acceptance and completion rates, GMV."""
+    now = now or pd.Timestamp.now(tz="UTC")
+    bookings = _since(bookings, days, now)
+    counts = pd.crosstab(bookings["city"], bookings["status"]).reindex(columns=BOOKING_STATUSES, fill_value=0)
+    total = counts.sum(axis=1)
+    accepted = counts["accepted"] + counts["completed"]
+    decided = accepted + counts["rejected"]
+    completed = bookings[bookings["status"] == "completed"]
+    gmv = completed.groupby("city")["base_price"].sum().reindex(counts.index, fill_value=0)
+    frame = pd.DataFrame({
+        "city": counts.index,
+        "bookings": total.values,
+        **{status: counts[status].values for status in BOOKING_STATUSES},
+        "acceptance_rate": (accepted / decided.replace(0, np.nan)).round(4).values,
+        "completion_rate": (counts["completed"] / total.replace(0, np.nan)).round(4).values,
+        "gmv": gmv.round(2).values,
+    }).sort_values("bookings", ascending=False)
+    return {"days": days, "cities": _records(frame)}
+
+
+def price_elasticity(bookings, providers, min_providers: int = 3, now=None) -> dict:
+    """Log-log slope of demand on price across providers of each sub-service.
+
+    Demand is bookings per 30 days of a provider's tenure; log1p keeps
+    providers without bookings in the fit. Sub-services with fewer than
+    `min_providers` or no price spread get no estimate.
+    """
+    now = now or pd.Timestamp.now(tz="UTC")
+    demand = bookings.groupby("provider_id").size()
+    p = providers[providers["is_approved"].fillna(False).astype(bool) & (providers["base_price"] > 0)].copy()
+    p["bookings"] = p["id"].map(demand).fillna(0)
+    tenure_days = ((now - p["created_at"]).dt.total_seconds() / 86400).clip(lower=30)
+    p["x"] = np.log(p["base_price"])
+    p["y"] = np.log1p(p["bookings"] * 30 / tenure_days)
+    grouped = p.groupby("sub_service_id")
+    p["dx"] = p["x"] - grouped["x"].transform("mean")
+    p["dy"] = p["y"] - grouped["y"].transform("mean")
+    p["dxdy"] = p["dx"] * p["dy"]
+    p["dx2"] = p["dx"] ** 2
+    agg = p.groupby("sub_service_id").agg(
+        sub_service_name=("sub_service_name", "first"),
+        providers=("id", "size"),
+        bookings=("bookings", "sum"),
+        median_price=("base_price", "median"),
+        min_price=("base_price", "min"),
+        max_price=("base_price", "max"),
+        sxy=("dxdy", "sum"),
+        sxx=("dx2", "sum"),
+    )
+    fit = (agg["providers"] >= min_providers) & (agg["sxx"] > 1e-12)
+    agg["elasticity"] = np.where(fit, agg["sxy"] / agg["sxx"].where(fit, 1), np.nan).round(4)
+    agg = agg.drop(columns=["sxy", "sxx"]).reset_index().sort_values("bookings", ascending=False)
+    return {"min_providers": min_providers, "sub_services": _records(agg)}
+
+
+def provider_utilization(bookings, providers, days: int = 30, now=None) -> dict:
+    """Share of the last `days` days each approved provider had a job, by city and sub-service."""
+    now = now or pd.Timestamp.now(tz="UTC")
+    recent = _since(bookings, days, now)
+    jobs = recent[recent["status"].isin(["accepted", "completed"])]
+    busy_days = jobs.groupby("provider_id")["booking_date"].nunique()
+    job_count = jobs.groupby("provider_id").size()
+    requests = recent.groupby("provider_id").size()
+
+    p = providers[providers["is_approved"].fillna(False).astype(bool)].copy()
+    p["jobs"] = p["id"].map(job_count).fillna(0).astype(int)
+    p["requests"] = p["id"].map(requests).fillna(0).astype(int)
+    p["utilization"] = (p["id"].map(busy_days).fillna(0) / days).clip(upper=1)
+    summary = p.groupby(["city", "sub_service_name"], dropna=False).agg(
+        providers=("id", "size"),
+        jobs=("jobs", "sum"),
+        requests=("requests", "sum"),
+        mean_utilization=("utilization", "mean"),
+        median_utilization=("utilization", "median"),
+        idle_providers=("jobs", lambda jobs: int((jobs == 0).sum())),
+    ).reset_index()
+    summary[["mean_utilization", "median_utilization"]] = summary[["mean_utilization", "median_utilization"]].round(4)
+    summary = summary.sort_values("providers", ascending=False)
+    return {"days": days, "groups": _records(summary)}
+
+
+def _month_index(series):
+    # Months since year 0, so month arithmetic is plain integer math.
+    return series.dt.year * 12 + series.dt.month - 1
+
+
+def cohort_retention(users, bookings, months: int = 12, now=None) -> dict:
+    """Share of each signup-month cohort of customers that booked N months later."""
+    now = now or pd.Timestamp.now(tz="UTC")
+    customers = users[users["role"] == "customer"][["id", "created_at"]].dropna()
+    customers = customers.assign(cohort=_month_index(customers["created_at"]))
+    current = now.year * 12 + now.month - 1
+    customers = customers[customers["cohort"] > current - months]
+
+    activity = bookings[["customer_id", "created_at"]].dropna().merge(
+        customers[["id", "cohort"]], left_on="customer_id", right_on="id"
+    )
+    activity["offset"] = _month_index(activity["created_at"]) - activity["cohort"]
+    activity = activity[(activity["offset"] >= 0) & (activity["offset"] < months)]
+    active = activity.groupby(["cohort", "offset"])["customer_id"].nunique().unstack(fill_value=0)
+
+    sizes = customers.groupby("cohort").size()
+    rates = active.reindex(index=sizes.index, columns=range(months), fill_value=0).div(sizes, axis=0)
+    # Months that have not happened yet for a cohort are unknown, not zero.
+    elapsed = current - rates.index.to_numpy()[:, None]
+    rates = rates.where(np.arange(months)[None, :] <= elapsed).round(4)
+
+    return {
+        "months": months,
+        "cohorts": [
+            {
+                "cohort": f"{cohort // 12:04d}-{cohort % 12 + 1:02d}",
+                "customers": int(sizes[cohort]),
+                "retention": [None if pd.isna(v) else float(v) for v in rates.loc[cohort]],
+            }
+            for cohort in rates.index
+        ],
+    }
+
+
+REPORTS: Dict[str, Callable[..., dict]] = {
+    "conversion-by-city": lambda days=None, **_: conversion_by_city(load_frame("bookings"), days=days),
+    "price-elasticity": lambda **_: price_elasticity(load_frame("bookings"), load_frame("providers")),
+    "utilization": lambda days=None, **_: provider_utilization(
+        load_frame("bookings"), load_frame("providers"), days=days or 30
+    ),
+    "cohort-retention": lambda months=None, **_: cohort_retention(
+        load_frame("users"), load_frame("bookings"), months=months or 12
+    ),
+}
+
+
+def snapshot_version() -> Optional[str]:
+    """When the newest snapshot was taken; cached reports are keyed on it."""
+    return max((e["snapshot_at"] for e in load_manifest().values()), default=None)
+
+
+def run_report(name: str, **params) -> dict:
+    """Computes a report from the current snapshots (CPU-bound; run off the event loop)."""
+    if not REPORTS_AVAILABLE:
+        raise RuntimeError("pandas and pyarrow are required for reports")
+    snapshot_at = snapshot_version()
+    result = REPORTS[name](**params)
+    result["report"] = name
+    result["snapshot_at"] = snapshot_at
+    return result
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Marketplace report snapshots")
+    parser.add_argument("command", choices=["snapshot", *REPORTS])
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--months", type=int)
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        from database import analytics_db, close_clients
+        try:
+            print(await snapshot(analytics_db))
+        finally:
+            close_clients()
+    else:
+        print(json.dumps(run_report(args.command, days=args.days, months=args.months), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,102 @@
+"""Production entry point: runs the API under several uvicorn workers.
+
+    python serve.py
+
+Settings (environment):
+    HOST, PORT                 bind address (default 0.0.0.0:8001)
+    WEB_CONCURRENCY            explicit worker count; overrides WORKERS_PER_CORE
+    WORKERS_PER_CORE           workers per CPU core (default 1)
+    MAX_WORKERS                upper bound on the computed worker count
+    DRAIN_SECONDS              after SIGTERM, how long /api/health/ready answers 503
+                               while the worker keeps serving (default 5)
+    GRACEFUL_SHUTDOWN_SECONDS  how long in-flight requests may drain after that
+    KEEP_ALIVE_SECONDS         idle keep-alive timeout
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+
+import uvicorn
+from uvicorn.main import STARTUP_FAILURE
+from uvicorn.supervisors import Multiprocess
+
+logger = logging.getLogger("uvicorn.error")
+
+DRAIN_SECONDS = float(os.environ.get('DRAIN_SECONDS', 5))
+
+
+def worker_count() -> int:
+    if os.environ.get('WEB_CONCURRENCY'):
+        return max(int(os.environ['WEB_CONCURRENCY']), 1)
+    per_core = float(os.environ.get('WORKERS_PER_CORE', 1))
+    workers = max(int(per_core * multiprocessing.cpu_count()), 2)
+    max_workers = os.environ.get('MAX_WORKERS')
+    if max_workers:
+        workers = min(workers, int(max_workers))
+    return workers
+
+
+class DrainingServer(uvicorn.Server):
+    """Fails readiness on SIGTERM and keeps listening for DRAIN_SECONDS.
+
+    Plain uvicorn stops accepting connections before the lifespan shutdown
+    runs, so a readiness flag flipped there is never seen by the load
+    balancer. Here the probe fails first and the server only starts its
+    normal graceful shutdown once the balancer has had time to notice.
+    """
+
+    draining = False
+
+    def handle_exit(self, sig, frame):
+        if sig != signal.SIGTERM or self.draining or self.should_exit or DRAIN_SECONDS <= 0:
+            return super().handle_exit(sig, frame)
+        # Same module object the worker imported through "server:app".
+        module = sys.modules.get("server")
+        if module is None:
+            # Still importing: nothing is serving yet, so nothing to drain.
+            return super().handle_exit(sig, frame)
+        self.draining = True
+        module.app.state.ready = False
+        loop = asyncio.get_event_loop()
+        loop.call_later(DRAIN_SECONDS, super().handle_exit, sig, frame)
+
+
+class DrainingSupervisor(Multiprocess):
+    def shutdown(self):
+        # uvicorn terminates and joins one worker at a time, so with draining
+        # the last worker would stay "ready" for workers * DRAIN_SECONDS.
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Stopping parent process [%d]", self.pid)
+
+
+def main():
+    config = uvicorn.Config(
+        "server:app",
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', 8001)),
+        workers=worker_count(),
+        lifespan="on",
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        timeout_keep_alive=int(os.environ.get('KEEP_ALIVE_SECONDS', 5)),
+        timeout_graceful_shutdown=int(os.environ.get('GRACEFUL_SHUTDOWN_SECONDS', 30)),
+    )
+    server = DrainingServer(config=config)
+    # What uvicorn.run does, with our server class.
+    if config.workers > 1:
+        sock = config.bind_socket()
+        DrainingSupervisor(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
+    if not server.started and config.workers == 1:
+        sys.exit(STARTUP_FAILURE)
+
+
+if __name__ == "__main__":
+    main()
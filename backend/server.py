@@ -1,36 +1,92 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Depends, Header, Query, Request, status
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.middleware.gzip import GZipMiddleware
+import csv
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone, timedelta
 import jwt
 from passlib.context import CryptContext
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import db, read_db, analytics_db, pool_health, prime_pool, ensure_indexes, close_clients
+from catalog import catalog, CITIES_DATA, fan_out_category_name, fan_out_sub_service_name, check_provider_names
+import earnings
+import ranking
+import archive
+import provider_import
+import reports
+from slow_ops import slow_op_recorder, slow_query_report
+from audit import audit_log, find_events
+from offerings import (
+    DEFAULT_DURATION_MINUTES, MAX_OFFERINGS, backfill_offerings, build_offerings, duplicate_groups,
+    find_offering, fold_providers, primary_fields, refresh_names, signup_offerings
+)
+from partitions import PartitionMoving, PartitionQueryError, partition_router, check_move, move_city
+from dispatch import RESERVATION_FIELDS, Dispatcher, online_index
+from idempotency import IdempotencyStore, fingerprint
+from loaders import Loaders
+from pagination import after_cursor, page_of
+from http_cache import conditional_rendered, fast_json, rendered, COMPRESSION_MIN_SIZE
+from cache import (
+    build_cache, cache_key, CACHE_TTLS, MongoBackend,
+    CATALOG_PREFIX, PROVIDER_LIST_PREFIX, REPORTS_PREFIX, provider_detail_prefix
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET', 'vokzo-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
+# Public read cache
+response_cache = build_cache(db)
+
+# Instant-booking dispatch
+dispatcher = Dispatcher(db, online_index)
+
+# Retry-safe creates (Idempotency-Key header)
+idempotency = IdempotencyStore(db)
+
+# Startup backfills and repairs run in one worker per rollout
+STARTUP_MAINTENANCE_LEASE_SECONDS = int(os.environ.get('STARTUP_MAINTENANCE_LEASE_SECONDS', 600))
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-app = FastAPI(title="VOKZO API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    await warm_up()
+    app.state.ready = True
+    logger.info("Startup warm-up complete, accepting traffic")
+    yield
+    # serve.py already failed readiness on SIGTERM, before uvicorn stopped
+    # listening; by now no new requests arrive.
+    app.state.ready = False
+    await dispatcher.stop()
+    await ranking.rescorer.stop()
+    await audit_log.stop()
+    await slow_op_recorder.stop()
+    provider_import.shutdown_pool()
+    close_clients()
+
+app = FastAPI(title="VOKZO API", version="1.0.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # ============ MODELS ============
@@ -42,6 +98,15 @@ class UserCreate(BaseModel):
     confirm_password: str
     role: str  # customer, provider
 
+class OfferingIn(BaseModel):
+    sub_service_id: str
+    price: float = Field(..., gt=0)
+    duration_minutes: int = Field(DEFAULT_DURATION_MINUTES, gt=0, le=24 * 60)
+
+class Offering(OfferingIn):
+    sub_service_name: Optional[str] = None
+    category_id: str
+
 class ProviderSignup(BaseModel):
     full_name: str
     email: EmailStr
@@ -52,6 +117,12 @@ class ProviderSignup(BaseModel):
     experience: int
     base_price: float
     city: str
+    duration_minutes: int = Field(DEFAULT_DURATION_MINUTES, gt=0, le=24 * 60)
+    # Sub-services offered besides sub_service_id.
+    offerings: List[OfferingIn] = []
+
+class OfferingsUpdate(BaseModel):
+    offerings: List[OfferingIn] = Field(..., min_length=1, max_length=MAX_OFFERINGS)
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -76,6 +147,7 @@ class ProviderResponse(BaseModel):
     sub_service_name: Optional[str] = None
     experience: int
     base_price: float
+    offerings: List[Offering] = []
     rating: float
     total_reviews: int
     is_verified: bool
@@ -93,6 +165,14 @@ class BookingCreate(BaseModel):
     city: str
     notes: Optional[str] = None
 
+class InstantBookingCreate(BaseModel):
+    sub_service_id: str
+    booking_date: str
+    booking_time: str
+    address: str
+    city: str
+    notes: Optional[str] = None
+
 class BookingResponse(BaseModel):
     id: str
     customer_id: str
@@ -111,6 +191,7 @@ class BookingResponse(BaseModel):
     base_price: float
     commission: float
     provider_earnings: float
+    duration_minutes: Optional[int] = None
     created_at: str
 
 class ServiceCategory(BaseModel):
@@ -136,6 +217,35 @@ class ReviewCreate(BaseModel):
 class AdminSettings(BaseModel):
     commission_percentage: float
 
+class BulkIds(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+
+class BulkBookingStatus(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+    status: str
+
+class CityPartition(BaseModel):
+    partition: str
+
+BOOKING_STATUSES = ["pending", "accepted", "rejected", "completed", "cancelled"]
+# Allowed moves for provider and admin status changes. Finished bookings
+# are final: completion is booked into the earnings ledger once. Instant
+# bookings still being dispatched have no provider or price yet, so they
+# can only be cancelled.
+BOOKING_TRANSITIONS = {
+    "pending": {"accepted", "rejected", "cancelled"},
+    "accepted": {"completed", "cancelled"},
+    "dispatching": {"cancelled"},
+    "unassigned": {"cancelled"},
+}
+
+# Fields a client may request through ?fields= on provider reads.
+PROVIDER_FIELDS = set(ProviderResponse.model_fields)
+EMBEDDED_REVIEWS = 10
+
+# Static, so serialized once per process.
+CITIES_PAYLOAD = rendered(CITIES_DATA)
+
 # ============ HELPER FUNCTIONS ============
 
 def create_access_token(data: dict):
@@ -144,21 +254,59 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def decode_access_token(token: str) -> dict:
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def without_id(doc: dict) -> dict:
+    # insert_one adds Mongo's _id to the dict it was given.
+    return {k: v for k, v in doc.items() if k != "_id"}
+
+def calculate_pricing(base_price: float, commission_pct: float) -> dict:
+    commission = (base_price * commission_pct) / 100
+    return {
+        "base_price": base_price,
+        "commission": commission,
+        "provider_earnings": base_price - commission
+    }
+
+def requested_fields(fields: Optional[str]) -> set:
+    return {f.strip() for f in fields.split(",") if f.strip()} if fields else set()
+
+# Public provider views leave out the dispatcher's offer reservation.
+PUBLIC_PROVIDER_PROJECTION = {"_id": 0, **{f: 0 for f in RESERVATION_FIELDS}}
+
+def provider_projection(fields: Optional[str]) -> dict:
+    if not fields:
+        return PUBLIC_PROVIDER_PROJECTION
+    requested = requested_fields(fields) - {"reviews"}
+    unknown = requested - PROVIDER_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return {"_id": 0, "id": 1, **{f: 1 for f in requested}}
+
+def get_loaders() -> Loaders:
+    # FastAPI caches dependencies per request, so every dependency and the
+    # handler of one request share this instance.
+    return Loaders(db)
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
+):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id = payload.get("user_id")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if user is None:
+        user = await loaders.users.load(user_id)
+        if user is None or user.get("merged_into"):
             raise HTTPException(status_code=401, detail="User not found")
         return user
     except jwt.ExpiredSignatureError:
@@ -201,6 +349,7 @@ async def signup(user: UserCreate):
     }
     
     await db.users.insert_one(user_doc)
+    audit_log.record("signup", user_doc, "user", user_doc["id"])
     
     token = create_access_token({"user_id": user_doc["id"], "role": user_doc["role"]})
     
@@ -222,6 +371,10 @@ async def provider_signup(data: ProviderSignup):
     existing = await db.users.find_one({"email": data.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
+    try:
+        offerings = await signup_offerings(db, data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     user_id = str(uuid.uuid4())
     user_doc = {
@@ -240,9 +393,12 @@ async def provider_signup(data: ProviderSignup):
         "full_name": data.full_name,
         "email": data.email,
         "category_id": data.category_id,
+        "category_name": await catalog.category_name(db, data.category_id),
         "sub_service_id": data.sub_service_id,
+        "sub_service_name": offerings[0]["sub_service_name"],
         "experience": data.experience,
         "base_price": data.base_price,
+        "offerings": offerings,
         "rating": 0.0,
         "total_reviews": 0,
         "is_verified": False,
@@ -251,9 +407,11 @@ async def provider_signup(data: ProviderSignup):
         "city": data.city,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    provider_doc["rank_score"] = ranking.compute_score(provider_doc)
     
     await db.users.insert_one(user_doc)
     await db.providers.insert_one(provider_doc)
+    audit_log.record("provider_signup", user_doc, "provider", provider_doc["id"], city=data.city)
     
     token = create_access_token({"user_id": user_id, "role": "provider"})
     
@@ -269,13 +427,18 @@ async def provider_signup(data: ProviderSignup):
     }
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
+    client_ip = request.client.host if request.client else None
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid email or password")
-    
-    if not verify_password(credentials.password, user["password"]):
+    if not user or not verify_password(credentials.password, user["password"]):
+        audit_log.record("login_failed", None, "user", user["id"] if user else None, email=credentials.email, ip=client_ip)
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    if user.get("merged_into"):
+        # Duplicate provider accounts were folded into one.
+        raise HTTPException(
+            status_code=403, detail=f"This account was merged, please sign in as {user.get('merged_into_email')}"
+        )
+    audit_log.record("login", user, "user", user["id"], ip=client_ip)
     
     token = create_access_token({"user_id": user["id"], "role": user["role"]})
     
@@ -291,7 +454,7 @@ async def login(credentials: UserLogin):
     }
 
 @api_router.get("/auth/me")
-async def get_me(current_user: dict = Depends(get_current_user)):
+async def get_me(current_user: dict = Depends(get_current_user), loaders: Loaders = Depends(get_loaders)):
     user_data = {
         "id": current_user["id"],
         "full_name": current_user["full_name"],
@@ -301,7 +464,7 @@ async def get_me(current_user: dict = Depends(get_current_user)):
     }
     
     if current_user["role"] == "provider":
-        provider = await db.providers.find_one({"user_id": current_user["id"]}, {"_id": 0})
+        provider = await loaders.providers_by_user.load(current_user["id"])
         if provider:
             user_data["provider"] = provider
     
@@ -315,31 +478,50 @@ async def update_city(city: str, current_user: dict = Depends(get_current_user))
 # ============ SERVICE ROUTES ============
 
 @api_router.get("/services/categories", response_model=List[ServiceCategory])
-async def get_categories():
-    categories = await db.service_categories.find({}, {"_id": 0}).to_list(100)
-    for cat in categories:
-        count = await db.providers.count_documents({"category_id": cat["id"], "is_approved": True})
-        cat["provider_count"] = count
-    return categories
+async def get_categories(request: Request):
+    async def load():
+        categories = await read_db.service_categories.find({}, {"_id": 0}).to_list(100)
+        # One grouped count for all categories instead of a count per category;
+        # a provider counts once per category it offers anything in.
+        counts = await read_db.providers.aggregate([
+            {"$match": {"is_approved": True, "offerings.category_id": {"$in": [c["id"] for c in categories]}}},
+            {"$project": {"category_ids": {"$setUnion": ["$offerings.category_id", []]}}},
+            {"$unwind": "$category_ids"},
+            {"$group": {"_id": "$category_ids", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        by_category = {c["_id"]: c["count"] for c in counts}
+        for cat in categories:
+            cat["provider_count"] = by_category.get(cat["id"], 0)
+        return categories
+    
+    categories = await response_cache.get_or_render(cache_key("catalog:categories"), CACHE_TTLS["catalog"], load)
+    return conditional_rendered(request, categories, "catalog")
 
 @api_router.get("/services/categories/{category_id}/sub-services", response_model=List[SubService])
-async def get_sub_services(category_id: str):
-    sub_services = await db.sub_services.find({"category_id": category_id}, {"_id": 0}).to_list(100)
-    return sub_services
+async def get_sub_services(category_id: str, request: Request):
+    async def load():
+        return await read_db.sub_services.find({"category_id": category_id}, {"_id": 0}).to_list(100)
+    
+    key = cache_key("catalog:sub_services", category_id=category_id)
+    sub_services = await response_cache.get_or_render(key, CACHE_TTLS["catalog"], load)
+    return conditional_rendered(request, sub_services, "catalog")
 
 @api_router.get("/services/sub-services", response_model=List[SubService])
-async def get_all_sub_services():
-    sub_services = await db.sub_services.find({}, {"_id": 0}).to_list(100)
-    return sub_services
+async def get_all_sub_services(request: Request):
+    async def load():
+        return await read_db.sub_services.find({}, {"_id": 0}).to_list(100)
+    
+    sub_services = await response_cache.get_or_render(cache_key("catalog:sub_services"), CACHE_TTLS["catalog"], load)
+    return conditional_rendered(request, sub_services, "catalog")
 
 @api_router.get("/services/search")
 async def search_services(q: str):
-    categories = await db.service_categories.find(
+    categories = await read_db.service_categories.find(
         {"$or": [{"name": {"$regex": q, "$options": "i"}}, {"description": {"$regex": q, "$options": "i"}}]},
         {"_id": 0}
     ).to_list(100)
     
-    sub_services = await db.sub_services.find(
+    sub_services = await read_db.sub_services.find(
         {"$or": [{"name": {"$regex": q, "$options": "i"}}, {"description": {"$regex": q, "$options": "i"}}]},
         {"_id": 0}
     ).to_list(100)
@@ -350,70 +532,173 @@ async def search_services(q: str):
 
 @api_router.get("/providers")
 async def get_providers(
+    request: Request,
     sub_service_id: Optional[str] = None,
     category_id: Optional[str] = None,
-    city: Optional[str] = None
+    city: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0)
 ):
     query = {"is_approved": True}
-    if sub_service_id:
-        query["sub_service_id"] = sub_service_id
-    if category_id:
-        query["category_id"] = category_id
     if city:
         query["city"] = city
+    # One $elemMatch so the sub-service and the price refer to the same
+    # offering; served by the (city, offerings.sub_service_id, offerings.price)
+    # index, or without a price range by the rank-ordered one.
+    offering = {}
+    if sub_service_id:
+        offering["sub_service_id"] = sub_service_id
+    if category_id:
+        offering["category_id"] = category_id
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lte"] = max_price
+    if price:
+        offering["price"] = price
+    if offering:
+        query["offerings"] = {"$elemMatch": offering}
     
-    providers = await db.providers.find(query, {"_id": 0}).to_list(100)
+    async def load():
+        return await read_db.providers.find(query, PUBLIC_PROVIDER_PROJECTION).sort(
+            [("rank_score", -1), ("id", 1)]
+        ).to_list(100)
+    
+    key = cache_key(
+        PROVIDER_LIST_PREFIX, sub_service_id=sub_service_id, category_id=category_id, city=city,
+        min_price=min_price, max_price=max_price
+    )
+    providers = await response_cache.get_or_render(key, CACHE_TTLS["providers:list"], load)
+    return conditional_rendered(request, providers, "providers:list")
+
+@api_router.get("/providers/batch")
+async def get_providers_batch(ids: str):
+    provider_ids = list(dict.fromkeys(i for i in ids.split(",") if i))
+    if not provider_ids:
+        raise HTTPException(status_code=400, detail="ids is required")
+    if len(provider_ids) > 100:
+        raise HTTPException(status_code=400, detail="At most 100 ids per request")
     
-    for provider in providers:
-        category = await db.service_categories.find_one({"id": provider["category_id"]}, {"_id": 0})
-        sub_service = await db.sub_services.find_one({"id": provider["sub_service_id"]}, {"_id": 0})
-        provider["category_name"] = category["name"] if category else None
-        provider["sub_service_name"] = sub_service["name"] if sub_service else None
+    providers = await read_db.providers.find(
+        {"id": {"$in": provider_ids}, "is_approved": True}, PUBLIC_PROVIDER_PROJECTION
+    ).to_list(len(provider_ids))
+    by_id = {p["id"]: p for p in providers}
     
-    return providers
+    return {
+        "providers": [by_id[i] for i in provider_ids if i in by_id],
+        "missing": [i for i in provider_ids if i not in by_id]
+    }
 
 @api_router.get("/providers/{provider_id}")
-async def get_provider(provider_id: str):
-    provider = await db.providers.find_one({"id": provider_id}, {"_id": 0})
-    if not provider:
-        raise HTTPException(status_code=404, detail="Provider not found")
+async def get_provider(provider_id: str, request: Request, fields: Optional[str] = None):
+    projection = provider_projection(fields)
     
-    category = await db.service_categories.find_one({"id": provider["category_id"]}, {"_id": 0})
-    sub_service = await db.sub_services.find_one({"id": provider["sub_service_id"]}, {"_id": 0})
-    provider["category_name"] = category["name"] if category else None
-    provider["sub_service_name"] = sub_service["name"] if sub_service else None
+    async def load():
+        provider = await db.providers.find_one({"id": provider_id}, projection)
+        if not provider:
+            return None
+        
+        # Sparse requests opt into reviews explicitly; the full view embeds the
+        # newest page and points at /providers/{id}/reviews for the rest.
+        if fields is None or "reviews" in requested_fields(fields):
+            reviews = await db.reviews.find({"provider_id": provider_id}, {"_id": 0}).sort(
+                [("created_at", -1), ("id", -1)]
+            ).to_list(EMBEDDED_REVIEWS + 1)
+            page = page_of(reviews, EMBEDDED_REVIEWS)
+            provider["reviews"] = page["items"]
+            provider["reviews_next_cursor"] = page["next_cursor"]
+        return provider
     
-    reviews = await db.reviews.find({"provider_id": provider_id}, {"_id": 0}).to_list(50)
-    provider["reviews"] = reviews
+    key = cache_key(provider_detail_prefix(provider_id), fields=fields)
+    provider = await response_cache.get_or_render(key, CACHE_TTLS["providers:detail"], load)
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider not found")
+    return conditional_rendered(request, provider, "providers:detail")
+
+@api_router.get("/providers/{provider_id}/reviews")
+async def get_provider_reviews(
+    provider_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    query = {"provider_id": provider_id, **after_cursor(cursor)}
+    reviews = await read_db.reviews.find(query, {"_id": 0}).sort(
+        [("created_at", -1), ("id", -1)]
+    ).to_list(limit + 1)
+    page = page_of(reviews, limit)
+    response = {"reviews": page["items"], "next_cursor": page["next_cursor"]}
     
-    return provider
+    # The histogram only needs to ship with the first page.
+    if not cursor:
+        buckets = await read_db.reviews.aggregate([
+            {"$match": {"provider_id": provider_id}},
+            {"$group": {"_id": "$rating", "count": {"$sum": 1}}}
+        ]).to_list(10)
+        histogram = {str(r): 0 for r in range(1, 6)}
+        for bucket in buckets:
+            histogram[str(bucket["_id"])] = bucket["count"]
+        total = sum(histogram.values())
+        response["summary"] = {
+            "total_reviews": total,
+            "average_rating": round(sum(int(r) * c for r, c in histogram.items()) / total, 2) if total else 0,
+            "histogram": histogram
+        }
+    return response
 
 @api_router.put("/providers/toggle-online")
-async def toggle_online(current_user: dict = Depends(get_provider_user)):
-    provider = await db.providers.find_one({"user_id": current_user["id"]}, {"_id": 0})
+async def toggle_online(current_user: dict = Depends(get_provider_user), loaders: Loaders = Depends(get_loaders)):
+    provider = await loaders.providers_by_user.load(current_user["id"])
     if not provider:
         raise HTTPException(status_code=404, detail="Provider profile not found")
     
     new_status = not provider.get("is_online", False)
     await db.providers.update_one({"user_id": current_user["id"]}, {"$set": {"is_online": new_status}})
+    await ranking.refresh_score(db, provider["id"])
+    online_index.upsert({**provider, "is_online": new_status})
+    await response_cache.invalidate(PROVIDER_LIST_PREFIX, provider_detail_prefix(provider["id"]))
     return {"is_online": new_status}
 
+@api_router.put("/providers/offerings")
+async def update_offerings(
+    data: OfferingsUpdate,
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    provider = await loaders.providers_by_user.load(current_user["id"])
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider profile not found")
+    try:
+        offerings = await build_offerings(db, [o.model_dump() for o in data.offerings])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # The first offering stays mirrored in the single-service fields.
+    changes = {
+        "offerings": offerings,
+        **primary_fields(offerings),
+        "category_name": await catalog.category_name(db, offerings[0]["category_id"])
+    }
+    await db.providers.update_one({"id": provider["id"], "city": provider.get("city")}, {"$set": changes})
+    online_index.upsert({**provider, **changes})
+    await response_cache.invalidate(PROVIDER_LIST_PREFIX, provider_detail_prefix(provider["id"]), CATALOG_PREFIX)
+    return {"offerings": offerings}
+
 @api_router.get("/providers/dashboard/stats")
-async def get_provider_stats(current_user: dict = Depends(get_provider_user)):
-    provider = await db.providers.find_one({"user_id": current_user["id"]}, {"_id": 0})
+async def get_provider_stats(current_user: dict = Depends(get_provider_user), loaders: Loaders = Depends(get_loaders)):
+    provider = await loaders.providers_by_user.load(current_user["id"])
     if not provider:
         raise HTTPException(status_code=404, detail="Provider profile not found")
     
     total_bookings = await db.bookings.count_documents({"provider_id": provider["id"]})
     completed_bookings = await db.bookings.count_documents({"provider_id": provider["id"], "status": "completed"})
     pending_bookings = await db.bookings.count_documents({"provider_id": provider["id"], "status": "pending"})
+    archived = await archive.archived_stats(db, provider["id"])
+    total_bookings += archived["total"]
+    completed_bookings += archived["counts"].get("completed", 0)
     
-    earnings_pipeline = [
-        {"$match": {"provider_id": provider["id"], "status": "completed"}},
-        {"$group": {"_id": None, "total": {"$sum": "$provider_earnings"}}}
-    ]
-    earnings_result = await db.bookings.aggregate(earnings_pipeline).to_list(1)
-    total_earnings = earnings_result[0]["total"] if earnings_result else 0
+    lifetime = await earnings.lifetime_totals(db, provider["id"])
+    total_earnings = lifetime["net"]
     
     return {
         "provider": provider,
@@ -423,22 +708,117 @@ async def get_provider_stats(current_user: dict = Depends(get_provider_user)):
         "total_earnings": total_earnings
     }
 
+@api_router.get("/providers/dashboard/earnings")
+async def get_provider_earnings(
+    granularity: str = "day",
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    if granularity not in earnings.GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be one of day, week, month")
+    
+    provider = await loaders.providers_by_user.load(current_user["id"])
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider profile not found")
+    
+    try:
+        end = date.fromisoformat(to_date) if to_date else datetime.now(timezone.utc).date()
+        default_span = {"day": timedelta(days=29), "week": timedelta(weeks=11), "month": timedelta(days=365)}
+        start = date.fromisoformat(from_date) if from_date else end - default_span[granularity]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be YYYY-MM-DD dates")
+    if start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if earnings.bucket_count(start, end, granularity) > earnings.MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range spans more than {earnings.MAX_BUCKETS} buckets")
+    
+    series = await earnings.earnings_series(db, provider["id"], granularity, start, end)
+    return {
+        "granularity": granularity,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "buckets": series,
+        "totals": {
+            "gross": sum(b["gross"] for b in series),
+            "commission": sum(b["commission"] for b in series),
+            "net": sum(b["net"] for b in series),
+            "bookings": sum(b["bookings"] for b in series)
+        }
+    }
+
 # ============ BOOKING ROUTES ============
 
+async def booking_pricing(base_price: float) -> dict:
+    settings = await db.admin_settings.find_one({}, {"_id": 0})
+    commission_pct = settings.get("commission_percentage", 15) if settings else 15
+    return calculate_pricing(base_price, commission_pct)
+
+async def transition_booking(booking: dict, new_status: str, actor: Optional[dict] = None) -> bool:
+    """Moves a booking to new_status and applies its side effects once.
+
+    The update is conditional on the status we read, so of several
+    concurrent or retried calls only the one that actually flips it
+    books earnings and ranking counters.
+    """
+    if booking["status"] == new_status:
+        return False
+    if new_status not in BOOKING_TRANSITIONS.get(booking["status"], ()):
+        raise HTTPException(status_code=409, detail=f"Cannot change a {booking['status']} booking to {new_status}")
+    now = datetime.now(timezone.utc)
+    changes = {"status": new_status}
+    if new_status == "completed":
+        changes["completed_at"] = now.isoformat()
+    # The city routes the update straight to the booking's partition.
+    result = await db.bookings.update_one(
+        {"id": booking["id"], "city": booking.get("city"), "status": booking["status"]}, {"$set": changes}
+    )
+    if not result.modified_count:
+        return False
+    await apply_transition_effects(booking, new_status, now, actor)
+    return True
+
+async def apply_transition_effects(booking: dict, new_status: str, now: datetime, actor: Optional[dict] = None):
+    audit_log.record(
+        "booking_status_changed", actor, "booking", booking["id"], from_status=booking["status"], to_status=new_status
+    )
+    if new_status == "completed":
+        await earnings.record_completion(db, booking, now)
+    if booking.get("instant") and booking["status"] == "accepted" and new_status in ("completed", "rejected", "cancelled"):
+        online_index.finish_job(booking["provider_id"])
+    delta = ranking.status_delta(booking["status"], new_status)
+    if delta and booking.get("provider_id"):
+        await ranking.refresh_score(
+            db, booking["provider_id"], stats_inc=delta,
+            stats_set={"last_completed_at": now.isoformat()} if new_status == "completed" else None
+        )
+
 @api_router.post("/bookings")
-async def create_booking(booking: BookingCreate, current_user: dict = Depends(get_current_user)):
-    provider = await db.providers.find_one({"id": booking.provider_id}, {"_id": 0})
+async def create_booking(
+    booking: BookingCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+    loaders: Loaders = Depends(get_loaders)
+):
+    return await idempotency.run(
+        idempotency_key, f"{current_user['id']}:bookings", fingerprint(booking.model_dump()),
+        lambda: insert_booking(booking, current_user, loaders)
+    )
+
+async def insert_booking(booking: BookingCreate, current_user: dict, loaders: Loaders) -> dict:
+    provider = await loaders.providers.load(booking.provider_id)
     if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
+    offering = find_offering(provider, booking.sub_service_id)
+    if not offering:
+        raise HTTPException(status_code=400, detail="Provider does not offer this sub-service")
     
-    sub_service = await db.sub_services.find_one({"id": booking.sub_service_id}, {"_id": 0})
-    category = await db.service_categories.find_one({"id": provider["category_id"]}, {"_id": 0})
-    
-    settings = await db.admin_settings.find_one({}, {"_id": 0})
-    commission_pct = settings.get("commission_percentage", 15) if settings else 15
+    sub_service, category = await asyncio.gather(
+        catalog.get_sub_service(db, booking.sub_service_id), catalog.get_category(db, offering["category_id"])
+    )
     
-    commission = (provider["base_price"] * commission_pct) / 100
-    provider_earnings = provider["base_price"] - commission
+    pricing = await booking_pricing(offering["price"])
     
     booking_doc = {
         "id": str(uuid.uuid4()),
@@ -447,7 +827,8 @@ async def create_booking(booking: BookingCreate, current_user: dict = Depends(ge
         "provider_id": provider["id"],
         "provider_name": provider["full_name"],
         "sub_service_id": booking.sub_service_id,
-        "sub_service_name": sub_service["name"] if sub_service else None,
+        "sub_service_name": sub_service["name"] if sub_service else offering["sub_service_name"],
+        "category_id": offering["category_id"],
         "category_name": category["name"] if category else None,
         "booking_date": booking.booking_date,
         "booking_time": booking.booking_time,
@@ -455,68 +836,231 @@ async def create_booking(booking: BookingCreate, current_user: dict = Depends(ge
         "city": booking.city,
         "notes": booking.notes,
         "status": "pending",
-        "base_price": provider["base_price"],
-        "commission": commission,
-        "provider_earnings": provider_earnings,
+        **pricing,
+        "duration_minutes": offering["duration_minutes"],
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
     await db.bookings.insert_one(booking_doc)
+    audit_log.record("booking_created", current_user, "booking", booking_doc["id"], provider_id=provider["id"], city=booking.city)
+    
+    return without_id(booking_doc)
+
+@api_router.post("/bookings/instant")
+async def create_instant_booking(
+    booking: InstantBookingCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await idempotency.run(
+        idempotency_key, f"{current_user['id']}:bookings/instant", fingerprint(booking.model_dump()),
+        lambda: insert_instant_booking(booking, current_user)
+    )
+
+async def insert_instant_booking(booking: InstantBookingCreate, current_user: dict) -> dict:
+    sub_service = await catalog.get_sub_service(db, booking.sub_service_id)
+    if not sub_service:
+        raise HTTPException(status_code=404, detail="Sub-service not found")
+    category = await catalog.get_category(db, sub_service["category_id"])
+    
+    booking_doc = {
+        "id": str(uuid.uuid4()),
+        "customer_id": current_user["id"],
+        "customer_name": current_user["full_name"],
+        "provider_id": None,
+        "provider_name": None,
+        "sub_service_id": booking.sub_service_id,
+        "sub_service_name": sub_service["name"],
+        "category_id": sub_service["category_id"],
+        "category_name": category["name"] if category else None,
+        "booking_date": booking.booking_date,
+        "booking_time": booking.booking_time,
+        "address": booking.address,
+        "city": booking.city,
+        "notes": booking.notes,
+        "status": "dispatching",
+        "instant": True,
+        "offered_to": None,
+        "offer_expires_at": None,
+        "dispatch_tried": [],
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.bookings.insert_one(booking_doc)
+    audit_log.record("booking_created", current_user, "booking", booking_doc["id"], instant=True, city=booking.city)
+    dispatcher.submit(booking_doc["id"])
     
-    return {k: v for k, v in booking_doc.items() if k != "_id"}
+    return without_id(booking_doc)
+
+@api_router.get("/bookings/offers")
+async def get_booking_offers(current_user: dict = Depends(get_provider_user), loaders: Loaders = Depends(get_loaders)):
+    provider = await loaders.providers_by_user.load(current_user["id"])
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider profile not found")
+    
+    offers = await db.bookings.find(
+        {
+            "offered_to": provider["id"],
+            "status": "dispatching",
+            "offer_expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}
+        },
+        {"_id": 0, "dispatch_tried": 0, "dispatch_owner": 0, "dispatch_lease_until": 0}
+    ).to_list(10)
+    return fast_json(offers)
+
+@api_router.put("/bookings/{booking_id}/offer/accept")
+async def accept_booking_offer(
+    booking_id: str,
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    provider = await loaders.providers_by_user.load(current_user["id"])
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider profile not found")
+    
+    now = datetime.now(timezone.utc)
+    offered = await db.bookings.find_one({"id": booking_id}, {"_id": 0, "sub_service_id": 1})
+    # Dispatch only offers bookings to providers offering the sub-service.
+    offering = find_offering(provider, offered["sub_service_id"]) if offered else None
+    if not offering:
+        raise HTTPException(status_code=409, detail="Offer is no longer available")
+    pricing = await booking_pricing(offering["price"])
+    # The offer fields are the lock: only the provider currently holding an
+    # unexpired offer can match, and the status change means it matches once.
+    booking = await db.bookings.find_one_and_update(
+        {
+            "id": booking_id,
+            "status": "dispatching",
+            "offered_to": provider["id"],
+            "offer_expires_at": {"$gt": now.isoformat()}
+        },
+        {"$set": {
+            "status": "accepted",
+            "provider_id": provider["id"],
+            "provider_name": provider["full_name"],
+            "offered_to": None,
+            "offer_expires_at": None,
+            "accepted_at": now.isoformat(),
+            **pricing,
+            "duration_minutes": offering["duration_minutes"]
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not booking:
+        raise HTTPException(status_code=409, detail="Offer is no longer available")
+    
+    online_index.start_job(provider["id"])
+    dispatcher.notify(booking_id)
+    await apply_transition_effects({**booking, "status": "dispatching"}, "accepted", now, current_user)
+    return {"message": "Booking accepted", "status": "accepted", "booking": booking}
+
+@api_router.put("/bookings/{booking_id}/offer/decline")
+async def decline_booking_offer(
+    booking_id: str,
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    provider = await loaders.providers_by_user.load(current_user["id"])
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider profile not found")
+    
+    result = await db.bookings.update_one(
+        {"id": booking_id, "status": "dispatching", "offered_to": provider["id"]},
+        {"$set": {"offered_to": None, "offer_expires_at": None}}
+    )
+    if not result.modified_count:
+        raise HTTPException(status_code=409, detail="Offer is no longer available")
+    
+    dispatcher.notify(booking_id)
+    await ranking.refresh_score(db, provider["id"], stats_inc={"rejected": 1})
+    return {"message": "Offer declined"}
+
+def bookings_page_response(page: dict) -> Response:
+    # Booking lists stay plain arrays; the cursor for the next (older) page
+    # travels in a header so existing clients keep working.
+    response = fast_json(page["items"])
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return response
 
 @api_router.get("/bookings/customer")
-async def get_customer_bookings(current_user: dict = Depends(get_current_user)):
-    bookings = await db.bookings.find({"customer_id": current_user["id"]}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return bookings
+async def get_customer_bookings(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    page = await archive.find_page(db, {"customer_id": current_user["id"]}, limit, cursor)
+    return bookings_page_response(page)
 
 @api_router.get("/bookings/provider")
-async def get_provider_bookings(current_user: dict = Depends(get_provider_user)):
-    provider = await db.providers.find_one({"user_id": current_user["id"]}, {"_id": 0})
+async def get_provider_bookings(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    provider = await loaders.providers_by_user.load(current_user["id"])
     if not provider:
         raise HTTPException(status_code=404, detail="Provider profile not found")
     
-    bookings = await db.bookings.find({"provider_id": provider["id"]}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return bookings
+    page = await archive.find_page(db, {"provider_id": provider["id"]}, limit, cursor)
+    return bookings_page_response(page)
+
+async def load_provider_booking(loaders: Loaders, current_user: dict, booking_id: str) -> dict:
+    # The provider profile and the booking are independent lookups, so
+    # they go out together.
+    provider, booking = await asyncio.gather(
+        loaders.providers_by_user.load(current_user["id"]), loaders.bookings.load(booking_id)
+    )
+    if not provider or not booking or booking["provider_id"] != provider["id"]:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    return booking
 
 @api_router.put("/bookings/{booking_id}/accept")
-async def accept_booking(booking_id: str, current_user: dict = Depends(get_provider_user)):
-    provider = await db.providers.find_one({"user_id": current_user["id"]}, {"_id": 0})
-    booking = await db.bookings.find_one({"id": booking_id, "provider_id": provider["id"]}, {"_id": 0})
-    
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    await db.bookings.update_one({"id": booking_id}, {"$set": {"status": "accepted"}})
+async def accept_booking(
+    booking_id: str,
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    booking = await load_provider_booking(loaders, current_user, booking_id)
+    await transition_booking(booking, "accepted", current_user)
     return {"message": "Booking accepted", "status": "accepted"}
 
 @api_router.put("/bookings/{booking_id}/reject")
-async def reject_booking(booking_id: str, current_user: dict = Depends(get_provider_user)):
-    provider = await db.providers.find_one({"user_id": current_user["id"]}, {"_id": 0})
-    booking = await db.bookings.find_one({"id": booking_id, "provider_id": provider["id"]}, {"_id": 0})
-    
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    await db.bookings.update_one({"id": booking_id}, {"$set": {"status": "rejected"}})
+async def reject_booking(
+    booking_id: str,
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    booking = await load_provider_booking(loaders, current_user, booking_id)
+    await transition_booking(booking, "rejected", current_user)
     return {"message": "Booking rejected", "status": "rejected"}
 
 @api_router.put("/bookings/{booking_id}/complete")
-async def complete_booking(booking_id: str, current_user: dict = Depends(get_provider_user)):
-    provider = await db.providers.find_one({"user_id": current_user["id"]}, {"_id": 0})
-    booking = await db.bookings.find_one({"id": booking_id, "provider_id": provider["id"]}, {"_id": 0})
-    
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    await db.bookings.update_one({"id": booking_id}, {"$set": {"status": "completed"}})
+async def complete_booking(
+    booking_id: str,
+    current_user: dict = Depends(get_provider_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    booking = await load_provider_booking(loaders, current_user, booking_id)
+    await transition_booking(booking, "completed", current_user)
     return {"message": "Booking completed", "status": "completed"}
 
 # ============ REVIEW ROUTES ============
 
 @api_router.post("/reviews")
-async def create_review(review: ReviewCreate, current_user: dict = Depends(get_current_user)):
-    booking = await db.bookings.find_one({"id": review.booking_id, "customer_id": current_user["id"]}, {"_id": 0})
+async def create_review(
+    review: ReviewCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await idempotency.run(
+        idempotency_key, f"{current_user['id']}:reviews", fingerprint(review.model_dump()),
+        lambda: insert_review(review, current_user)
+    )
+
+async def insert_review(review: ReviewCreate, current_user: dict) -> dict:
+    booking = await archive.find_booking(db, {"id": review.booking_id, "customer_id": current_user["id"]})
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
@@ -544,26 +1088,31 @@ async def create_review(review: ReviewCreate, current_user: dict = Depends(get_c
         {"id": review.provider_id},
         {"$set": {"rating": round(avg_rating, 1), "total_reviews": len(reviews)}}
     )
+    await ranking.refresh_score(db, review.provider_id)
+    await response_cache.invalidate(PROVIDER_LIST_PREFIX, provider_detail_prefix(review.provider_id))
     
-    return {k: v for k, v in review_doc.items() if k != "_id"}
+    return without_id(review_doc)
 
 # ============ ADMIN ROUTES ============
 
 @api_router.get("/admin/providers")
 async def admin_get_providers(current_user: dict = Depends(get_admin_user)):
     providers = await db.providers.find({}, {"_id": 0}).to_list(100)
-    for provider in providers:
-        category = await db.service_categories.find_one({"id": provider["category_id"]}, {"_id": 0})
-        sub_service = await db.sub_services.find_one({"id": provider["sub_service_id"]}, {"_id": 0})
-        provider["category_name"] = category["name"] if category else None
-        provider["sub_service_name"] = sub_service["name"] if sub_service else None
-    return providers
+    return fast_json(providers)
 
 @api_router.put("/admin/providers/{provider_id}/approve")
-async def admin_approve_provider(provider_id: str, current_user: dict = Depends(get_admin_user)):
-    result = await db.providers.update_one({"id": provider_id}, {"$set": {"is_approved": True, "is_verified": True}})
-    if result.modified_count == 0:
+async def admin_approve_provider(
+    provider_id: str,
+    current_user: dict = Depends(get_admin_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    provider = await loaders.providers.load(provider_id)
+    if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
+    changes = {"is_approved": True, "is_verified": True, **await provider_catalog_names(provider)}
+    await db.providers.update_one({"id": provider_id}, {"$set": changes})
+    audit_log.record("provider_approved", current_user, "provider", provider_id)
+    await invalidate_provider_visibility(provider_id)
     return {"message": "Provider approved"}
 
 @api_router.put("/admin/providers/{provider_id}/reject")
@@ -571,32 +1120,301 @@ async def admin_reject_provider(provider_id: str, current_user: dict = Depends(g
     result = await db.providers.update_one({"id": provider_id}, {"$set": {"is_approved": False}})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Provider not found")
+    audit_log.record("provider_rejected", current_user, "provider", provider_id)
+    await invalidate_provider_visibility(provider_id)
     return {"message": "Provider rejected"}
 
+async def invalidate_provider_visibility(provider_id: Optional[str] = None):
+    # Approval changes listings, the provider page and per-category counts.
+    await response_cache.invalidate(PROVIDER_LIST_PREFIX, provider_detail_prefix(provider_id), CATALOG_PREFIX)
+
+async def refresh_provider_names(fan_out, ref: str, name: Optional[str]):
+    await fan_out(db, ref, name)
+    await response_cache.invalidate(PROVIDER_LIST_PREFIX, provider_detail_prefix())
+
+async def provider_catalog_names(provider: dict) -> dict:
+    names = {
+        "category_name": await catalog.category_name(db, provider["category_id"]),
+        "sub_service_name": await catalog.sub_service_name(db, provider["sub_service_id"])
+    }
+    if provider.get("offerings"):
+        names["offerings"] = await refresh_names(db, provider["offerings"])
+    return names
+
+async def bulk_update_providers(ids: List[str], changes: dict, actor: dict, action: str, refresh_names: bool = False) -> dict:
+    ids = list(dict.fromkeys(ids))
+    projection = {"_id": 0, "id": 1, "city": 1, **{field: 1 for field in changes}}
+    if refresh_names:
+        projection.update({"category_id": 1, "sub_service_id": 1, "category_name": 1, "sub_service_name": 1, "offerings": 1})
+    existing = await db.providers.find({"id": {"$in": ids}}, projection).to_list(len(ids))
+    by_id = {p["id"]: p for p in existing}
+    
+    results = []
+    ops = []
+    for provider_id in ids:
+        provider = by_id.get(provider_id)
+        if provider is None:
+            results.append({"id": provider_id, "result": "not_found"})
+        elif all(provider.get(field) == value for field, value in changes.items()):
+            results.append({"id": provider_id, "result": "unchanged"})
+        else:
+            provider_changes = {**changes, **await provider_catalog_names(provider)} if refresh_names else changes
+            ops.append(UpdateOne({"id": provider_id, "city": provider.get("city")}, {"$set": provider_changes}))
+            results.append({"id": provider_id, "result": "updated"})
+    
+    if ops:
+        await db.providers.bulk_write(ops, ordered=False)
+        for r in results:
+            if r["result"] == "updated":
+                audit_log.record(action, actor, "provider", r["id"], bulk=True)
+        await invalidate_provider_visibility()
+    return {
+        "updated": sum(1 for r in results if r["result"] == "updated"),
+        "results": results
+    }
+
+async def run_provider_import(job: dict, rows: List[dict], current_user: dict):
+    report = await provider_import.run_job(db, job["id"], rows, ProviderSignup, job["approve"], job["dry_run"])
+    if report and report["imported"]:
+        audit_log.record(
+            "providers_imported", current_user, "provider", None,
+            provider_ids=[p["provider_id"] for p in report["providers"]], approved=job["approve"]
+        )
+        if job["approve"]:
+            await response_cache.invalidate(PROVIDER_LIST_PREFIX)
+
+@api_router.post("/admin/providers/import", status_code=202)
+async def admin_import_providers(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    format: Optional[str] = None,
+    approve: bool = False,
+    dry_run: bool = False,
+    current_user: dict = Depends(get_admin_user)
+):
+    # The body is the raw CSV or NDJSON file; format defaults from Content-Type.
+    fmt = format or ("ndjson" if "json" in request.headers.get("content-type", "") else "csv")
+    if fmt not in provider_import.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    try:
+        rows = provider_import.parse_rows(await request.body(), fmt)
+        provider_import.check_row_count(rows)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8")
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Hashing thousands of passwords outlasts any proxy timeout; poll the job.
+    job = await provider_import.create_job(db, rows, approve, dry_run, current_user)
+    background_tasks.add_task(run_provider_import, job, rows, current_user)
+    return {"message": "Import started", "job_id": job["id"], "total": job["total"]}
+
+@api_router.get("/admin/providers/import/{job_id}")
+async def admin_import_status(job_id: str, current_user: dict = Depends(get_admin_user)):
+    job = await provider_import.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return fast_json(job)
+
+@api_router.put("/admin/providers/bulk-approve")
+async def admin_bulk_approve_providers(data: BulkIds, current_user: dict = Depends(get_admin_user)):
+    return await bulk_update_providers(
+        data.ids, {"is_approved": True, "is_verified": True}, current_user, "provider_approved", refresh_names=True
+    )
+
+@api_router.put("/admin/providers/bulk-reject")
+async def admin_bulk_reject_providers(data: BulkIds, current_user: dict = Depends(get_admin_user)):
+    return await bulk_update_providers(data.ids, {"is_approved": False}, current_user, "provider_rejected")
+
+@api_router.get("/admin/providers/duplicates")
+async def admin_duplicate_providers(current_user: dict = Depends(get_admin_user)):
+    # Candidates only: same name in the same city. An admin confirms each fold.
+    return fast_json(await duplicate_groups(read_db))
+
+@api_router.post("/admin/providers/fold")
+async def admin_fold_providers(data: BulkIds, current_user: dict = Depends(get_admin_user)):
+    await backfill_offerings(db)
+    try:
+        result = await fold_providers(db, list(dict.fromkeys(data.ids)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except earnings.LedgerRebuildRunning as e:
+        # The fold stops before deleting anything and is safe to rerun.
+        raise HTTPException(status_code=409, detail=f"{e}; retry the fold")
+    audit_log.record(
+        "providers_folded", current_user, "provider", result["provider_id"], folded=result["folded"]
+    )
+    for provider_id in result["folded"]:
+        online_index.remove(provider_id)
+    survivor = await db.providers.find_one({"id": result["provider_id"]}, {"_id": 0})
+    if survivor:
+        online_index.upsert(survivor)
+    await response_cache.invalidate(
+        PROVIDER_LIST_PREFIX, CATALOG_PREFIX,
+        *(provider_detail_prefix(i) for i in [result["provider_id"], *result["folded"]])
+    )
+    return result
+
+@api_router.put("/admin/bookings/bulk-status")
+async def admin_bulk_booking_status(data: BulkBookingStatus, current_user: dict = Depends(get_admin_user)):
+    if data.status not in BOOKING_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    
+    ids = list(dict.fromkeys(data.ids))
+    existing = await db.bookings.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+    by_id = {b["id"]: b for b in existing}
+    
+    now = datetime.now(timezone.utc)
+    changes = {"status": data.status}
+    if data.status == "completed":
+        changes["completed_at"] = now.isoformat()
+    
+    results = []
+    ops = []
+    transitioned = []
+    for booking_id in ids:
+        booking = by_id.get(booking_id)
+        if booking is None:
+            results.append({"id": booking_id, "result": "not_found"})
+        elif booking["status"] == data.status:
+            results.append({"id": booking_id, "result": "unchanged"})
+        elif data.status not in BOOKING_TRANSITIONS.get(booking["status"], ()):
+            results.append({"id": booking_id, "result": "invalid_transition", "from": booking["status"]})
+        elif data.status == "completed" and (not booking.get("provider_id") or booking.get("base_price") is None):
+            # Nothing to book into the ledger.
+            results.append({"id": booking_id, "result": "unpriced"})
+        else:
+            # The status guard keeps a concurrent transition from being applied twice.
+            ops.append(UpdateOne({"id": booking_id, "city": booking.get("city"), "status": booking["status"]}, {"$set": changes}))
+            transitioned.append(booking)
+            results.append({"id": booking_id, "result": "updated"})
+    
+    applied = set()
+    if ops:
+        result = await db.bookings.bulk_write(ops, ordered=False)
+        if result.modified_count == len(ops):
+            applied = {b["id"] for b in transitioned}
+        else:
+            # Some bookings changed status underneath us; the stamped fields
+            # identify exactly which updates won.
+            won = await db.bookings.find(
+                {"id": {"$in": [b["id"] for b in transitioned]}, **changes}, {"_id": 0, "id": 1}
+            ).to_list(len(transitioned))
+            applied = {b["id"] for b in won}
+        for r in results:
+            if r["result"] == "updated" and r["id"] not in applied:
+                r["result"] = "conflict"
+    
+    for booking in transitioned:
+        if booking["id"] in applied:
+            await apply_transition_effects(booking, data.status, now, current_user)
+    
+    return {
+        "updated": len(applied),
+        "results": results
+    }
+
 @api_router.get("/admin/bookings")
-async def admin_get_bookings(current_user: dict = Depends(get_admin_user)):
-    bookings = await db.bookings.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return bookings
+async def admin_get_bookings(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    current_user: dict = Depends(get_admin_user)
+):
+    page = await archive.find_page(db, {}, limit, cursor)
+    return bookings_page_response(page)
+
+@api_router.get("/admin/bookings/search")
+async def admin_search_bookings(
+    status: Optional[str] = None,
+    city: Optional[str] = None,
+    category_id: Optional[str] = None,
+    provider_id: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_admin_user)
+):
+    match = {}
+    if status:
+        match["status"] = status
+    if city:
+        match["city"] = city
+    if category_id:
+        match["category_id"] = category_id
+    if provider_id:
+        match["provider_id"] = provider_id
+    if customer_id:
+        match["customer_id"] = customer_id
+    try:
+        created_at = {}
+        if from_date:
+            created_at["$gte"] = date.fromisoformat(from_date).isoformat()
+        if to_date:
+            created_at["$lt"] = (date.fromisoformat(to_date) + timedelta(days=1)).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be YYYY-MM-DD dates")
+    if created_at:
+        match["created_at"] = created_at
+    
+    # The page itself is an index-ordered find over hot and archived bookings.
+    page = await archive.find_page(analytics_db, match, limit, cursor)
+    response = {"bookings": page["items"], "next_cursor": page["next_cursor"]}
+    if cursor:
+        # Totals and facets do not change between pages; the client keeps
+        # the ones from the first.
+        return fast_json(response)
+    
+    pipeline = [{"$match": match}]
+    # Searches reaching back past the archive watermark include archived
+    # bookings, so totals and facets match what was there before archival.
+    watermark = await archive.archived_before(db)
+    if watermark and not (from_date and created_at["$gte"] >= watermark):
+        pipeline.append({"$unionWith": {"coll": "bookings_archive", "pipeline": [{"$match": match}]}})
+    pipeline.append({"$facet": {
+        "total": [{"$count": "count"}],
+        "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}],
+        "city": [{"$group": {"_id": "$city", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}, {"$limit": 50}],
+        "category": [
+            {"$group": {"_id": "$category_id", "name": {"$first": "$category_name"}, "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}}
+        ]
+    }})
+    result = (await analytics_db.bookings.aggregate(pipeline, allowDiskUse=True).to_list(1))[0]
+    
+    response["total"] = result["total"][0]["count"] if result["total"] else 0
+    response["facets"] = {
+        "status": [{"value": f["_id"], "count": f["count"]} for f in result["status"]],
+        "city": [{"value": f["_id"], "count": f["count"]} for f in result["city"]],
+        "category": [{"value": f["_id"], "name": f.get("name"), "count": f["count"]} for f in result["category"]]
+    }
+    return fast_json(response)
 
 @api_router.get("/admin/analytics")
 async def admin_get_analytics(current_user: dict = Depends(get_admin_user)):
-    total_users = await db.users.count_documents({"role": {"$ne": "admin"}})
-    total_customers = await db.users.count_documents({"role": "customer"})
-    total_providers = await db.providers.count_documents({})
-    approved_providers = await db.providers.count_documents({"is_approved": True})
-    pending_providers = await db.providers.count_documents({"is_approved": False})
+    total_users = await analytics_db.users.count_documents({"role": {"$ne": "admin"}})
+    total_customers = await analytics_db.users.count_documents({"role": "customer"})
+    total_providers = await analytics_db.providers.count_documents({})
+    approved_providers = await analytics_db.providers.count_documents({"is_approved": True})
+    pending_providers = await analytics_db.providers.count_documents({"is_approved": False})
     
-    total_bookings = await db.bookings.count_documents({})
-    pending_bookings = await db.bookings.count_documents({"status": "pending"})
-    completed_bookings = await db.bookings.count_documents({"status": "completed"})
+    total_bookings = await analytics_db.bookings.count_documents({})
+    pending_bookings = await analytics_db.bookings.count_documents({"status": "pending"})
+    completed_bookings = await analytics_db.bookings.count_documents({"status": "completed"})
     
     revenue_pipeline = [
         {"$match": {"status": "completed"}},
         {"$group": {"_id": None, "total": {"$sum": "$commission"}}}
     ]
-    revenue_result = await db.bookings.aggregate(revenue_pipeline).to_list(1)
+    revenue_result = await analytics_db.bookings.aggregate(revenue_pipeline).to_list(1)
     total_revenue = revenue_result[0]["total"] if revenue_result else 0
     
+    # Archived bookings are counted from their rollup, not rescanned.
+    archived = await archive.archived_stats(db)
+    total_bookings += archived["total"]
+    completed_bookings += archived["counts"].get("completed", 0)
+    total_revenue += archived["revenue"]
+    
     settings = await db.admin_settings.find_one({}, {"_id": 0})
     commission_pct = settings.get("commission_percentage", 15) if settings else 15
     
@@ -615,9 +1433,164 @@ async def admin_get_analytics(current_user: dict = Depends(get_admin_user)):
 
 @api_router.put("/admin/settings/commission")
 async def update_commission(settings: AdminSettings, current_user: dict = Depends(get_admin_user)):
-    await db.admin_settings.update_one({}, {"$set": {"commission_percentage": settings.commission_percentage}}, upsert=True)
+    previous = await db.admin_settings.find_one_and_update(
+        {}, {"$set": {"commission_percentage": settings.commission_percentage}}, projection={"_id": 0}, upsert=True
+    )
+    audit_log.record(
+        "commission_updated", current_user, "settings", "commission",
+        previous=previous.get("commission_percentage") if previous else None,
+        commission_percentage=settings.commission_percentage
+    )
     return {"message": "Commission updated", "commission_percentage": settings.commission_percentage}
 
+@api_router.post("/admin/earnings/rebuild")
+async def admin_rebuild_earnings(provider_id: Optional[str] = None, current_user: dict = Depends(get_admin_user)):
+    try:
+        replayed = await earnings.rebuild_ledger(db, provider_id)
+    except earnings.LedgerRebuildRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": "Earnings ledger rebuilt", "bookings_replayed": replayed}
+
+@api_router.post("/admin/ranking/rebuild")
+async def admin_rebuild_ranking(current_user: dict = Depends(get_admin_user)):
+    rescored = await ranking.rebuild_scores(db)
+    await response_cache.invalidate(PROVIDER_LIST_PREFIX)
+    return {"message": "Provider ranking rebuilt", "providers_rescored": rescored}
+
+@api_router.post("/admin/bookings/archive")
+async def admin_archive_bookings(
+    background_tasks: BackgroundTasks,
+    older_than_days: int = Query(archive.ARCHIVE_AFTER_DAYS, ge=1),
+    current_user: dict = Depends(get_admin_user)
+):
+    background_tasks.add_task(archive.archive_bookings, db, older_than_days)
+    return {"message": "Archival started", "older_than_days": older_than_days}
+
+@api_router.get("/admin/bookings/archive")
+async def admin_archive_status(current_user: dict = Depends(get_admin_user)):
+    return {
+        "archived": await archive.archived_stats(db),
+        "hot_bookings": await db.bookings.estimated_document_count()
+    }
+
+# ============ AUDIT ============
+
+@api_router.get("/admin/audit")
+async def admin_audit_events(
+    actor_id: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    action: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_admin_user)
+):
+    try:
+        since = date.fromisoformat(from_date).isoformat() if from_date else None
+        until = (date.fromisoformat(to_date) + timedelta(days=1)).isoformat() if to_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be YYYY-MM-DD dates")
+    page = await find_events(read_db, actor_id, entity_type, entity_id, action, since, until, cursor, limit)
+    return fast_json({"events": page["items"], "next_cursor": page["next_cursor"], "writer": audit_log.stats()})
+
+# ============ PARTITIONS ============
+
+@api_router.get("/admin/partitions")
+async def admin_partitions(current_user: dict = Depends(get_admin_user)):
+    if not partition_router.enabled:
+        return {"enabled": False, "partitions": {}, "cities": []}
+    return fast_json({"enabled": True, **await partition_router.status()})
+
+@api_router.put("/admin/partitions/cities/{city}")
+async def admin_move_city(
+    city: str,
+    data: CityPartition,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_admin_user)
+):
+    if not partition_router.enabled:
+        raise HTTPException(status_code=400, detail="No partitions configured")
+    if data.partition not in partition_router.handles:
+        raise HTTPException(status_code=400, detail="Unknown partition")
+    try:
+        await check_move(partition_router, city, data.partition)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    background_tasks.add_task(move_city, partition_router, city, data.partition)
+    return {"message": "Move started", "city": city, "partition": data.partition}
+
+# ============ DIAGNOSTICS ============
+
+@api_router.get("/admin/diagnostics/slow-queries")
+async def admin_slow_queries(
+    since_minutes: int = Query(60, ge=1, le=10080),
+    collection: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_admin_user)
+):
+    shapes = await slow_query_report(db, since_minutes, collection, limit)
+    return fast_json({"recorder": slow_op_recorder.stats(), "shapes": shapes})
+
+# ============ REPORTS ============
+
+def require_reports():
+    if not reports.REPORTS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Reporting dependencies (pandas, pyarrow) are not installed")
+
+async def snapshot_reports():
+    try:
+        await reports.snapshot(analytics_db)
+    except reports.SnapshotRunning:
+        logger.info("Report snapshot skipped; another one is running")
+
+@api_router.post("/admin/reports/snapshot")
+async def admin_snapshot_reports(background_tasks: BackgroundTasks, current_user: dict = Depends(get_admin_user)):
+    require_reports()
+    if reports.snapshot_running():
+        raise HTTPException(status_code=409, detail="A snapshot is already running")
+    background_tasks.add_task(snapshot_reports)
+    return {"message": "Snapshot started"}
+
+@api_router.get("/admin/reports")
+async def admin_reports_status(current_user: dict = Depends(get_admin_user)):
+    manifest = reports.load_manifest()
+    return {
+        "available": reports.REPORTS_AVAILABLE,
+        "reports": list(reports.REPORTS),
+        "snapshot_running": reports.snapshot_running(),
+        "snapshots": {
+            name: {"snapshot_at": entry["snapshot_at"], "watermark": entry["watermark"], "parts": len(entry["parts"])}
+            for name, entry in manifest.items()
+        }
+    }
+
+@api_router.get("/admin/reports/{name}")
+async def admin_get_report(
+    name: str,
+    request: Request,
+    days: Optional[int] = Query(None, ge=1, le=3650),
+    months: Optional[int] = Query(None, ge=1, le=60),
+    current_user: dict = Depends(get_admin_user)
+):
+    require_reports()
+    if name not in reports.REPORTS:
+        raise HTTPException(status_code=404, detail="Unknown report")
+    
+    async def load():
+        try:
+            # pandas work is CPU-bound; keep it off the event loop.
+            return await asyncio.to_thread(reports.run_report, name, days=days, months=months)
+        except LookupError as e:
+            raise HTTPException(status_code=409, detail=f"{e}; run a snapshot first")
+    
+    # Keyed on the snapshot, so a new one (from any worker or the CLI) is
+    # picked up without invalidating every worker's cache.
+    key = cache_key(f"{REPORTS_PREFIX}{name}", days=days, months=months, snapshot=reports.snapshot_version())
+    report = await response_cache.get_or_render(key, CACHE_TTLS["reports"], load)
+    return conditional_rendered(request, report, "reports")
+
 @api_router.post("/admin/categories")
 async def admin_create_category(name: str, icon: str, description: str, current_user: dict = Depends(get_admin_user)):
     category_doc = {
@@ -628,7 +1601,9 @@ async def admin_create_category(name: str, icon: str, description: str, current_
         "provider_count": 0
     }
     await db.service_categories.insert_one(category_doc)
-    return {k: v for k, v in category_doc.items() if k != "_id"}
+    catalog.invalidate()
+    await response_cache.invalidate(CATALOG_PREFIX)
+    return without_id(category_doc)
 
 @api_router.post("/admin/sub-services")
 async def admin_create_sub_service(category_id: str, name: str, description: str, icon: str, current_user: dict = Depends(get_admin_user)):
@@ -640,49 +1615,110 @@ async def admin_create_sub_service(category_id: str, name: str, description: str
         "icon": icon
     }
     await db.sub_services.insert_one(sub_service_doc)
-    return {k: v for k, v in sub_service_doc.items() if k != "_id"}
+    catalog.invalidate()
+    await response_cache.invalidate(CATALOG_PREFIX)
+    return without_id(sub_service_doc)
+
+@api_router.put("/admin/categories/{category_id}")
+async def admin_update_category(
+    category_id: str,
+    background_tasks: BackgroundTasks,
+    name: Optional[str] = None,
+    icon: Optional[str] = None,
+    description: Optional[str] = None,
+    current_user: dict = Depends(get_admin_user)
+):
+    changes = {k: v for k, v in {"name": name, "icon": icon, "description": description}.items() if v is not None}
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    category = await db.service_categories.find_one_and_update(
+        {"id": category_id}, {"$set": changes}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    catalog.invalidate()
+    await response_cache.invalidate(CATALOG_PREFIX)
+    if name is not None:
+        background_tasks.add_task(refresh_provider_names, fan_out_category_name, category_id, name)
+    return category
+
+@api_router.put("/admin/sub-services/{sub_service_id}")
+async def admin_update_sub_service(
+    sub_service_id: str,
+    background_tasks: BackgroundTasks,
+    name: Optional[str] = None,
+    icon: Optional[str] = None,
+    description: Optional[str] = None,
+    current_user: dict = Depends(get_admin_user)
+):
+    changes = {k: v for k, v in {"name": name, "icon": icon, "description": description}.items() if v is not None}
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    sub_service = await db.sub_services.find_one_and_update(
+        {"id": sub_service_id}, {"$set": changes}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if not sub_service:
+        raise HTTPException(status_code=404, detail="Sub-service not found")
+    catalog.invalidate()
+    await response_cache.invalidate(CATALOG_PREFIX)
+    if name is not None:
+        background_tasks.add_task(refresh_provider_names, fan_out_sub_service_name, sub_service_id, name)
+    return sub_service
 
 @api_router.delete("/admin/categories/{category_id}")
-async def admin_delete_category(category_id: str, current_user: dict = Depends(get_admin_user)):
+async def admin_delete_category(category_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(get_admin_user)):
+    sub_services = await db.sub_services.find({"category_id": category_id}, {"_id": 0, "id": 1}).to_list(None)
     await db.service_categories.delete_one({"id": category_id})
     await db.sub_services.delete_many({"category_id": category_id})
+    catalog.invalidate()
+    await response_cache.invalidate(CATALOG_PREFIX)
+    background_tasks.add_task(refresh_provider_names, fan_out_category_name, category_id, None)
+    for sub_service in sub_services:
+        background_tasks.add_task(refresh_provider_names, fan_out_sub_service_name, sub_service["id"], None)
     return {"message": "Category deleted"}
 
 @api_router.delete("/admin/sub-services/{sub_service_id}")
-async def admin_delete_sub_service(sub_service_id: str, current_user: dict = Depends(get_admin_user)):
+async def admin_delete_sub_service(sub_service_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(get_admin_user)):
     await db.sub_services.delete_one({"id": sub_service_id})
+    catalog.invalidate()
+    await response_cache.invalidate(CATALOG_PREFIX)
+    background_tasks.add_task(refresh_provider_names, fan_out_sub_service_name, sub_service_id, None)
     return {"message": "Sub-service deleted"}
 
+@api_router.get("/admin/catalog/consistency")
+async def admin_catalog_consistency(repair: bool = False, current_user: dict = Depends(get_admin_user)):
+    report = await check_provider_names(db, repair=repair)
+    if report["repaired"]:
+        await response_cache.invalidate(PROVIDER_LIST_PREFIX, provider_detail_prefix())
+    return report
+
 # ============ CITIES ============
 
 @api_router.get("/cities")
-async def get_cities():
-    return {
-        "cities": [
-            {"id": "delhi", "name": "Delhi", "state": "Delhi"},
-            {"id": "mumbai", "name": "Mumbai", "state": "Maharashtra"},
-            {"id": "bangalore", "name": "Bangalore", "state": "Karnataka"},
-            {"id": "chennai", "name": "Chennai", "state": "Tamil Nadu"},
-            {"id": "kolkata", "name": "Kolkata", "state": "West Bengal"},
-            {"id": "hyderabad", "name": "Hyderabad", "state": "Telangana"},
-            {"id": "pune", "name": "Pune", "state": "Maharashtra"},
-            {"id": "ahmedabad", "name": "Ahmedabad", "state": "Gujarat"},
-            {"id": "jaipur", "name": "Jaipur", "state": "Rajasthan"},
-            {"id": "lucknow", "name": "Lucknow", "state": "Uttar Pradesh"}
-        ],
-        "villages": [
-            {"id": "himatnagar", "name": "Himatnagar", "state": "Gujarat"},
-            {"id": "mehsana", "name": "Mehsana", "state": "Gujarat"},
-            {"id": "palanpur", "name": "Palanpur", "state": "Gujarat"},
-            {"id": "nadiad", "name": "Nadiad", "state": "Gujarat"},
-            {"id": "anand", "name": "Anand", "state": "Gujarat"},
-            {"id": "junagadh", "name": "Junagadh", "state": "Gujarat"},
-            {"id": "porbandar", "name": "Porbandar", "state": "Gujarat"},
-            {"id": "gandhidham", "name": "Gandhidham", "state": "Gujarat"},
-            {"id": "bhuj", "name": "Bhuj", "state": "Gujarat"},
-            {"id": "morbi", "name": "Morbi", "state": "Gujarat"}
-        ]
-    }
+async def get_cities(request: Request):
+    return conditional_rendered(request, CITIES_PAYLOAD, "cities")
+
+# ============ HEALTH ============
+
+@api_router.get("/health/db")
+async def health_db():
+    # Public probes only learn whether Mongo answers; pool details are admin-only.
+    health = await pool_health()
+    return {"status": health["status"]}
+
+@api_router.get("/admin/health/db")
+async def admin_health_db(current_user: dict = Depends(get_admin_user)):
+    return await pool_health()
+
+@api_router.get("/health/cache")
+async def health_cache():
+    return response_cache.stats()
+
+@api_router.get("/health/ready")
+async def health_ready(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
 
 # ============ SEED DATA ============
 
@@ -803,6 +1839,9 @@ async def seed_data():
         {"name": "Quick Movers", "email": "quickmovers@vokzo.com", "category": "local-services", "sub_service": "movers", "exp": 10, "price": 4000, "city": "Junagadh", "rating": 4.5, "reviews": 67}
     ]
     
+    category_names = {c["id"]: c["name"] for c in categories}
+    sub_service_names = {s["id"]: s["name"] for s in sub_services}
+    
     for p in sample_providers:
         user_id = str(uuid.uuid4())
         provider_id = str(uuid.uuid4())
@@ -826,9 +1865,18 @@ async def seed_data():
             "full_name": p["name"],
             "email": p["email"],
             "category_id": p["category"],
+            "category_name": category_names[p["category"]],
             "sub_service_id": p["sub_service"],
+            "sub_service_name": sub_service_names[p["sub_service"]],
             "experience": p["exp"],
             "base_price": p["price"],
+            "offerings": [{
+                "sub_service_id": p["sub_service"],
+                "sub_service_name": sub_service_names[p["sub_service"]],
+                "category_id": p["category"],
+                "price": p["price"],
+                "duration_minutes": DEFAULT_DURATION_MINUTES
+            }],
             "rating": p["rating"],
             "total_reviews": p["reviews"],
             "is_verified": True,
@@ -837,27 +1885,107 @@ async def seed_data():
             "city": p["city"],
             "created_at": datetime.now(timezone.utc).isoformat()
         }
+        provider_doc["rank_score"] = ranking.compute_score(provider_doc)
         await db.providers.insert_one(provider_doc)
     
+    catalog.invalidate()
+    await response_cache.clear()
     return {"message": "Data seeded successfully with 30 sample providers"}
 
 # Include router
 app.include_router(api_router)
 
+@app.exception_handler(PartitionMoving)
+async def partition_moving_handler(request: Request, exc: PartitionMoving):
+    # Writes to a city pause for a few seconds while it switches partitions.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc.city} is briefly read-only for maintenance, please retry"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(PartitionQueryError)
+async def partition_query_handler(request: Request, exc: PartitionQueryError):
+    # Filters that would need a cross-partition merge the router cannot do.
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+# Everything not already compressed by conditional_rendered.
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed"],
 )
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# ============ STARTUP ============
+
+async def warm_up():
+    await prime_pool()
+    await slow_op_recorder.start(db)
+    await audit_log.start(db)
+    await ensure_indexes()
+    if isinstance(response_cache.backend, MongoBackend):
+        await response_cache.backend.ensure_indexes()
+    await idempotency.ensure_indexes()
+    await catalog.load(db)
+    if await claim_startup_maintenance():
+        await startup_maintenance()
+    await dispatcher.start()
+    await ranking.rescorer.start(db, on_rescore=lambda: response_cache.invalidate(PROVIDER_LIST_PREFIX))
+
+async def claim_startup_maintenance() -> bool:
+    """True for the one worker that runs the one-time backfills and repairs.
+
+    The claim holds for STARTUP_MAINTENANCE_LEASE_SECONDS, so workers of
+    one rollout skip them; if the claimant dies, a later start runs them.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=STARTUP_MAINTENANCE_LEASE_SECONDS)).isoformat()
+    try:
+        await db.startup_state.find_one_and_update(
+            {"_id": "maintenance", "claimed_at": {"$lt": cutoff}},
+            {"$set": {"claimed_at": now.isoformat()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def startup_maintenance():
+    await backfill_booking_category_ids()
+    await backfill_offerings(db)
+    # Backfills names on providers written before they were denormalized
+    # and repairs any fan-out interrupted by a restart.
+    await check_provider_names(db, repair=True)
+    # Dashboards read earnings only from the ledger; fill it on the first
+    # start after it was introduced.
+    if not await db.provider_earnings.find_one({}, {"_id": 1}) and (
+        await db.bookings.find_one({"status": "completed"}, {"_id": 1})
+        or await db.bookings_archive.find_one({"status": "completed"}, {"_id": 1})
+    ):
+        try:
+            await earnings.rebuild_ledger(db)
+        except earnings.LedgerRebuildRunning:
+            # An admin rebuild is filling it.
+            pass
+    # Providers from before ranking existed have no score to sort on.
+    if await db.providers.find_one({"rank_score": {"$exists": False}}, {"_id": 1}):
+        await ranking.rebuild_scores(db)
+
+async def backfill_booking_category_ids():
+    # Bookings created before category_id was stored only carry the name;
+    # the admin explorer filters and facets on the id.
+    for sub_service in catalog.sub_services.values():
+        await db.bookings.update_many(
+            {"sub_service_id": sub_service["id"], "category_id": {"$exists": False}},
+            {"$set": {"category_id": sub_service["category_id"]}}
+        )
@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+SLOW_OP_THRESHOLD_MS = float(os.environ.get('SLOW_OP_THRESHOLD_MS', 100))
+SLOW_OPS_COLLECTION = "slow_ops"
+SLOW_OPS_CAPPED_BYTES = int(os.environ.get('SLOW_OPS_CAPPED_BYTES', 16 * 1024 * 1024))
+# Records held in memory between flushes; the oldest are dropped beyond this.
+SLOW_OPS_BUFFER = 1000
+FLUSH_INTERVAL_SECONDS = 2
+# Explains queued at once; a burst of new shapes beyond this waits for the
+# next slow occurrence.
+EXPLAIN_QUEUE_SIZE = 50
+
+# Commands whose filter shape we record, and the field holding it.
+TRACKED = {
+    "find": "filter",
+    "aggregate": "pipeline",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "update": "updates",
+    "delete": "deletes",
+}
+# Writes are explained without executing the plan.
+READ_COMMANDS = {"find", "aggregate", "count", "distinct"}
+# Driver and session fields that are not part of the command proper.
+_DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+
+def normalize(value):
+    """Replaces literal values with their type so equal-shaped queries compare equal."""
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        # Operator lists like $and/$or keep their structure; value lists
+        # ($in, ...) collapse to one element.
+        shapes = [normalize(v) for v in value]
+        if all(isinstance(v, dict) for v in value):
+            return shapes
+        return [shapes[0]] if shapes else []
+    return type(value).__name__
+
+
+def query_shape(command_name: str, command: dict) -> dict:
+    field = TRACKED[command_name]
+    shape = {"filter": normalize(command.get(field, {}))}
+    if command_name in ("update", "delete"):
+        shape = {"filter": [normalize(op.get("q", {})) for op in command.get(field, [])][:1]}
+    if command.get("sort"):
+        shape["sort"] = dict(command["sort"])
+    return shape
+
+
+def shape_id(collection: str, command_name: str, shape: dict) -> str:
+    raw = json.dumps([collection, command_name, shape], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _docs_returned(command_name: str, reply: dict) -> Optional[int]:
+    if "cursor" in reply:
+        return len(reply["cursor"].get("firstBatch", []))
+    if command_name == "count":
+        return reply.get("n")
+    if command_name == "distinct":
+        return len(reply.get("values", []))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return reply.get("nModified", reply.get("n"))
+
+
+def _find_key(doc, key):
+    """First value under `key` anywhere in an explain document."""
+    if isinstance(doc, dict):
+        if key in doc:
+            return doc[key]
+        children = doc.values()
+    elif isinstance(doc, list):
+        children = doc
+    else:
+        return None
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan) -> list:
+    stages = []
+    while isinstance(plan, dict):
+        stage = plan.get("stage")
+        if stage:
+            stages.append(f"{stage}({plan['indexName']})" if plan.get("indexName") else stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0] or plan.get("queryPlan")
+    return stages
+
+
+def summarize_explain(explain: dict) -> dict:
+    stats = _find_key(explain, "executionStats") or {}
+    winning = _find_key(explain, "winningPlan") or {}
+    return {
+        "plan": _plan_stages(winning),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "n_returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowOpRecorder(monitoring.CommandListener):
+    """Records commands slower than the threshold and explains each new shape once.
+
+    Command events fire on driver threads, so they only append to a
+    buffer; a task on the event loop writes the buffer to a capped
+    collection and runs explains.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_OP_THRESHOLD_MS):
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        self._started = {}
+        self._buffer = deque(maxlen=SLOW_OPS_BUFFER)
+        self._explained = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._explain_queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.database = None
+        self.recorded = 0
+        self.dropped_explains = 0
+
+    # ---------- driver callbacks (any thread) ----------
+
+    def started(self, event):
+        if self._loop is None or event.command_name not in TRACKED:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str) or collection == SLOW_OPS_COLLECTION:
+            return
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (event.database_name, collection, event.command)
+
+    def succeeded(self, event):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        database_name, collection, command = started
+        try:
+            shape = query_shape(event.command_name, command)
+        except Exception:
+            logger.debug("Could not normalize %s command", event.command_name, exc_info=True)
+            return
+        sid = shape_id(collection, event.command_name, shape)
+        self._buffer.append({
+            "kind": "op",
+            "shape_id": sid,
+            "database": database_name,
+            "collection": collection,
+            "command": event.command_name,
+            "shape": json.dumps(shape, sort_keys=True),
+            "duration_ms": round(duration_ms, 3),
+            "docs_returned": _docs_returned(event.command_name, event.reply),
+            "at": datetime.now(timezone.utc),
+        })
+        loop = self._loop
+        if loop is not None and sid not in self._explained:
+            self._explained.add(sid)
+            loop.call_soon_threadsafe(self._queue_explain, sid, database_name, collection, event.command_name, command)
+
+    def failed(self, event):
+        with self._lock:
+            self._started.pop((event.connection_id, event.request_id), None)
+
+    # ---------- event loop side ----------
+
+    async def start(self, database):
+        self.database = database
+        try:
+            await database.create_collection(SLOW_OPS_COLLECTION, capped=True, size=SLOW_OPS_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass  # already exists
+        await database[SLOW_OPS_COLLECTION].create_index([("kind", 1), ("at", -1)])
+        self._explain_queue = asyncio.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._explain_loop())]
+
+    async def stop(self):
+        self._loop = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+    def _queue_explain(self, sid: str, database_name: str, collection: str, command_name: str, command: dict):
+        try:
+            self._explain_queue.put_nowait((sid, database_name, collection, command_name, command))
+        except asyncio.QueueFull:
+            # Let a later occurrence of this shape try again.
+            self._explained.discard(sid)
+            self.dropped_explains += 1
+
+    async def flush(self):
+        records = []
+        while self._buffer:
+            records.append(self._buffer.popleft())
+        if records and self.database is not None:
+            await self.database[SLOW_OPS_COLLECTION].insert_many(records, ordered=False)
+            self.recorded += len(records)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Could not write slow operation records")
+
+    async def _explain_loop(self):
+        while True:
+            sid, database_name, collection, command_name, command = await self._explain_queue.get()
+            try:
+                await self._explain(sid, database_name, collection, command_name, command)
+            except Exception as e:
+                logger.warning("Explain failed for slow %s on %s: %s", command_name, collection, e)
+
+    async def _explain(self, sid: str, database_name: str, collection: str, command_name: str, command: dict):
+        explainable = {k: v for k, v in command.items() if not k.startswith("$") and k not in _DRIVER_FIELDS}
+        if command_name in ("update", "delete"):
+            # Explain the first statement of a batch; they share a shape.
+            explainable[TRACKED[command_name]] = explainable[TRACKED[command_name]][:1]
+        verbosity = "executionStats" if command_name in READ_COMMANDS else "queryPlanner"
+        # Partitioned collections may live in another database of the cluster.
+        target = self.database.client[database_name] if database_name != self.database.name else self.database
+        explain = await target.command({"explain": explainable, "verbosity": verbosity})
+        await self.database[SLOW_OPS_COLLECTION].insert_one({
+            "kind": "explain",
+            "shape_id": sid,
+            "database": database_name,
+            "collection": collection,
+            "command": command_name,
+            "verbosity": verbosity,
+            **summarize_explain(explain),
+            "at": datetime.now(timezone.utc),
+        })
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "recorded": self.recorded,
+            "buffered": len(self._buffer),
+            "shapes_explained": len(self._explained),
+            "dropped_explains": self.dropped_explains,
+        }
+
+
+def _percentile(ordered: list, q: float) -> float:
+    # Nearest-rank on an already sorted list.
+    index = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+async def slow_query_report(database, since_minutes: int = 60, collection: Optional[str] = None, limit: int = 50) -> list:
+    """Slow operations grouped by shape, slowest total time first."""
+    match = {"kind": "op", "at": {"$gte": datetime.now(timezone.utc) - timedelta(minutes=since_minutes)}}
+    if collection:
+        match["collection"] = collection
+    groups = await database[SLOW_OPS_COLLECTION].aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$shape_id",
+            "collection": {"$first": "$collection"},
+            "command": {"$first": "$command"},
+            "shape": {"$first": "$shape"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "durations": {"$push": "$duration_ms"},
+            "docs_returned_avg": {"$avg": "$docs_returned"},
+            "last_seen": {"$max": "$at"},
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit},
+    ]).to_list(limit)
+
+    plans = {}
+    async for explain in database[SLOW_OPS_COLLECTION].find(
+        {"kind": "explain", "shape_id": {"$in": [g["_id"] for g in groups]}}, {"_id": 0}
+    ).sort("at", 1):
+        plans[explain["shape_id"]] = explain
+
+    report = []
+    for group in groups:
+        durations = sorted(group.pop("durations"))
+        plan = plans.get(group["_id"], {})
+        report.append({
+            "shape_id": group.pop("_id"),
+            **group,
+            "shape": json.loads(group["shape"]),
+            "total_ms": round(group["total_ms"], 3),
+            "docs_returned_avg": round(group["docs_returned_avg"], 2) if group["docs_returned_avg"] is not None else None,
+            "p50_ms": _percentile(durations, 50),
+            "p95_ms": _percentile(durations, 95),
+            "p99_ms": _percentile(durations, 99),
+            "max_ms": durations[-1],
+            "plan": plan.get("plan"),
+            "docs_examined": plan.get("docs_examined"),
+            "keys_examined": plan.get("keys_examined"),
+            "explain_returned": plan.get("n_returned"),
+        })
+    return report
+
+
+slow_op_recorder = SlowOpRecorder()
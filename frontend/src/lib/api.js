@@ -18,6 +18,27 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// POSTs that create something carry an Idempotency-Key and are retried
+// with the same key on network failures, so a retry can never create a
+// duplicate: the server replays the first response instead.
+const MAX_CREATE_ATTEMPTS = 3;
+
+const newIdempotencyKey = () =>
+  window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+const postIdempotent = async (url, data) => {
+  const headers = { 'Idempotency-Key': newIdempotencyKey() };
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await api.post(url, data, { headers });
+    } catch (error) {
+      // Only retry when no response arrived; real errors surface as before.
+      if (error.response || attempt >= MAX_CREATE_ATTEMPTS) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 500 * attempt));
+    }
+  }
+};
+
 // Services API
 export const servicesApi = {
   getCategories: () => api.get('/services/categories'),
@@ -29,14 +50,22 @@ export const servicesApi = {
 // Providers API
 export const providersApi = {
   getAll: (params) => api.get('/providers', { params }),
-  getById: (id) => api.get(`/providers/${id}`),
+  getById: (id, params) => api.get(`/providers/${id}`, { params }),
+  getReviews: (id, params) => api.get(`/providers/${id}/reviews`, { params }),
+  getBatch: (ids) => api.get('/providers/batch', { params: { ids: ids.join(',') } }),
   toggleOnline: () => api.put('/providers/toggle-online'),
-  getDashboardStats: () => api.get('/providers/dashboard/stats')
+  updateOfferings: (offerings) => api.put('/providers/offerings', { offerings }),
+  getDashboardStats: () => api.get('/providers/dashboard/stats'),
+  getEarnings: (params) => api.get('/providers/dashboard/earnings', { params })
 };
 
 // Bookings API
 export const bookingsApi = {
-  create: (data) => api.post('/bookings', data),
+  create: (data) => postIdempotent('/bookings', data),
+  createInstant: (data) => postIdempotent('/bookings/instant', data),
+  getOffers: () => api.get('/bookings/offers'),
+  acceptOffer: (id) => api.put(`/bookings/${id}/offer/accept`),
+  declineOffer: (id) => api.put(`/bookings/${id}/offer/decline`),
   getCustomerBookings: () => api.get('/bookings/customer'),
   getProviderBookings: () => api.get('/bookings/provider'),
   accept: (id) => api.put(`/bookings/${id}/accept`),
@@ -46,7 +75,7 @@ export const bookingsApi = {
 
 // Reviews API
 export const reviewsApi = {
-  create: (data) => api.post('/reviews', data)
+  create: (data) => postIdempotent('/reviews', data)
 };
 
 // Admin API
@@ -54,11 +83,33 @@ export const adminApi = {
   getProviders: () => api.get('/admin/providers'),
   approveProvider: (id) => api.put(`/admin/providers/${id}/approve`),
   rejectProvider: (id) => api.put(`/admin/providers/${id}/reject`),
+  bulkApproveProviders: (ids) => api.put('/admin/providers/bulk-approve', { ids }),
+  bulkRejectProviders: (ids) => api.put('/admin/providers/bulk-reject', { ids }),
+  getDuplicateProviders: () => api.get('/admin/providers/duplicates'),
+  foldProviders: (ids) => api.post('/admin/providers/fold', { ids }),
+  importProviders: (file, params) => api.post('/admin/providers/import', file, {
+    params,
+    headers: { 'Content-Type': file.name?.match(/\.(nd)?jsonl?$/) ? 'application/x-ndjson' : 'text/csv' }
+  }),
+  getImportStatus: (jobId) => api.get(`/admin/providers/import/${jobId}`),
+  bulkBookingStatus: (ids, status) => api.put('/admin/bookings/bulk-status', { ids, status }),
   getBookings: () => api.get('/admin/bookings'),
+  searchBookings: (params) => api.get('/admin/bookings/search', { params }),
+  archiveBookings: (olderThanDays) => api.post('/admin/bookings/archive', null, { params: { older_than_days: olderThanDays } }),
+  getArchiveStatus: () => api.get('/admin/bookings/archive'),
+  getReportsStatus: () => api.get('/admin/reports'),
+  snapshotReports: () => api.post('/admin/reports/snapshot'),
+  getReport: (name, params) => api.get(`/admin/reports/${name}`, { params }),
+  getSlowQueries: (params) => api.get('/admin/diagnostics/slow-queries', { params }),
+  getAuditEvents: (params) => api.get('/admin/audit', { params }),
+  getPartitions: () => api.get('/admin/partitions'),
+  moveCity: (city, partition) => api.put(`/admin/partitions/cities/${encodeURIComponent(city)}`, { partition }),
   getAnalytics: () => api.get('/admin/analytics'),
   updateCommission: (percentage) => api.put('/admin/settings/commission', { commission_percentage: percentage }),
   createCategory: (data) => api.post('/admin/categories', null, { params: data }),
   createSubService: (data) => api.post('/admin/sub-services', null, { params: data }),
+  updateCategory: (id, data) => api.put(`/admin/categories/${id}`, null, { params: data }),
+  updateSubService: (id, data) => api.put(`/admin/sub-services/${id}`, null, { params: data }),
   deleteCategory: (id) => api.delete(`/admin/categories/${id}`),
   deleteSubService: (id) => api.delete(`/admin/sub-services/${id}`)
 };
@@ -41,6 +41,10 @@ const AdminDashboard = () => {
   const [analytics, setAnalytics] = useState(null);
   const [providers, setProviders] = useState([]);
   const [bookings, setBookings] = useState([]);
+  const [bookingFilters, setBookingFilters] = useState({ status: '', city: '' });
+  const [bookingFacets, setBookingFacets] = useState({ status: [], city: [], category: [] });
+  const [bookingTotal, setBookingTotal] = useState(0);
+  const [bookingCursor, setBookingCursor] = useState(null);
   const [categories, setCategories] = useState([]);
   const [subServices, setSubServices] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -57,18 +61,44 @@ const AdminDashboard = () => {
     fetchData();
   }, []);
 
+  useEffect(() => {
+    fetchBookings();
+  }, [bookingFilters]);
+
+  const fetchBookings = async (cursor = null) => {
+    try {
+      const params = { limit: 50 };
+      Object.entries(bookingFilters).forEach(([key, value]) => {
+        if (value) params[key] = value;
+      });
+      if (cursor) params.cursor = cursor;
+      const res = await adminApi.searchBookings(params);
+      setBookings(cursor ? [...bookings, ...res.data.bookings] : res.data.bookings);
+      // Totals and facets only come with the first page.
+      if (!cursor) {
+        setBookingFacets(res.data.facets);
+        setBookingTotal(res.data.total);
+      }
+      setBookingCursor(res.data.next_cursor);
+    } catch (error) {
+      toast.error('Failed to load bookings');
+    }
+  };
+
+  const toggleBookingFilter = (key, value) => {
+    setBookingFilters({ ...bookingFilters, [key]: bookingFilters[key] === value ? '' : value });
+  };
+
   const fetchData = async () => {
     try {
-      const [analyticsRes, providersRes, bookingsRes, categoriesRes, subServicesRes] = await Promise.all([
+      const [analyticsRes, providersRes, categoriesRes, subServicesRes] = await Promise.all([
         adminApi.getAnalytics(),
         adminApi.getProviders(),
-        adminApi.getBookings(),
         servicesApi.getCategories(),
         servicesApi.getAllSubServices()
       ]);
       setAnalytics(analyticsRes.data);
       setProviders(providersRes.data);
-      setBookings(bookingsRes.data);
       setCategories(categoriesRes.data);
       setSubServices(subServicesRes.data);
       setCommission(analyticsRes.data.commission_percentage);
@@ -351,8 +381,26 @@ const AdminDashboard = () => {
             <div className="bg-white rounded-xl shadow-sm overflow-hidden">
               <div className="p-4 border-b border-slate-100">
                 <h2 className="font-semibold text-[#0F172A]" style={{ fontFamily: 'Poppins' }}>
-                  All Bookings
+                  All Bookings ({bookingTotal})
                 </h2>
+                {['status', 'city'].map((key) => (
+                  <div key={key} className="flex flex-wrap gap-2 mt-3">
+                    {bookingFacets[key].map((facet) => (
+                      <button
+                        key={facet.value}
+                        onClick={() => toggleBookingFilter(key, facet.value)}
+                        className={`px-3 py-1 rounded-full text-xs font-medium border ${
+                          bookingFilters[key] === facet.value
+                            ? 'bg-[#1E3A8A] text-white border-[#1E3A8A]'
+                            : 'bg-white text-slate-600 border-slate-200'
+                        }`}
+                        data-testid={`booking-filter-${key}-${facet.value}`}
+                      >
+                        {facet.value} ({facet.count})
+                      </button>
+                    ))}
+                  </div>
+                ))}
               </div>
               
               {bookings.length === 0 ? (
@@ -382,6 +430,13 @@ const AdminDashboard = () => {
                       </div>
                     </div>
                   ))}
+                  {bookingCursor && (
+                    <div className="p-4 text-center">
+                      <Button variant="outline" onClick={() => fetchBookings(bookingCursor)} data-testid="load-more-bookings">
+                        Load more
+                      </Button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
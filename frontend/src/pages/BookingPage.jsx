@@ -22,7 +22,7 @@ import {
 } from '@/components/ui/popover';
 import { toast } from 'sonner';
 import { format } from 'date-fns';
-import { ArrowLeft, Calendar as CalendarIcon, Clock, MapPin, IndianRupee, CheckCircle } from 'lucide-react';
+import { ArrowLeft, Calendar as CalendarIcon, Clock, MapPin, IndianRupee, CheckCircle, Wrench } from 'lucide-react';
 
 const timeSlots = [
   '09:00 AM', '10:00 AM', '11:00 AM', '12:00 PM',
@@ -39,6 +39,7 @@ const BookingPage = () => {
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
   const [formData, setFormData] = useState({
+    sub_service_id: '',
     booking_date: null,
     booking_time: '',
     address: '',
@@ -50,10 +51,11 @@ const BookingPage = () => {
     const fetchData = async () => {
       try {
         const [providerRes, citiesRes] = await Promise.all([
-          providersApi.getById(providerId),
+          providersApi.getById(providerId, { fields: 'full_name,sub_service_id,sub_service_name,base_price,offerings' }),
           citiesApi.getAll()
         ]);
         setProvider(providerRes.data);
+        setFormData(prev => ({ ...prev, sub_service_id: providerRes.data.sub_service_id }));
         setCities(citiesRes.data);
       } catch (error) {
         console.error('Failed to fetch data');
@@ -78,7 +80,7 @@ const BookingPage = () => {
     try {
       await bookingsApi.create({
         provider_id: providerId,
-        sub_service_id: provider.sub_service_id,
+        sub_service_id: formData.sub_service_id,
         booking_date: format(formData.booking_date, 'yyyy-MM-dd'),
         booking_time: formData.booking_time,
         address: formData.address,
@@ -96,6 +98,10 @@ const BookingPage = () => {
   };
 
   const allLocations = [...cities.cities, ...cities.villages];
+  const offerings = provider?.offerings?.length
+    ? provider.offerings
+    : [{ sub_service_id: provider?.sub_service_id, sub_service_name: provider?.sub_service_name, price: provider?.base_price }];
+  const selectedOffering = offerings.find(o => o.sub_service_id === formData.sub_service_id) || offerings[0];
 
   if (loading) {
     return (
@@ -162,10 +168,10 @@ const BookingPage = () => {
               <h3 className="font-semibold text-[#0F172A]" style={{ fontFamily: 'Poppins' }}>
                 {provider.full_name}
               </h3>
-              <p className="text-sm text-slate-500">{provider.sub_service_name}</p>
+              <p className="text-sm text-slate-500">{selectedOffering.sub_service_name}</p>
               <div className="flex items-center gap-1 mt-2 text-[#1E3A8A] font-semibold">
                 <IndianRupee className="w-4 h-4" />
-                <span>{provider.base_price}</span>
+                <span>{selectedOffering.price}</span>
                 <span className="text-slate-400 font-normal text-sm">base price</span>
               </div>
             </div>
@@ -174,6 +180,31 @@ const BookingPage = () => {
 
         {/* Booking Form */}
         <form onSubmit={handleSubmit} className="bg-white rounded-xl p-6 shadow-sm space-y-6">
+          {/* Service Selection */}
+          {offerings.length > 1 && (
+            <div className="space-y-2">
+              <Label className="flex items-center gap-2">
+                <Wrench className="w-4 h-4 text-[#1E3A8A]" />
+                Service *
+              </Label>
+              <Select 
+                value={formData.sub_service_id} 
+                onValueChange={(v) => setFormData({ ...formData, sub_service_id: v })}
+              >
+                <SelectTrigger className="h-12 rounded-xl" data-testid="booking-service">
+                  <SelectValue placeholder="Select service" />
+                </SelectTrigger>
+                <SelectContent>
+                  {offerings.map((o) => (
+                    <SelectItem key={o.sub_service_id} value={o.sub_service_id}>
+                      {o.sub_service_name} · ₹{o.price}
+                    </SelectItem>
+                  ))}
+                </SelectContent>
+              </Select>
+            </div>
+          )}
+
           {/* Date Selection */}
           <div className="space-y-2">
             <Label className="flex items-center gap-2">
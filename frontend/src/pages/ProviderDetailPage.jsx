@@ -12,6 +12,7 @@ const ProviderDetailPage = () => {
   const navigate = useNavigate();
   const { user } = useAuth();
   const [provider, setProvider] = useState(null);
+  const [reviewsCursor, setReviewsCursor] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -19,6 +20,7 @@ const ProviderDetailPage = () => {
       try {
         const response = await providersApi.getById(providerId);
         setProvider(response.data);
+        setReviewsCursor(response.data.reviews_next_cursor);
       } catch (error) {
         console.error('Failed to fetch provider');
       } finally {
@@ -28,6 +30,16 @@ const ProviderDetailPage = () => {
     fetchProvider();
   }, [providerId]);
 
+  const loadMoreReviews = async () => {
+    try {
+      const response = await providersApi.getReviews(providerId, { cursor: reviewsCursor });
+      setProvider({ ...provider, reviews: [...provider.reviews, ...response.data.reviews] });
+      setReviewsCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Failed to fetch reviews');
+    }
+  };
+
   const handleBook = () => {
     if (!user) {
       navigate('/login');
@@ -228,6 +240,11 @@ const ProviderDetailPage = () => {
                     )}
                   </div>
                 ))}
+                {reviewsCursor && (
+                  <Button variant="outline" className="w-full" onClick={loadMoreReviews} data-testid="load-more-reviews">
+                    Load more reviews
+                  </Button>
+                )}
               </div>
             ) : (
               <div className="text-center py-8 bg-slate-50 rounded-xl">
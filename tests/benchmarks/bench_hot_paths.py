@@ -0,0 +1,141 @@
+"""Per-request hot helpers, checked against stored baselines.
+
+    python tests/benchmarks/bench_hot_paths.py             # compare, exit 1 on regression
+    python tests/benchmarks/bench_hot_paths.py --update    # record new baselines
+    python tests/benchmarks/bench_hot_paths.py --filter jwt --tolerance 0.5
+
+Timings are stored relative to a fixed pure-Python calibration loop run
+in the same process, so baselines recorded on one machine stay meaningful
+on another (CI runners, laptops). A benchmark regresses when its relative
+time grows by more than the tolerance (BENCH_TOLERANCE, default 25%).
+Benchmarks missing from the baseline file are reported but never fail,
+and one over the tolerance is re-measured before it counts as a regression.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "vokzo_bench")
+
+from http_cache import render_json, rendered  # noqa: E402
+from server import (  # noqa: E402
+    calculate_pricing, create_access_token, decode_access_token, get_password_hash, verify_password, without_id
+)
+from tests.benchmarks.payloads import booking_docs, provider_docs  # noqa: E402
+
+BASELINE_PATH = Path(__file__).with_name("baselines.json")
+DEFAULT_TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", 0.25))
+REPEAT = 5
+# A benchmark over the tolerance is measured again up to this many times
+# and only fails if it stays over; noise on shared runners only ever makes
+# code look slower.
+CONFIRM_RUNS = 3
+PAYLOAD_SIZES = (10, 100, 1000)
+
+
+def _calibration():
+    # Dict and string work of the same flavour as the helpers under test.
+    data = {f"key{i}": i for i in range(200)}
+    return sum(len(k) + v for k, v in data.items() if k != "key0")
+
+
+def benchmarks() -> dict:
+    token = create_access_token({"user_id": "5f0c6b2e-8a51-4a43-9d0c-3f3c1b1f0e11", "role": "customer"})
+    password_hash = get_password_hash("correct horse battery staple")
+    booking = dict(booking_docs(1)[0], _id="65f0c6b28a514a439d0c3f3c")
+
+    cases = {
+        "auth.create_access_token": lambda: create_access_token({"user_id": "5f0c6b2e", "role": "customer"}),
+        "auth.jwt_decode": lambda: decode_access_token(token),
+        "auth.verify_password": lambda: verify_password("correct horse battery staple", password_hash),
+        "pricing.calculate_pricing": lambda: calculate_pricing(450.0, 15),
+        "docs.without_id": lambda: without_id(booking),
+    }
+    for size in PAYLOAD_SIZES:
+        providers, bookings = provider_docs(size), booking_docs(size)
+        cases[f"serialize.providers.{size}"] = lambda docs=providers: render_json(docs)
+        cases[f"serialize.bookings.{size}"] = lambda docs=bookings: render_json(docs)
+    cases[f"serialize.rendered_with_etag.{PAYLOAD_SIZES[-1]}"] = lambda docs=provider_docs(PAYLOAD_SIZES[-1]): rendered(docs)
+    return cases
+
+
+def measure(fn) -> float:
+    """Best seconds per call over REPEAT runs of an auto-sized loop."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number
+
+
+def run(cases: dict, baselines: dict, tolerance: float) -> tuple:
+    # The calibration loop is re-measured between benchmarks and the best
+    # time kept, so one noisy measurement does not skew every ratio.
+    calibration = measure(_calibration)
+    timings = {}
+    for name, fn in cases.items():
+        timings[name] = measure(fn)
+        calibration = min(calibration, measure(_calibration))
+        base = baselines.get(name)
+        for _ in range(CONFIRM_RUNS if base else 0):
+            if timings[name] / calibration <= base["relative"] * (1 + tolerance):
+                break
+            timings[name] = min(timings[name], measure(fn))
+            calibration = min(calibration, measure(_calibration))
+    results = {
+        name: {"us_per_call": round(seconds * 1e6, 3), "relative": round(seconds / calibration, 4)}
+        for name, seconds in timings.items()
+    }
+    return calibration, results
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> list:
+    regressions = []
+    print(f"{'benchmark':<36} {'us/call':>11} {'relative':>10} {'baseline':>10} {'change':>8}")
+    for name, result in results.items():
+        base = baselines.get(name)
+        if base is None:
+            print(f"{name:<36} {result['us_per_call']:>11.3f} {result['relative']:>10.4f} {'-':>10} {'new':>8}")
+            continue
+        change = result["relative"] / base["relative"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSED"
+        print(f"{name:<36} {result['us_per_call']:>11.3f} {result['relative']:>10.4f} "
+              f"{base['relative']:>10.4f} {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark per-request hot helpers")
+    parser.add_argument("--update", action="store_true", help="store these results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    stored = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {"benchmarks": {}}
+    cases = {name: fn for name, fn in benchmarks().items() if args.filter in name}
+    baselines = {} if args.update else stored["benchmarks"]
+    calibration, results = run(cases, baselines, args.tolerance)
+    print(f"calibration: {calibration * 1e6:.3f} us/call, tolerance {args.tolerance:.0%}\n")
+    regressions = compare(results, stored["benchmarks"], args.tolerance)
+
+    if args.update:
+        stored["benchmarks"].update(results)
+        stored["calibration_us"] = round(calibration * 1e6, 3)
+        BASELINE_PATH.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaselines written to {BASELINE_PATH}")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
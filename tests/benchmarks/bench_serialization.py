@@ -0,0 +1,66 @@
+"""Compares response serialization paths on 100, 1k and 10k item listings.
+
+    python tests/benchmarks/bench_serialization.py
+
+Paths measured:
+  pydantic+json   response_model validation, then the stdlib json encoder
+                  (FastAPI's default for routes with response_model)
+  encoder+json    jsonable_encoder, then the stdlib json encoder
+                  (FastAPI's default for routes without response_model)
+  orjson          http_cache.render_json on the raw Mongo documents
+  cached bytes    a pre-serialized payload from the response cache
+"""
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "vokzo_bench")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from http_cache import render_json, rendered  # noqa: E402
+from server import ProviderResponse  # noqa: E402
+from tests.benchmarks.payloads import provider_docs  # noqa: E402
+
+SIZES = (100, 1000, 10000)
+
+
+def stdlib_dumps(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def serialization_paths() -> dict:
+    adapter = TypeAdapter(List[ProviderResponse])
+    return {
+        "pydantic+json": lambda docs: stdlib_dumps(adapter.dump_python(adapter.validate_python(docs), mode="json")),
+        "encoder+json": lambda docs: stdlib_dumps(jsonable_encoder(docs)),
+        "orjson": render_json,
+    }
+
+
+def main():
+    paths = serialization_paths()
+
+    print(f"{'items':>6}  {'path':<14} {'ms/call':>10} {'speedup':>8}")
+    for size in SIZES:
+        docs = provider_docs(size)
+        number = max(1, 20000 // size)
+        baseline = None
+        for name, fn in paths.items():
+            per_call = min(timeit.repeat(lambda: fn(docs), number=number, repeat=5)) / number * 1000
+            baseline = baseline or per_call
+            print(f"{size:>6}  {name:<14} {per_call:>10.3f} {baseline / per_call:>7.1f}x")
+        payload = rendered(docs)
+        per_call = min(timeit.repeat(lambda: payload["body"], number=number * 100, repeat=5)) / (number * 100) * 1000
+        print(f"{size:>6}  {'cached bytes':<14} {per_call:>10.5f} {baseline / per_call:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
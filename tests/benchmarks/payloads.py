@@ -0,0 +1,75 @@
+"""Representative Mongo documents for serialization benchmarks."""
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+CITIES = ["Mumbai", "Delhi", "Bangalore", "Ahmedabad", "Himatnagar", "Mehsana"]
+SUB_SERVICES = [
+    ("home-services", "Home Services", "plumber", "Plumber"),
+    ("home-services", "Home Services", "electrician", "Electrician"),
+    ("appliance-services", "Appliance Services", "ac-repair", "AC Repair"),
+    ("tech-services", "Tech Services", "mobile-repair", "Mobile Repair"),
+]
+STATUSES = ["pending", "accepted", "completed", "rejected"]
+
+
+def _created_at(rng: random.Random) -> str:
+    return (datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=rng.randint(0, 400000))).isoformat()
+
+
+def provider_docs(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        category_id, category_name, sub_service_id, sub_service_name = rng.choice(SUB_SERVICES)
+        docs.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "full_name": f"Provider {i}",
+            "email": f"provider{i}@vokzo.com",
+            "category_id": category_id,
+            "category_name": category_name,
+            "sub_service_id": sub_service_id,
+            "sub_service_name": sub_service_name,
+            "experience": rng.randint(1, 20),
+            "base_price": float(rng.choice([250, 300, 350, 400, 500, 800])),
+            "rating": round(rng.uniform(3.5, 5.0), 1),
+            "total_reviews": rng.randint(0, 400),
+            "is_verified": True,
+            "is_approved": True,
+            "is_online": rng.random() < 0.6,
+            "city": rng.choice(CITIES),
+            "created_at": _created_at(rng),
+        })
+    return docs
+
+
+def booking_docs(count: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        category_id, category_name, sub_service_id, sub_service_name = rng.choice(SUB_SERVICES)
+        base_price = float(rng.choice([250, 300, 350, 400, 500, 800]))
+        commission = base_price * 15 / 100
+        docs.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "customer_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "customer_name": f"Customer {i}",
+            "provider_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "provider_name": f"Provider {i % 97}",
+            "sub_service_id": sub_service_id,
+            "sub_service_name": sub_service_name,
+            "category_id": category_id,
+            "category_name": category_name,
+            "booking_date": "2026-10-19",
+            "booking_time": "10:00",
+            "address": f"{i} MG Road",
+            "city": rng.choice(CITIES),
+            "notes": None,
+            "status": rng.choice(STATUSES),
+            "base_price": base_price,
+            "commission": commission,
+            "provider_earnings": base_price - commission,
+            "created_at": _created_at(rng),
+        })
+    return docs
@@ -0,0 +1,515 @@
+"""An in-memory stand-in for the Motor database the backend talks to.
+
+Covers the query and update operators the backend uses, unique indexes,
+upserts and the find-and-modify helpers, so modules can be tested without
+a MongoDB server. Every call yields to the event loop once, which lets
+tests interleave concurrent operations the way a real server would.
+"""
+import asyncio
+import copy
+import itertools
+import re
+
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+_MISSING = object()
+_ids = itertools.count(1)
+
+
+def get_path(doc, path: str):
+    for part in path.split("."):
+        if isinstance(doc, list):
+            values = [get_path(item, part) for item in doc if isinstance(item, dict)]
+            doc = [v for v in values if v is not _MISSING]
+            if not doc:
+                return _MISSING
+            continue
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+
+def set_path(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def unset_path(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def _candidates(value):
+    # An array field matches a condition if the array or any element does.
+    if isinstance(value, list):
+        return [value, *value]
+    return [value]
+
+
+def _compare(op: str, value, arg) -> bool:
+    if value is _MISSING or value is None or arg is None:
+        return False
+    try:
+        return {"$gt": value > arg, "$gte": value >= arg, "$lt": value < arg, "$lte": value <= arg}[op]
+    except TypeError:
+        return False
+
+
+def _operator(op: str, value, arg) -> bool:
+    if op == "$eq":
+        return any(v == arg for v in _candidates(value)) or (arg is None and value is _MISSING)
+    if op == "$ne":
+        return not _operator("$eq", value, arg)
+    if op == "$in":
+        return any(_operator("$eq", value, a) for a in arg)
+    if op == "$nin":
+        return not _operator("$in", value, arg)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return any(_compare(op, v, arg) for v in _candidates(value))
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$elemMatch":
+        return isinstance(value, list) and any(
+            matches(item, arg) if isinstance(item, dict) else _condition(item, arg) for item in value
+        )
+    if op == "$regex":
+        return any(isinstance(v, str) and re.search(arg, v) for v in _candidates(value))
+    if op == "$not":
+        return not _condition(value, arg)
+    raise NotImplementedError(f"fake_mongo does not support {op}")
+
+
+def _condition(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        options = condition.get("$options", "")
+        return all(
+            _operator(op, value, f"(?{options}){arg}" if op == "$regex" and options else arg)
+            for op, arg in condition.items() if op != "$options"
+        )
+    return _operator("$eq", value, condition)
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, q) for q in condition):
+                return False
+        elif not _condition(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc: dict, projection) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    if isinstance(projection, list):
+        projection = {field: 1 for field in projection}
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        out = {}
+        for path in included:
+            value = get_path(doc, path)
+            if value is not _MISSING:
+                set_path(out, path, value)
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    for path, keep in projection.items():
+        if not keep:
+            unset_path(doc, path)
+    return doc
+
+
+def _sort_key(value):
+    # Missing and null sort lowest, as in Mongo.
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (3, str(value))
+
+
+def sort_docs(docs: list, sort: list) -> list:
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda d: _sort_key(get_path(d, field)), reverse=direction < 0)
+    return docs
+
+
+def _normalize_sort(key_or_list, direction=None) -> list:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [tuple(item) for item in key_or_list]
+
+
+def _expression(doc: dict, expr):
+    # Field references and literals only; no aggregation operators.
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = get_path(doc, expr[1:])
+        return value if value is _MISSING else copy.deepcopy(value)
+    if isinstance(expr, dict):
+        if any(k.startswith("$") for k in expr):
+            raise NotImplementedError(f"fake_mongo does not support {', '.join(expr)} in pipeline updates")
+        values = {k: _expression(doc, v) for k, v in expr.items()}
+        return {k: v for k, v in values.items() if v is not _MISSING}
+    if isinstance(expr, list):
+        return [None if v is _MISSING else v for v in (_expression(doc, item) for item in expr)]
+    return copy.deepcopy(expr)
+
+
+def apply_update(doc: dict, update, inserting: bool = False):
+    if isinstance(update, list):
+        for stage in update:
+            if set(stage) != {"$set"}:
+                raise NotImplementedError(f"fake_mongo does not support {', '.join(stage)} in pipeline updates")
+            values = {path: _expression(doc, expr) for path, expr in stage["$set"].items()}
+            for path, value in values.items():
+                if value is not _MISSING:
+                    set_path(doc, path, value)
+        return
+    if not any(k.startswith("$") for k in update):
+        keep = doc.get("_id")
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if keep is not None:
+            doc.setdefault("_id", keep)
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            value = copy.deepcopy(value)
+            current = get_path(doc, path)
+            if op == "$set":
+                set_path(doc, path, value)
+            elif op == "$setOnInsert":
+                if inserting:
+                    set_path(doc, path, value)
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op in ("$max", "$min"):
+                if current is _MISSING or (value > current if op == "$max" else value < current):
+                    set_path(doc, path, value)
+            elif op in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                target = [] if current is _MISSING else list(current)
+                for item in items:
+                    if op == "$push" or item not in target:
+                        target.append(item)
+                set_path(doc, path, target)
+            elif op == "$pull":
+                if current is not _MISSING:
+                    set_path(doc, path, [item for item in current if not _condition(item, value)])
+            else:
+                raise NotImplementedError(f"fake_mongo does not support {op}")
+
+
+def _seed_from_query(query: dict) -> dict:
+    doc = {}
+    for key, value in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(value, dict) and any(k.startswith("$") for k in value):
+            if "$eq" in value:
+                set_path(doc, key, copy.deepcopy(value["$eq"]))
+            continue
+        set_path(doc, key, copy.deepcopy(value))
+    return doc
+
+
+class FakeCursor:
+    def __init__(self, collection: "FakeCollection", query, projection):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def _results(self) -> list:
+        docs = [d for d in self.collection.docs if matches(d, self.query)]
+        if self._sort:
+            docs = sort_docs(list(docs), self._sort)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(d, self.projection) for d in docs]
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(0)
+        docs = self._results()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list(None):
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, database: "FakeDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.docs = []
+        self.unique = []
+
+    # ---------- reads ----------
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return FakeCursor(self, filter, projection)
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        docs = await self.find(filter, projection).limit(1).to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter, **kwargs) -> int:
+        await asyncio.sleep(0)
+        return sum(1 for d in self.docs if matches(d, filter))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        await asyncio.sleep(0)
+        return len(self.docs)
+
+    async def distinct(self, key: str, filter=None, **kwargs) -> list:
+        values = []
+        for doc in await self.find(filter).to_list(None):
+            found = get_path(doc, key)
+            for value in found if isinstance(found, list) else [found]:
+                if value is not _MISSING and value not in values:
+                    values.append(value)
+        return values
+
+    # ---------- writes ----------
+
+    def _check_unique(self, doc: dict, ignore=None):
+        for fields in [("_id",), *self.unique]:
+            key = tuple(get_path(doc, f) for f in fields)
+            if all(v is _MISSING for v in key):
+                continue
+            for other in self.docs:
+                if other is not ignore and tuple(get_path(other, f) for f in fields) == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {fields}")
+
+    def _insert(self, document: dict) -> dict:
+        doc = copy.deepcopy(document)
+        doc.setdefault("_id", next(_ids))
+        self._check_unique(doc)
+        self.docs.append(doc)
+        # Like pymongo, the caller's document gets the generated _id.
+        document.setdefault("_id", doc["_id"])
+        return doc
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        await asyncio.sleep(0)
+        return InsertOneResult(self._insert(document)["_id"], True)
+
+    async def insert_many(self, documents: list, ordered: bool = True, **kwargs) -> InsertManyResult:
+        await asyncio.sleep(0)
+        ids, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                ids.append(self._insert(document)["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids)})
+        return InsertManyResult(ids, True)
+
+    def _update(self, filter: dict, update, upsert: bool, many: bool, replace: bool = False) -> dict:
+        matched = modified = 0
+        upserted_id = None
+        for doc in [d for d in self.docs if matches(d, filter)]:
+            before = copy.deepcopy(doc)
+            candidate = copy.deepcopy(doc)
+            apply_update(candidate, update)
+            self._check_unique(candidate, ignore=doc)
+            doc.clear()
+            doc.update(candidate)
+            matched += 1
+            modified += doc != before
+            if not many:
+                break
+        if not matched and upsert:
+            doc = {} if replace else _seed_from_query(filter)
+            apply_update(doc, update, inserting=True)
+            upserted_id = self._insert(doc)["_id"]
+        return {"n": matched + (upserted_id is not None), "nModified": modified, "upserted": upserted_id}
+
+    def _result(self, raw: dict) -> UpdateResult:
+        result = {"n": raw["n"], "nModified": raw["nModified"]}
+        if raw["upserted"] is not None:
+            result["upserted"] = raw["upserted"]
+        return UpdateResult(result, True)
+
+    async def update_one(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        await asyncio.sleep(0)
+        return self._result(self._update(filter, update, upsert, many=False))
+
+    async def update_many(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        await asyncio.sleep(0)
+        return self._result(self._update(filter, update, upsert, many=True))
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        await asyncio.sleep(0)
+        return self._result(self._update(filter, replacement, upsert, many=False, replace=True))
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        await asyncio.sleep(0)
+        return DeleteResult({"n": self._delete(filter, many=False)}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        await asyncio.sleep(0)
+        return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    def _delete(self, filter: dict, many: bool) -> int:
+        gone = [d for d in self.docs if matches(d, filter)]
+        if not many:
+            gone = gone[:1]
+        self.docs = [d for d in self.docs if all(d is not g for g in gone)]
+        return len(gone)
+
+    async def find_one_and_update(
+        self, filter: dict, update, projection=None, sort=None, upsert: bool = False,
+        return_document=ReturnDocument.BEFORE, **kwargs
+    ):
+        await asyncio.sleep(0)
+        docs = [d for d in self.docs if matches(d, filter)]
+        if sort:
+            docs = sort_docs(docs, _normalize_sort(sort))
+        if docs:
+            doc = docs[0]
+            before = project(doc, projection)
+            candidate = copy.deepcopy(doc)
+            apply_update(candidate, update)
+            self._check_unique(candidate, ignore=doc)
+            doc.clear()
+            doc.update(candidate)
+            return project(doc, projection) if return_document == ReturnDocument.AFTER else before
+        if not upsert:
+            return None
+        doc = _seed_from_query(filter)
+        apply_update(doc, update, inserting=True)
+        doc = self._insert(doc)
+        return project(doc, projection) if return_document == ReturnDocument.AFTER else None
+
+    async def find_one_and_delete(self, filter: dict, projection=None, **kwargs):
+        await asyncio.sleep(0)
+        for doc in self.docs:
+            if matches(doc, filter):
+                self.docs = [d for d in self.docs if d is not doc]
+                return project(doc, projection)
+        return None
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        await asyncio.sleep(0)
+        totals = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0, "upserted": [],
+                  "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    totals["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raw = self._update(
+                        request._filter, request._doc, bool(request._upsert),
+                        many=isinstance(request, UpdateMany), replace=isinstance(request, ReplaceOne)
+                    )
+                    if raw["upserted"] is not None:
+                        totals["nUpserted"] += 1
+                        totals["upserted"].append({"index": index, "_id": raw["upserted"]})
+                    else:
+                        totals["nMatched"] += raw["n"]
+                    totals["nModified"] += raw["nModified"]
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    totals["nRemoved"] += self._delete(request._filter, many=isinstance(request, DeleteMany))
+                else:
+                    raise NotImplementedError(f"fake_mongo does not support {type(request).__name__}")
+            except DuplicateKeyError as e:
+                totals["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if totals["writeErrors"]:
+            raise BulkWriteError(totals)
+        return BulkWriteResult(totals, True)
+
+    # ---------- collection management ----------
+
+    async def create_indexes(self, indexes: list, **kwargs) -> list:
+        for index in indexes:
+            spec = index.document
+            if spec.get("unique"):
+                fields = tuple(spec["key"])
+                if fields not in self.unique:
+                    self.unique.append(fields)
+        return [index.document["name"] for index in indexes]
+
+    async def create_index(self, keys, unique: bool = False, **kwargs) -> str:
+        fields = tuple(k for k, _ in _normalize_sort(keys))
+        if unique and fields not in self.unique:
+            self.unique.append(fields)
+        return "_".join(fields)
+
+    async def rename(self, new_name: str, dropTarget: bool = False, **kwargs):
+        await asyncio.sleep(0)
+        collections = self.database.collections
+        if new_name in collections and collections[new_name].docs and not dropTarget:
+            raise RuntimeError(f"target namespace {new_name} exists")
+        collections.pop(self.name, None)
+        self.name = new_name
+        collections[new_name] = self
+
+    async def drop(self, **kwargs):
+        await asyncio.sleep(0)
+        self.database.collections.pop(self.name, None)
+        self.docs = []
+
+
+class FakeDatabase:
+    def __init__(self, name: str = "test"):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
@@ -0,0 +1,38 @@
+"""Runs every benchmark case once, so they keep working between timing runs.
+
+No timings are asserted; that is what the scripts themselves are for.
+
+    python -m pytest tests/test_benchmarks.py
+"""
+import sys
+from pathlib import Path
+
+import orjson
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tests.benchmarks import bench_hot_paths, bench_serialization  # noqa: E402
+from tests.benchmarks.payloads import provider_docs  # noqa: E402
+
+HOT_PATHS = bench_hot_paths.benchmarks()
+
+
+@pytest.mark.parametrize("name", list(HOT_PATHS))
+def test_hot_path_benchmark_runs(name):
+    HOT_PATHS[name]()
+
+
+def test_hot_path_benchmarks_exercise_the_server_helpers():
+    token = bench_hot_paths.create_access_token({"user_id": "u1", "role": "customer"})
+    assert bench_hot_paths.decode_access_token(token)["user_id"] == "u1"
+    pricing = bench_hot_paths.calculate_pricing(450.0, 15)
+    assert pricing["commission"] + pricing["provider_earnings"] == pytest.approx(450.0)
+    assert "_id" not in bench_hot_paths.without_id({"_id": "x", "id": "b1"})
+
+
+@pytest.mark.parametrize("name", list(bench_serialization.serialization_paths()))
+def test_serialization_paths_agree(name):
+    docs = provider_docs(10)
+    encode = bench_serialization.serialization_paths()[name]
+    assert [p["id"] for p in orjson.loads(encode(docs))] == [p["id"] for p in docs]
@@ -0,0 +1,77 @@
+"""Booking status transitions and bulk admin moderation.
+
+    python -m pytest tests/test_bulk_status.py
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "test")
+
+import server  # noqa: E402
+from server import BOOKING_TRANSITIONS, BulkBookingStatus, admin_bulk_booking_status  # noqa: E402
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+ADMIN = {"id": "admin-1", "role": "admin"}
+
+
+def booking(booking_id: str, status: str, **fields) -> dict:
+    return {
+        "id": booking_id, "status": status, "city": "Pune", "provider_id": "p1", "base_price": 500,
+        "commission": 50, "provider_earnings": 450, "created_at": "2026-10-19T09:00:00+00:00", **fields,
+    }
+
+
+@pytest.mark.parametrize("terminal", ["completed", "rejected", "cancelled"])
+def test_finished_bookings_cannot_reopen(terminal):
+    assert not BOOKING_TRANSITIONS.get(terminal)
+    assert "pending" not in BOOKING_TRANSITIONS.get(terminal, ())
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+def bulk(ids, status) -> dict:
+    return asyncio.run(admin_bulk_booking_status(BulkBookingStatus(ids=ids, status=status), ADMIN))
+
+
+def results(response) -> dict:
+    return {r["id"]: r["result"] for r in response["results"]}
+
+
+def test_bulk_status_reports_each_booking(database):
+    asyncio.run(database.bookings.insert_many([
+        booking("b1", "pending"), booking("b2", "accepted"), booking("b3", "completed"),
+    ]))
+    response = bulk(["b1", "b2", "b3", "missing", "b1"], "accepted")
+    assert results(response) == {"b1": "updated", "b2": "unchanged", "b3": "invalid_transition", "missing": "not_found"}
+    assert response["updated"] == 1
+    assert next(r for r in response["results"] if r["id"] == "b3")["from"] == "completed"
+    statuses = {b["id"]: b["status"] for b in database.bookings.docs}
+    assert statuses == {"b1": "accepted", "b2": "accepted", "b3": "completed"}
+
+
+def test_bulk_status_refuses_to_reopen_a_completed_booking(database):
+    asyncio.run(database.bookings.insert_one(booking("b1", "completed")))
+    response = bulk(["b1"], "pending")
+    assert results(response) == {"b1": "invalid_transition"}
+    assert response["updated"] == 0
+    assert database.bookings.docs[0]["status"] == "completed"
+
+
+def test_bulk_completion_books_earnings(database):
+    asyncio.run(database.bookings.insert_many([booking("b1", "accepted"), booking("b2", "accepted", base_price=None)]))
+    response = bulk(["b1", "b2"], "completed")
+    assert results(response) == {"b1": "updated", "b2": "unpriced"}
+    totals = asyncio.run(server.earnings.lifetime_totals(database, "p1"))
+    assert totals["gross"] == 500
@@ -0,0 +1,75 @@
+"""ResponseCache: coalesced misses and invalidation during a load.
+
+    python -m pytest tests/test_cache.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from cache import MISS, MemoryBackend, ResponseCache  # noqa: E402
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return {"version": self.calls}
+
+
+def test_concurrent_misses_share_one_load():
+    async def run():
+        cache = ResponseCache(MemoryBackend())
+        loader = Loader()
+        waiters = [asyncio.create_task(cache.get_or_load("k", 60, loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        assert await asyncio.gather(*waiters) == [{"version": 1}] * 5
+        assert loader.calls == 1
+        assert (cache.misses, cache.coalesced) == (1, 4)
+        assert await cache.get_or_load("k", 60, loader) == {"version": 1}
+        assert cache.hits == 1
+
+    asyncio.run(run())
+
+
+def test_load_overlapping_an_invalidation_is_not_stored():
+    async def run():
+        backend = MemoryBackend()
+        cache = ResponseCache(backend)
+        loader = Loader()
+        load = asyncio.create_task(cache.get_or_load("providers:list", 60, loader))
+        await asyncio.sleep(0)
+        # A write lands while the stale read is in flight.
+        await cache.invalidate("providers:")
+        loader.release.set()
+        assert await load == {"version": 1}
+        assert await backend.get("providers:list") is MISS
+        assert await cache.get_or_load("providers:list", 60, loader) == {"version": 2}
+        assert await backend.get("providers:list") == {"version": 2}
+
+    asyncio.run(run())
+
+
+def test_failed_load_reaches_every_waiter_and_is_not_stored():
+    async def run():
+        cache = ResponseCache(MemoryBackend())
+        release = asyncio.Event()
+
+        async def broken():
+            await release.wait()
+            raise RuntimeError("database down")
+
+        waiters = [asyncio.create_task(cache.get_or_load("k", 60, broken)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert cache.stats()["inflight"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,130 @@
+"""Instant-booking dispatch across workers sharing one provider pool.
+
+    python -m pytest tests/test_dispatch.py
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import dispatch  # noqa: E402
+from dispatch import Dispatcher, OnlineIndex  # noqa: E402
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+PROVIDER = {
+    "id": "p1", "city": "Pune", "is_online": True, "is_approved": True, "rank_score": 1.0,
+    "offerings": [{"sub_service_id": "s1", "price": 500}],
+}
+
+
+def fast_dispatch(monkeypatch, busy_wait: float = 5):
+    monkeypatch.setattr(dispatch, "OFFER_TIMEOUT_SECONDS", 5)
+    monkeypatch.setattr(dispatch, "POLL_INTERVAL_SECONDS", 0.02)
+    monkeypatch.setattr(dispatch, "BUSY_RETRY_SECONDS", 0.05)
+    monkeypatch.setattr(dispatch, "BUSY_WAIT_SECONDS", busy_wait)
+
+
+def booking(booking_id: str) -> dict:
+    return {
+        "id": booking_id, "city": "Pune", "sub_service_id": "s1", "status": "dispatching", "instant": True,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def worker(database) -> Dispatcher:
+    """A dispatcher with its own index, as each server worker has."""
+    index = OnlineIndex()
+    index.replace_all([PROVIDER], {})
+    return Dispatcher(database, index)
+
+
+async def status(database, booking_id: str) -> dict:
+    return await database.bookings.find_one({"id": booking_id}, {"_id": 0, "status": 1, "offered_to": 1})
+
+
+async def eventually(check, timeout: float = 2):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await check():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.02)
+
+
+def test_two_workers_never_offer_one_provider_two_bookings(monkeypatch):
+    fast_dispatch(monkeypatch)
+
+    async def run():
+        database = FakeDatabase()
+        await database.providers.insert_one(dict(PROVIDER))
+        await database.bookings.insert_many([booking("b1"), booking("b2")])
+        first, second = worker(database), worker(database)
+        first.submit("b1")
+        second.submit("b2")
+        await asyncio.sleep(0.3)
+
+        offered = [b for b in ("b1", "b2") if (await status(database, b)).get("offered_to") == "p1"]
+        assert len(offered) == 1
+        waiting = "b2" if offered == ["b1"] else "b1"
+        assert (await status(database, waiting))["status"] == "dispatching"
+
+        # The provider declines; the waiting booking gets the offer next.
+        await database.bookings.update_one({"id": offered[0]}, {"$set": {"offered_to": None}})
+        for dispatcher in (first, second):
+            dispatcher.notify(offered[0])
+
+        async def offered_to_waiting():
+            return (await status(database, waiting)).get("offered_to") == "p1"
+
+        await eventually(offered_to_waiting)
+        provider = await database.providers.find_one({"id": "p1"})
+        assert provider["offer_booking_id"] == waiting
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(run())
+
+
+def test_booking_waits_for_busy_providers_until_the_deadline(monkeypatch):
+    fast_dispatch(monkeypatch, busy_wait=0.4)
+
+    async def run():
+        database = FakeDatabase()
+        held_until = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+        await database.providers.insert_one({**PROVIDER, "offer_booking_id": "other", "offer_until": held_until})
+        await database.bookings.insert_one(booking("b1"))
+        dispatcher = worker(database)
+        dispatcher.submit("b1")
+        await asyncio.sleep(0.2)
+        assert (await status(database, "b1"))["status"] == "dispatching"
+
+        async def unassigned():
+            return (await status(database, "b1"))["status"] == "unassigned"
+
+        await eventually(unassigned)
+        provider = await database.providers.find_one({"id": "p1"})
+        assert provider["offer_booking_id"] == "other"
+
+    asyncio.run(run())
+
+
+def test_lapsed_reservation_is_taken_over(monkeypatch):
+    fast_dispatch(monkeypatch)
+
+    async def run():
+        database = FakeDatabase()
+        # Left behind by a worker that died mid-offer.
+        lapsed = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+        await database.providers.insert_one({**PROVIDER, "offer_booking_id": "dead", "offer_until": lapsed})
+        await database.bookings.insert_one(booking("b1"))
+        dispatcher = worker(database)
+        dispatcher.submit("b1")
+
+        async def offered():
+            return (await status(database, "b1")).get("offered_to") == "p1"
+
+        await eventually(offered)
+        await dispatcher.stop()
+
+    asyncio.run(run())
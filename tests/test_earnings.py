@@ -0,0 +1,179 @@
+"""Earnings ledger rebuilds racing completions.
+
+    python -m pytest tests/test_earnings.py
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import earnings  # noqa: E402
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+NOW = datetime.now(timezone.utc)
+
+
+def booking(booking_id: str, provider_id: str = "p1", status: str = "completed", price: float = 100) -> dict:
+    return {
+        "id": booking_id,
+        "provider_id": provider_id,
+        "status": status,
+        "base_price": price,
+        "commission": price / 10,
+        "provider_earnings": price - price / 10,
+        "created_at": (NOW - timedelta(days=1)).isoformat(),
+        "completed_at": (NOW - timedelta(hours=1)).isoformat() if status == "completed" else None,
+    }
+
+
+async def complete(database, booking_id: str):
+    """What transition_booking does when a provider completes a booking."""
+    await database.bookings.update_one(
+        {"id": booking_id}, {"$set": {"status": "completed", "completed_at": NOW.isoformat()}}
+    )
+    doc = await database.bookings.find_one({"id": booking_id}, {"_id": 0})
+    await earnings.record_completion(database, doc, NOW)
+
+
+async def totals(database, provider_id: str = "p1") -> dict:
+    return await earnings.lifetime_totals(database, provider_id)
+
+
+def during_scan(monkeypatch, action):
+    """Runs `action` once, right after the rebuild has read its first booking."""
+    scan = earnings._completed_bookings
+
+    async def scan_then_act(database, provider_id=None):
+        acted = False
+        async for item in scan(database, provider_id):
+            yield item
+            if not acted:
+                acted = True
+                await action()
+
+    monkeypatch.setattr(earnings, "_completed_bookings", scan_then_act)
+
+
+def test_full_rebuild_replays_bookings():
+    async def run():
+        database = FakeDatabase()
+        await database.bookings.insert_many([booking("b1"), booking("b2", price=50), booking("b3", status="pending")])
+        await database.bookings_archive.insert_one(booking("b0", price=20))
+        assert await earnings.rebuild_ledger(database) == 3
+        assert (await totals(database))["gross"] == 170
+        assert (await totals(database))["bookings"] == 3
+
+    asyncio.run(run())
+
+
+def test_completion_recorded_during_full_rebuild_survives(monkeypatch):
+    async def run():
+        database = FakeDatabase()
+        await database.bookings.insert_many([booking("b1"), booking("b2"), booking("b3", status="accepted", price=40)])
+        during_scan(monkeypatch, lambda: complete(database, "b3"))
+        await earnings.rebuild_ledger(database)
+        assert (await totals(database))["gross"] == 240
+        assert (await totals(database))["bookings"] == 3
+        assert await database[earnings.JOURNAL_COLLECTION].count_documents({}) == 0
+
+    asyncio.run(run())
+
+
+def test_completion_the_scan_already_counted_is_not_applied_twice(monkeypatch):
+    async def run():
+        database = FakeDatabase()
+        await database.bookings.insert_many([booking("b1"), booking("b2", status="accepted", price=40)])
+        # Completed before the rebuild started, recorded only while it runs.
+        await database.bookings.update_one(
+            {"id": "b2"}, {"$set": {"status": "completed", "completed_at": NOW.isoformat()}}
+        )
+        doc = await database.bookings.find_one({"id": "b2"}, {"_id": 0})
+        during_scan(monkeypatch, lambda: earnings.record_completion(database, doc, NOW))
+        await earnings.rebuild_ledger(database)
+        assert (await totals(database))["gross"] == 140
+
+    asyncio.run(run())
+
+
+def test_completion_recorded_during_provider_rebuild_survives(monkeypatch):
+    async def run():
+        database = FakeDatabase()
+        await database.bookings.insert_many([
+            booking("b1"), booking("b2"), booking("b3", status="accepted", price=40),
+            booking("c1", provider_id="p2", status="accepted", price=70),
+        ])
+        await earnings.rebuild_ledger(database)
+
+        async def two_completions():
+            await complete(database, "b3")
+            await complete(database, "c1")
+
+        during_scan(monkeypatch, two_completions)
+        await earnings.rebuild_ledger(database, "p1")
+        assert (await totals(database))["gross"] == 240
+        assert (await totals(database, "p2"))["gross"] == 70
+
+    asyncio.run(run())
+
+
+def test_one_rebuild_at_a_time(monkeypatch):
+    async def run():
+        database = FakeDatabase()
+        await database.bookings.insert_many([booking("b1"), booking("b2")])
+        second = []
+
+        async def start_another():
+            with pytest.raises(earnings.LedgerRebuildRunning):
+                await earnings.rebuild_ledger(database)
+            second.append("refused")
+
+        during_scan(monkeypatch, start_another)
+        await earnings.rebuild_ledger(database)
+        assert second == ["refused"]
+        monkeypatch.undo()
+        # The lease is released once the rebuild is done.
+        assert await earnings.rebuild_ledger(database) == 2
+
+    asyncio.run(run())
+
+
+def test_journal_left_by_a_dead_rebuild_is_replayed(monkeypatch):
+    async def run():
+        database = FakeDatabase()
+        await database.bookings.insert_many([booking("b1"), booking("b2", status="accepted", price=40)])
+        await earnings.rebuild_ledger(database)
+        # A rebuild that died with its lease held: the completion is journaled.
+        owner = await earnings._claim_rebuild(database)
+        await complete(database, "b2")
+        assert (await totals(database))["gross"] == 100
+        await database[earnings.LEDGER_STATE_COLLECTION].update_one(
+            {"_id": "rebuild", "owner": owner}, {"$set": {"until": (NOW - timedelta(seconds=1)).isoformat()}}
+        )
+        await earnings.rebuild_ledger(database, "p1")
+        assert (await totals(database))["gross"] == 140
+
+    asyncio.run(run())
+
+
+def test_failed_rebuild_keeps_the_ledger_and_its_completions(monkeypatch):
+    async def run():
+        database = FakeDatabase()
+        await database.bookings.insert_many([booking("b1"), booking("b2", status="accepted", price=40)])
+        await earnings.rebuild_ledger(database)
+
+        async def complete_then_fail():
+            await complete(database, "b2")
+            raise RuntimeError("scan failed")
+
+        during_scan(monkeypatch, complete_then_fail)
+        with pytest.raises(RuntimeError):
+            await earnings.rebuild_ledger(database)
+        assert (await totals(database))["gross"] == 140
+        assert not [name for name in database.collections if name.startswith(earnings.REBUILD_COLLECTION_PREFIX)]
+
+    asyncio.run(run())
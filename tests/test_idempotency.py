@@ -0,0 +1,165 @@
+"""Idempotency-Key handling: replays, mismatches and concurrent duplicates.
+
+    python -m pytest tests/test_idempotency.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import idempotency  # noqa: E402
+from idempotency import REPLAY_HEADER, IdempotencyStore, fingerprint  # noqa: E402
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+SCOPE = "user-1:bookings"
+
+
+class CountingHandler:
+    def __init__(self, delay: float = 0, result=None):
+        self.delay = delay
+        self.calls = 0
+        self.result = result if result is not None else {"id": "booking-1"}
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {**self.result, "call": self.calls}
+
+
+def body(response) -> dict:
+    return orjson.loads(response.body)
+
+
+def test_without_key_the_handler_always_runs():
+    async def run():
+        store = IdempotencyStore(FakeDatabase())
+        handler = CountingHandler()
+        await store.run(None, SCOPE, fingerprint({"a": 1}), handler)
+        await store.run(None, SCOPE, fingerprint({"a": 1}), handler)
+        assert handler.calls == 2
+
+    asyncio.run(run())
+
+
+def test_retry_replays_the_stored_response():
+    async def run():
+        store = IdempotencyStore(FakeDatabase())
+        handler = CountingHandler()
+        first = await store.run("k1", SCOPE, fingerprint({"a": 1}), handler)
+        again = await store.run("k1", SCOPE, fingerprint({"a": 1}), handler)
+        assert handler.calls == 1
+        assert first == {"id": "booking-1", "call": 1}
+        assert body(again) == first
+        assert again.headers[REPLAY_HEADER] == "true"
+        assert store.replayed == 1
+
+    asyncio.run(run())
+
+
+def test_keys_are_scoped():
+    async def run():
+        store = IdempotencyStore(FakeDatabase())
+        handler = CountingHandler()
+        await store.run("k1", SCOPE, fingerprint({"a": 1}), handler)
+        await store.run("k1", "user-2:bookings", fingerprint({"a": 1}), handler)
+        assert handler.calls == 2
+
+    asyncio.run(run())
+
+
+def test_reused_key_with_a_different_body_is_rejected():
+    async def run():
+        store = IdempotencyStore(FakeDatabase())
+        handler = CountingHandler()
+        await store.run("k1", SCOPE, fingerprint({"a": 1}), handler)
+        with pytest.raises(HTTPException) as exc:
+            await store.run("k1", SCOPE, fingerprint({"a": 2}), handler)
+        assert exc.value.status_code == 422
+        assert handler.calls == 1
+
+    asyncio.run(run())
+
+
+def test_client_errors_replay_and_server_errors_release_the_key():
+    async def run():
+        store = IdempotencyStore(FakeDatabase())
+
+        async def conflict():
+            raise HTTPException(status_code=400, detail="Provider is offline")
+
+        with pytest.raises(HTTPException):
+            await store.run("k1", SCOPE, fingerprint({}), conflict)
+        replay = await store.run("k1", SCOPE, fingerprint({}), CountingHandler())
+        assert replay.status_code == 400
+        assert body(replay) == {"detail": "Provider is offline"}
+
+        async def broken():
+            raise RuntimeError("database down")
+
+        with pytest.raises(RuntimeError):
+            await store.run("k2", SCOPE, fingerprint({}), broken)
+        handler = CountingHandler()
+        assert await store.run("k2", SCOPE, fingerprint({}), handler) == {"id": "booking-1", "call": 1}
+
+    asyncio.run(run())
+
+
+def test_concurrent_duplicates_run_the_handler_once():
+    async def run():
+        database = FakeDatabase()
+        # Two workers: separate stores over one collection.
+        workers = [IdempotencyStore(database), IdempotencyStore(database)]
+        handler = CountingHandler(delay=0.2)
+        results = await asyncio.gather(*(
+            workers[i % 2].run("k1", SCOPE, fingerprint({"a": 1}), handler) for i in range(4)
+        ))
+        assert handler.calls == 1
+        bodies = [r if isinstance(r, dict) else body(r) for r in results]
+        assert bodies == [{"id": "booking-1", "call": 1}] * 4
+
+    asyncio.run(run())
+
+
+def test_slow_handler_keeps_its_key(monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LOCK_SECONDS", 0.15)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 2)
+
+    async def run():
+        database = FakeDatabase()
+        first, second = IdempotencyStore(database), IdempotencyStore(database)
+        handler = CountingHandler(delay=0.6)
+        original = asyncio.create_task(first.run("k1", SCOPE, fingerprint({"a": 1}), handler))
+        # Retry from another worker long after the initial lock would have lapsed.
+        await asyncio.sleep(0.4)
+        retry = await second.run("k1", SCOPE, fingerprint({"a": 1}), handler)
+        assert await original == {"id": "booking-1", "call": 1}
+        assert handler.calls == 1
+        assert body(retry) == {"id": "booking-1", "call": 1}
+
+    asyncio.run(run())
+
+
+def test_request_whose_key_was_taken_over_does_not_overwrite_the_answer():
+    async def run():
+        database = FakeDatabase()
+        store = IdempotencyStore(database)
+        records = database["idempotency_keys"]
+
+        async def taken_over():
+            # Another worker presumed this request dead and finished first.
+            await records.update_one(
+                {}, {"$set": {"owner": "someone-else", "state": "done", "status_code": 200, "body": {"id": "theirs"}}}
+            )
+            return {"id": "mine"}
+
+        await store.run("k1", SCOPE, fingerprint({}), taken_over)
+        replay = await store.run("k1", SCOPE, fingerprint({}), CountingHandler())
+        assert body(replay) == {"id": "theirs"}
+
+    asyncio.run(run())
@@ -0,0 +1,122 @@
+"""Provider offerings: backfill, folding duplicate accounts, and listing filters.
+
+    python -m pytest tests/test_offerings.py
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "test")
+
+import offerings  # noqa: E402
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+
+def offering(sub_service_id: str, price: float) -> dict:
+    return {
+        "sub_service_id": sub_service_id, "sub_service_name": sub_service_id.title(), "category_id": "home",
+        "price": price, "duration_minutes": 60,
+    }
+
+
+def provider(provider_id: str, name: str = "Asha Rao", city: str = "Pune", reviews: int = 0, **fields) -> dict:
+    return {
+        "id": provider_id, "user_id": f"u-{provider_id}", "full_name": name, "email": f"{provider_id}@example.com",
+        "city": city, "category_id": "home", "sub_service_id": "plumbing", "sub_service_name": "Plumbing",
+        "base_price": 300, "rating": 4.0 if reviews else 0.0, "total_reviews": reviews, "experience": 2,
+        "is_approved": True, "is_online": False, "created_at": f"2024-01-0{provider_id[-1]}T00:00:00+00:00",
+        **fields,
+    }
+
+
+async def seeded(*providers) -> FakeDatabase:
+    database = FakeDatabase()
+    await database.providers.insert_many([dict(p) for p in providers])
+    await database.users.insert_many([{"id": p["user_id"], "email": p["email"]} for p in providers])
+    return database
+
+
+def test_backfill_gives_legacy_providers_one_offering():
+    async def run():
+        database = await seeded(provider("p1"), provider("p2", offerings=[offering("painting", 800)]))
+        assert await offerings.backfill_offerings(database) == 1
+        assert await offerings.backfill_offerings(database) == 0
+        legacy = await database.providers.find_one({"id": "p1"})
+        assert legacy["offerings"] == [{
+            "sub_service_id": "plumbing", "sub_service_name": "Plumbing", "category_id": "home",
+            "price": 300, "duration_minutes": offerings.DEFAULT_DURATION_MINUTES,
+        }]
+        assert (await database.providers.find_one({"id": "p2"}))["offerings"] == [offering("painting", 800)]
+
+    asyncio.run(run())
+
+
+def test_fold_moves_everything_onto_the_best_reviewed_account():
+    async def run():
+        database = await seeded(
+            provider("p1", offerings=[offering("plumbing", 300)]),
+            provider("p2", name=" asha RAO ", reviews=4, offerings=[offering("painting", 800)]),
+        )
+        await database.bookings.insert_one({"id": "b1", "provider_id": "p1", "status": "pending"})
+        await database.reviews.insert_one({"id": "r1", "provider_id": "p1", "rating": 5})
+
+        result = await offerings.fold_providers(database, ["p1", "p2"])
+        assert result["provider_id"] == "p2"
+        assert result["offerings"] == ["painting", "plumbing"]
+        assert await database.providers.count_documents({}) == 1
+        assert (await database.bookings.find_one({"id": "b1"}))["provider_id"] == "p2"
+        assert (await database.reviews.find_one({"id": "r1"}))["provider_id"] == "p2"
+        assert (await database.users.find_one({"id": "u-p1"}))["merged_into_email"] == "p2@example.com"
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("other", [provider("p2", name="Asha Iyer"), provider("p2", city="Mumbai")])
+def test_fold_refuses_providers_of_different_people(other):
+    async def run():
+        database = await seeded(provider("p1"), other)
+        with pytest.raises(ValueError):
+            await offerings.fold_providers(database, ["p1", "p2"])
+        assert await database.providers.count_documents({}) == 2
+
+    asyncio.run(run())
+
+
+def test_fold_refuses_more_offerings_than_a_provider_may_have(monkeypatch):
+    monkeypatch.setattr(offerings, "MAX_OFFERINGS", 2)
+
+    async def run():
+        database = await seeded(
+            provider("p1", offerings=[offering("plumbing", 300), offering("painting", 800)]),
+            provider("p2", offerings=[offering("carpentry", 500)]),
+        )
+        with pytest.raises(ValueError):
+            await offerings.fold_providers(database, ["p1", "p2"])
+        assert (await database.providers.find_one({"id": "p1"}))["offerings"][-1]["sub_service_id"] == "painting"
+
+    asyncio.run(run())
+
+
+def test_listing_matches_sub_service_and_price_on_the_same_offering(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import server
+
+    async def seed():
+        return await seeded(
+            # Cheap plumbing, expensive painting: must not match cheap painting.
+            provider("p1", offerings=[offering("plumbing", 200), offering("painting", 900)]),
+            provider("p2", offerings=[offering("painting", 400)]),
+        )
+
+    monkeypatch.setattr(server, "read_db", asyncio.run(seed()))
+    client = TestClient(server.app)
+    response = client.get("/api/providers", params={"sub_service_id": "painting", "max_price": 500})
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == ["p2"]
@@ -0,0 +1,57 @@
+"""Keyset cursors for (sort field desc, id desc) listings.
+
+    python -m pytest tests/test_pagination.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pagination import after_cursor, decode_cursor, encode_cursor, page_of  # noqa: E402
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+
+def test_cursor_round_trips_without_padding():
+    cursor = encode_cursor("2026-10-19T10:00:00+00:00", "b-1")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("2026-10-19T10:00:00+00:00", "b-1")
+    assert decode_cursor(encode_cursor(450.5, "p-9")) == (450.5, "p-9")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", encode_cursor("x", "y")[:-3]])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        after_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_no_cursor_selects_everything():
+    assert after_cursor(None) == {}
+    assert after_cursor("") == {}
+
+
+def test_pages_cover_ties_on_the_sort_field_exactly_once():
+    async def run():
+        database = FakeDatabase()
+        # Three bookings share a timestamp, so the id breaks the tie.
+        stamps = ["2026-10-19T10:00:00", "2026-10-19T09:00:00", "2026-10-19T09:00:00", "2026-10-19T09:00:00",
+                  "2026-10-19T08:00:00"]
+        await database.bookings.insert_many([{"id": f"b{i}", "created_at": s} for i, s in enumerate(stamps)])
+        seen, cursor = [], None
+        while True:
+            docs = await database.bookings.find(after_cursor(cursor), {"_id": 0}).sort(
+                [("created_at", -1), ("id", -1)]
+            ).limit(3).to_list(3)
+            page = page_of(docs, 2)
+            seen += [d["id"] for d in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == ["b0", "b3", "b2", "b1", "b4"]
+
+    asyncio.run(run())
@@ -0,0 +1,275 @@
+"""Routing and aggregation merging of the city-partition layer.
+
+    python -m pytest tests/test_partitions.py
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from partitions import (  # noqa: E402
+    DEFAULT, PartitionedCollection, PartitionMoving, PartitionQueryError, PartitionRouter, _upsert_cities,
+    merge_results, split_pipeline
+)
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+
+def run_split(pipeline, partitions):
+    """What PartitionedAggregate does, with each partition's result given."""
+    shard, merge = split_pipeline(pipeline)
+    return shard, merge_results([doc for docs in partitions for doc in docs], merge)
+
+
+# ============ split_pipeline / merge_results ============
+
+def test_streaming_stages_run_in_partitions_only():
+    pipeline = [{"$match": {"status": "completed"}}, {"$project": {"id": 1}}]
+    shard, merge = split_pipeline(pipeline)
+    assert shard == pipeline
+    assert merge == []
+
+
+def test_group_is_merged_per_accumulator():
+    pipeline = [
+        {"$match": {"status": "completed"}},
+        {"$group": {
+            "_id": "$city",
+            "total": {"$sum": "$price"},
+            "cheapest": {"$min": "$price"},
+            "dearest": {"$max": "$price"},
+            "ids": {"$push": "$id"},
+            "services": {"$addToSet": "$sub_service_id"},
+        }},
+    ]
+    shard, merged = run_split(pipeline, [
+        [
+            {"_id": "Pune", "total": 10, "cheapest": 4, "dearest": 6, "ids": ["a", "b"], "services": ["s1"]},
+            {"_id": "Goa", "total": 5, "cheapest": 5, "dearest": 5, "ids": ["c"], "services": ["s2"]},
+        ],
+        [{"_id": "Pune", "total": 7, "cheapest": 2, "dearest": 5, "ids": ["d"], "services": ["s1", "s3"]}],
+    ])
+    assert shard == pipeline
+    by_city = {doc["_id"]: doc for doc in merged}
+    assert by_city["Pune"] == {
+        "_id": "Pune", "total": 17, "cheapest": 2, "dearest": 6, "ids": ["a", "b", "d"], "services": ["s1", "s3"]
+    }
+    assert by_city["Goa"]["total"] == 5
+
+
+def test_group_on_compound_id():
+    pipeline = [{"$group": {"_id": {"city": "$city", "status": "$status"}, "n": {"$sum": 1}}}]
+    _, merged = run_split(pipeline, [
+        [{"_id": {"city": "Pune", "status": "completed"}, "n": 2}],
+        [{"_id": {"city": "Pune", "status": "completed"}, "n": 3}, {"_id": {"city": "Pune", "status": "pending"}, "n": 1}],
+    ])
+    assert sorted((d["_id"]["status"], d["n"]) for d in merged) == [("completed", 5), ("pending", 1)]
+
+
+def test_group_with_unmergeable_accumulator_is_refused():
+    with pytest.raises(PartitionQueryError):
+        split_pipeline([{"$group": {"_id": "$city", "rating": {"$avg": "$rating"}}}])
+
+
+def test_sort_and_limit_are_pushed_down_and_reapplied():
+    pipeline = [{"$match": {"is_approved": True}}, {"$sort": {"rank_score": -1}}, {"$limit": 2}]
+    shard, merged = run_split(pipeline, [
+        [{"id": "a", "rank_score": 0.9}, {"id": "b", "rank_score": 0.5}],
+        [{"id": "c", "rank_score": 0.7}, {"id": "d", "rank_score": 0.6}],
+    ])
+    assert shard == pipeline
+    assert [d["id"] for d in merged] == ["a", "c"]
+
+
+def test_sort_puts_missing_fields_lowest():
+    _, merged = run_split([{"$sort": {"rank_score": -1, "id": 1}}], [
+        [{"id": "b"}, {"id": "a", "rank_score": 0.2}],
+        [{"id": "c", "rank_score": 0.2}],
+    ])
+    assert [d["id"] for d in merged] == ["a", "c", "b"]
+
+
+def test_skip_runs_only_after_the_merge():
+    pipeline = [{"$sort": {"n": 1}}, {"$skip": 2}, {"$limit": 2}]
+    shard, merged = run_split(pipeline, [
+        [{"n": 1}, {"n": 4}, {"n": 5}],
+        [{"n": 2}, {"n": 3}, {"n": 6}],
+    ])
+    # Skipping inside each partition would drop rows the merge needs.
+    assert shard == [{"$sort": {"n": 1}}]
+    assert [d["n"] for d in merged] == [3, 4]
+
+
+def test_count_is_summed():
+    _, merged = run_split([{"$match": {"status": "pending"}}, {"$count": "n"}], [[{"n": 3}], [], [{"n": 4}]])
+    assert merged == [{"n": 7}]
+
+
+def test_facet_merges_each_facet_on_its_own():
+    pipeline = [{"$facet": {
+        "items": [{"$sort": {"created_at": -1}}, {"$limit": 2}],
+        "total": [{"$count": "n"}],
+        "by_status": [{"$group": {"_id": "$status", "n": {"$sum": 1}}}],
+    }}]
+    shard, merged = run_split(pipeline, [
+        [{
+            "items": [{"id": "a", "created_at": "2024-03"}, {"id": "b", "created_at": "2024-01"}],
+            "total": [{"n": 2}],
+            "by_status": [{"_id": "completed", "n": 2}],
+        }],
+        [{
+            "items": [{"id": "c", "created_at": "2024-02"}],
+            "total": [{"n": 1}],
+            "by_status": [{"_id": "completed", "n": 1}],
+        }],
+    ])
+    assert shard == pipeline
+    assert len(merged) == 1
+    assert [d["id"] for d in merged[0]["items"]] == ["a", "c"]
+    assert merged[0]["total"] == [{"n": 3}]
+    assert merged[0]["by_status"] == [{"_id": "completed", "n": 3}]
+
+
+def test_stages_after_a_blocking_stage_run_in_python():
+    pipeline = [
+        {"$group": {"_id": "$city", "n": {"$sum": 1}}},
+        {"$sort": {"n": -1}},
+        {"$project": {"n": 1}},
+        {"$limit": 1},
+    ]
+    shard, merged = run_split(pipeline, [[{"_id": "Pune", "n": 1}, {"_id": "Goa", "n": 2}], [{"_id": "Pune", "n": 3}]])
+    assert shard == pipeline[:1]
+    assert merged == [{"_id": "Pune", "n": 4}]
+
+
+def test_limit_after_group_applies_to_merged_groups():
+    # "Pune" is in both partitions; a per-partition top 1 would rank it
+    # on half its bookings and pick "Goa" in the first partition.
+    pipeline = [
+        {"$match": {"status": "completed"}},
+        {"$group": {"_id": "$city", "revenue": {"$sum": "$price"}}},
+        {"$sort": {"revenue": -1}},
+        {"$limit": 1},
+    ]
+    shard, merged = run_split(pipeline, [
+        [{"_id": "Goa", "revenue": 80}, {"_id": "Pune", "revenue": 60}],
+        [{"_id": "Pune", "revenue": 50}, {"_id": "Surat", "revenue": 10}],
+    ])
+    assert shard == pipeline[:2]
+    assert merged == [{"_id": "Pune", "revenue": 110}]
+
+
+def test_unsupported_stage_is_refused():
+    with pytest.raises(PartitionQueryError):
+        split_pipeline([{"$bucket": {"groupBy": "$price", "boundaries": [0, 100]}}])
+    with pytest.raises(PartitionQueryError):
+        split_pipeline([{"$group": {"_id": "$city"}}, {"$addFields": {"x": 1}}])
+
+
+# ============ _upsert_cities ============
+
+@pytest.mark.parametrize("query, update, expected", [
+    ({"id": "b1", "city": "Pune"}, {"$set": {"status": "done"}}, ["Pune"]),
+    ({"id": "b1", "city": {"$in": ["Pune", "Goa"]}}, {"$set": {"status": "done"}}, ["Pune", "Goa"]),
+    ({"id": "b1"}, {"$set": {"city": "Pune"}}, ["Pune"]),
+    ({"id": "b1"}, {"$setOnInsert": {"city": "Goa"}}, ["Goa"]),
+    ({"id": "b1"}, {"id": "b1", "city": "Pune"}, ["Pune"]),
+    ({"id": "b1"}, {"$inc": {"n": 1}}, None),
+    ({"id": "b1", "city": {"$ne": "Pune"}}, {"$set": {"n": 1}}, None),
+    ({"id": "b1"}, [{"$set": {"city": "Pune"}}], None),
+])
+def test_upsert_cities(query, update, expected):
+    assert _upsert_cities(query, update) == expected
+
+
+# ============ PartitionRouter.route ============
+
+def router(city_map):
+    r = PartitionRouter()
+    for name in (DEFAULT, "west", "metro"):
+        r.add(name, primary=None, secondary=None, analytics=None)
+    r._map = {city: {"_id": city, **entry} for city, entry in city_map.items()}
+    r._loaded_at = time.monotonic() + 3600
+    return r
+
+
+def route(r, query, write=False):
+    return asyncio.run(r.route("bookings", query, write=write))
+
+
+def test_route_single_city():
+    r = router({"Pune": {"partition": "west"}})
+    assert route(r, {"city": "Pune", "status": "pending"}) == {"west": {"city": "Pune", "status": "pending"}}
+    assert route(r, {"city": {"$eq": "Pune"}}) == {"west": {"city": {"$eq": "Pune"}}}
+
+
+def test_route_unmapped_city_goes_to_default():
+    assert route(router({}), {"city": "Goa"}) == {DEFAULT: {"city": "Goa"}}
+
+
+def test_route_splits_city_list_by_partition():
+    r = router({"Pune": {"partition": "west"}, "Surat": {"partition": "west"}, "Mumbai": {"partition": "metro"}})
+    routes = route(r, {"status": "pending", "city": {"$in": ["Pune", "Mumbai", "Surat", "Goa"]}})
+    assert routes == {
+        "west": {"status": "pending", "city": {"$in": ["Pune", "Surat"]}},
+        "metro": {"status": "pending", "city": {"$in": ["Mumbai"]}},
+        DEFAULT: {"status": "pending", "city": {"$in": ["Goa"]}},
+    }
+
+
+def test_route_without_city_fans_out():
+    routes = route(router({"Pune": {"partition": "west"}}), {"status": "pending"})
+    assert routes == {name: {"status": "pending"} for name in (DEFAULT, "west", "metro")}
+
+
+def test_route_fan_out_skips_cities_mid_move():
+    r = router({
+        "Pune": {"partition": "west", "moving_to": "metro", "state": "copying"},
+        "Goa": {"partition": "metro", "moved_from": DEFAULT, "state": "cleaning"},
+    })
+    routes = route(r, {"status": "pending"})
+    assert routes["west"] == {"status": "pending"}
+    assert routes["metro"] == {"$and": [{"status": "pending"}, {"city": {"$nin": ["Pune"]}}]}
+    assert routes[DEFAULT] == {"$and": [{"status": "pending"}, {"city": {"$nin": ["Goa"]}}]}
+    assert route(r, None)[DEFAULT] == {"city": {"$nin": ["Goa"]}}
+
+
+def test_route_write_to_frozen_city_is_refused():
+    r = router({"Pune": {"partition": "west", "moving_to": "metro", "state": "frozen"}})
+    assert route(r, {"city": "Pune"}) == {"west": {"city": "Pune"}}
+    with pytest.raises(PartitionMoving) as exc:
+        route(r, {"city": {"$in": ["Goa", "Pune"]}}, write=True)
+    assert exc.value.city == "Pune"
+
+
+def test_route_to_unconfigured_partition_fails():
+    with pytest.raises(RuntimeError):
+        route(router({"Pune": {"partition": "east"}}), {"city": "Pune"})
+
+
+# ============ PartitionedCollection writes ============
+
+def test_upsert_without_one_city_is_refused():
+    r = router({})
+    for name in r.handles:
+        r.handles[name]["primary"] = FakeDatabase(name)
+    bookings = PartitionedCollection(r, "bookings", "primary")
+
+    async def run():
+        with pytest.raises(PartitionQueryError):
+            await bookings.update_one({"id": "b1"}, {"$set": {"status": "done"}}, upsert=True)
+        with pytest.raises(PartitionQueryError):
+            await bookings.find_one_and_update({"id": "b1", "city": "Pune"}, {"$set": {"n": 1}}, upsert=True)
+        await bookings.update_one({"id": "b1"}, {"$set": {"city": "Pune", "status": "done"}}, upsert=True)
+        assert await r.handles[DEFAULT]["primary"].bookings.count_documents({"id": "b1"}) == 1
+
+    asyncio.run(run())
+
+
+def test_partition_query_error_is_a_value_error():
+    # Endpoints already turn ValueError into a 400.
+    assert issubclass(PartitionQueryError, ValueError)
@@ -0,0 +1,39 @@
+"""Worker startup and shutdown.
+
+    python -m pytest tests/test_startup.py
+"""
+import asyncio
+import os
+import signal
+import sys
+from pathlib import Path
+
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "test")
+
+import serve  # noqa: E402
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+
+def test_one_worker_claims_startup_maintenance(monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "db", FakeDatabase())
+
+    async def run():
+        claims = await asyncio.gather(*(server.claim_startup_maintenance() for _ in range(4)))
+        assert sorted(claims) == [False, False, False, True]
+
+    asyncio.run(run())
+
+
+def test_sigterm_before_the_app_is_imported_exits_normally(monkeypatch):
+    monkeypatch.delitem(sys.modules, "server", raising=False)
+    server = serve.DrainingServer(config=uvicorn.Config("server:app"))
+    server.handle_exit(signal.SIGTERM, None)
+    assert server.should_exit
+    assert not server.draining